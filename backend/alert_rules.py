@@ -0,0 +1,117 @@
+"""
+预警规则引擎
+
+规则针对某个策略的结果字段设置条件（同一规则的多个条件同时满足才算命中），例如：
+- ma_crossover 的 signal 变为 buy
+- breakout 的 signal 为 buy 且 volume_ratio > 2
+规则按依赖的策略建立索引：新K线写入后，只计算该股票被规则引用的策略，只检查相关规则。
+条件从不满足变为满足时触发（边沿触发），持续满足不会重复触发；
+规则第一次在某只股票上求值时只记录状态，不触发
+"""
+import operator
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+OPERATORS = {
+    "eq": operator.eq,
+    "ne": operator.ne,
+    "gt": operator.gt,
+    "gte": operator.ge,
+    "lt": operator.lt,
+    "lte": operator.le,
+}
+
+
+def validate_conditions(conditions: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """校验条件列表 [{"field", "op", "value"}]，返回规范化后的条件，不合法时抛出 ValueError"""
+    normalized = []
+    for condition in conditions or []:
+        field = str(condition.get("field") or "").strip()
+        op = condition.get("op", "eq")
+        if not field:
+            raise ValueError("条件缺少 field")
+        if op not in OPERATORS:
+            raise ValueError(f"不支持的比较运算: {op}，可选: {', '.join(OPERATORS)}")
+        if "value" not in condition:
+            raise ValueError(f"条件 {field} 缺少 value")
+        normalized.append({"field": field, "op": op, "value": condition["value"]})
+    if not normalized:
+        raise ValueError("至少需要一个条件")
+    return normalized
+
+
+def matches(conditions: List[Dict[str, Any]], result: Dict[str, Any]) -> bool:
+    """策略结果是否满足全部条件；字段缺失或类型无法比较时视为不满足"""
+    for condition in conditions:
+        actual = result.get(condition["field"])
+        if actual is None:
+            return False
+        try:
+            if not OPERATORS[condition["op"]](actual, condition["value"]):
+                return False
+        except TypeError:
+            return False
+    return True
+
+
+class AlertEngine:
+    """
+    规则索引与求值
+    load_rules() 返回 (规则版本, [{"id", "stock_code"（None 表示全部股票）, "strategy", "conditions", "name"}])
+    """
+
+    def __init__(self, load_rules: Callable[[], Tuple[Any, List[Dict[str, Any]]]]):
+        self.load_rules = load_rules
+        self.version = None
+        # 股票代码（None 为通配）-> 策略 -> 规则列表
+        self._index: Dict[Optional[str], Dict[str, List[Dict[str, Any]]]] = {}
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """规则版本变化时重建索引"""
+        version, rules = self.load_rules()
+        if version == self.version:
+            return
+        index: Dict[Optional[str], Dict[str, List[Dict[str, Any]]]] = {}
+        for rule in rules:
+            index.setdefault(rule["stock_code"], {}).setdefault(rule["strategy"], []).append(rule)
+        with self._lock:
+            self._index = index
+            self.version = version
+
+    def has_wildcard_rules(self) -> bool:
+        return None in self._index
+
+    def stocks_with_rules(self) -> List[str]:
+        return [code for code in self._index if code is not None]
+
+    def strategies_for(self, stock_code: str) -> List[str]:
+        """该股票需要计算的策略（被针对它或通配的规则引用）"""
+        with self._lock:
+            strategies = set(self._index.get(stock_code, {})) | set(self._index.get(None, {}))
+        return sorted(strategies)
+
+    def evaluate(self, stock_code: str, results: Dict[str, Dict[str, Any]],
+                 previous: Dict[int, bool]) -> Tuple[Dict[int, bool], List[Dict[str, Any]]]:
+        """
+        用策略结果检查相关规则
+        previous 为各规则在该股票上的上次状态（未求值过的规则不在其中）
+        返回 (状态有变化的规则 -> 当前是否命中, 触发的规则列表)
+        """
+        with self._lock:
+            by_strategy = [self._index.get(stock_code, {}), self._index.get(None, {})]
+        changed: Dict[int, bool] = {}
+        fired: List[Dict[str, Any]] = []
+        for rules_by_strategy in by_strategy:
+            for strategy, rules in rules_by_strategy.items():
+                result = results.get(strategy)
+                if not isinstance(result, dict):
+                    continue
+                for rule in rules:
+                    matched = matches(rule["conditions"], result)
+                    was = previous.get(rule["id"])
+                    if was is None or was != matched:
+                        changed[rule["id"]] = matched
+                    if matched and was is False:
+                        fired.append(rule)
+        return changed, fired
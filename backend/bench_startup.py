@@ -0,0 +1,88 @@
+"""
+启动耗时基准
+
+在全新的解释器中测量：
+1. import main 的耗时，以及导入后是否已加载重量级依赖（应为否）
+2. 启动 uvicorn 到 /health 可响应的耗时
+3. 首次使用时导入 pandas、akshare 的耗时（预热或首个分析请求承担）
+超过预算时以非零状态退出，预算可用环境变量覆盖（毫秒）
+"""
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from script_checks import check, finish
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+IMPORT_BUDGET_MS = float(os.environ.get("IMPORT_BUDGET_MS", "1500"))
+HEALTH_BUDGET_MS = float(os.environ.get("HEALTH_BUDGET_MS", "3000"))
+HEAVY_MODULES = ("pandas", "akshare", "sklearn")
+
+
+def run_python(code, env=None):
+    output = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+print("Benchmarking backend cold start...")
+db_dir = tempfile.mkdtemp()
+env = {**os.environ, "STOCKS_DB_PATH": os.path.join(db_dir, "bench.db"), "PREWARM_ON_STARTUP": "0"}
+
+# 1. import main
+result = run_python(
+    "import json, sys, time\n"
+    "started = time.perf_counter()\n"
+    "import main\n"
+    "elapsed = (time.perf_counter() - started) * 1000\n"
+    f"print(json.dumps({{'ms': elapsed, 'loaded': [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))",
+    env,
+)
+check(f"1. import main {result['ms']:.0f}ms (budget {IMPORT_BUDGET_MS:.0f}ms)", result["ms"] <= IMPORT_BUDGET_MS)
+check("   heavy modules not imported at startup", not result["loaded"], f"loaded: {result['loaded']}")
+
+# 2. 进程启动到 /health 可响应
+port = free_port()
+started = time.perf_counter()
+server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+                          cwd=BACKEND_DIR, env=env)
+health = None
+try:
+    while time.perf_counter() - started < 60:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+                health = json.loads(response.read())
+                break
+        except OSError:
+            time.sleep(0.02)
+    elapsed = (time.perf_counter() - started) * 1000
+finally:
+    server.terminate()
+    server.wait()
+check(f"2. process start to /health {elapsed:.0f}ms (budget {HEALTH_BUDGET_MS:.0f}ms)",
+      health is not None and elapsed <= HEALTH_BUDGET_MS)
+
+# 3. 首次使用时的导入耗时（仅报告）
+for module, attribute in (("pandas", "pd.DataFrame"), ("akshare", "ak.stock_zh_a_hist")):
+    result = run_python(
+        "import json, time\n"
+        "import main\n"
+        "started = time.perf_counter()\n"
+        f"main.{attribute}\n"
+        "print(json.dumps({'ms': (time.perf_counter() - started) * 1000}))",
+        env,
+    )
+    print(f"   first use of {module}: {result['ms']:.0f}ms")
+
+finish("Benchmark")
@@ -0,0 +1,193 @@
+"""
+缓存维护
+
+由后台任务定期执行，保证长期运行的节点磁盘占用有上限：
+- 批量写回缓存的访问时间（读缓存时只记在内存里，不在请求路径上写库）
+- 删除过期超过保留期的缓存，并按行数 / 字节预算以 LRU 顺序淘汰
+- 增量回收空闲页（incremental vacuum）并截断 WAL 文件
+- 汇总各表的行数、数据量供监控接口展示
+"""
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional
+
+
+class AccessTracker:
+    """
+    记录缓存的最近访问时间，由维护任务批量写回 accessed_at 列
+    每个 worker 进程各自持有一份，写回时只覆盖更晚的访问时间
+    """
+
+    def __init__(self):
+        self._pending: Dict[str, Dict[str, str]] = {}
+        self._lock = threading.Lock()
+
+    def touch(self, table: str, key: str):
+        now = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        with self._lock:
+            self._pending.setdefault(table, {})[key] = now
+
+    def flush(self, conn, key_columns: Dict[str, str]) -> int:
+        """写回访问时间，返回更新的条目数"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        count = 0
+        for table, touches in pending.items():
+            key_column = key_columns[table]
+            conn.executemany(
+                f'UPDATE {table} SET accessed_at = ? WHERE {key_column} = ? '
+                f'AND (accessed_at IS NULL OR accessed_at < ?)',
+                [(accessed_at, key, accessed_at) for key, accessed_at in touches.items()]
+            )
+            count += len(touches)
+        conn.commit()
+        return count
+
+
+class CacheMaintenance:
+    """
+    按表配置执行淘汰和压缩
+    tables: 表名 -> {
+        "key": 访问时间对应的键列（可选，配合 AccessTracker）,
+        "size": 单行数据量的 SQL 表达式,
+        "order": LRU 排序的 SQL 表达式（越小越先淘汰）,
+        "expired": 可直接删除的行的 WHERE 条件（可选）,
+        "evictable": 允许按预算淘汰的行的 WHERE 条件（可选，缺省为全部行）,
+        "max_rows": 行数上限（可选）,
+        "max_bytes": 数据量上限（可选）,
+    }
+    """
+
+    def __init__(self, connect: Callable[[], Any], tables: Dict[str, Dict[str, Any]], db_path: str,
+                 tracker: Optional[AccessTracker] = None, vacuum_pages: int = 2000):
+        self.connect = connect
+        self.tables = tables
+        self.db_path = db_path
+        self.tracker = tracker or AccessTracker()
+        self.vacuum_pages = vacuum_pages
+        self.last_run: Optional[Dict[str, Any]] = None
+
+    def flush_access(self) -> int:
+        """写回当前进程记录的访问时间"""
+        conn = self.connect()
+        try:
+            key_columns = {table: spec["key"] for table, spec in self.tables.items() if spec.get("key")}
+            return self.tracker.flush(conn, key_columns)
+        finally:
+            conn.close()
+
+    def delete_expired(self) -> Dict[str, int]:
+        """删除各表中满足过期条件的行，返回各表删除的行数"""
+        conn = self.connect()
+        try:
+            deleted = {}
+            for table, spec in self.tables.items():
+                if spec.get("expired"):
+                    deleted[table] = conn.execute(f'DELETE FROM {table} WHERE {spec["expired"]}').rowcount
+            conn.commit()
+            return deleted
+        finally:
+            conn.close()
+
+    def run(self) -> Dict[str, Any]:
+        """执行一轮维护，返回各步骤的结果"""
+        started = time.monotonic()
+        result: Dict[str, Any] = {"touched": self.flush_access(), "expired": self.delete_expired(), "evicted": {}}
+        conn = self.connect()
+        try:
+            for table, spec in self.tables.items():
+                result["evicted"][table] = self._enforce_budget(conn, table, spec)
+                conn.commit()
+            result["vacuum"] = self._incremental_vacuum(conn)
+            result["checkpoint"] = self._checkpoint(conn)
+        finally:
+            conn.close()
+        result["finished_at"] = datetime.now(timezone.utc).isoformat()
+        result["duration_ms"] = round((time.monotonic() - started) * 1000, 1)
+        self.last_run = result
+        return result
+
+    def _enforce_budget(self, conn, table: str, spec: Dict[str, Any]) -> int:
+        """超出行数或数据量预算时，按 LRU 顺序删除最久未访问的行"""
+        evictable = spec.get("evictable") or "1"
+        size, order = spec["size"], spec["order"]
+        evicted = 0
+        max_rows = spec.get("max_rows")
+        if max_rows is not None:
+            rows = conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+            if rows > max_rows:
+                evicted += conn.execute(f'''
+                DELETE FROM {table} WHERE rowid IN (
+                    SELECT rowid FROM {table} WHERE {evictable} ORDER BY {order}, rowid LIMIT ?
+                )''', (rows - max_rows,)).rowcount
+        max_bytes = spec.get("max_bytes")
+        if max_bytes is not None:
+            total = conn.execute(f'SELECT COALESCE(SUM({size}), 0) FROM {table}').fetchone()[0]
+            if total > max_bytes:
+                # 按 LRU 顺序累加数据量，删除累计到超出部分为止的行
+                evicted += conn.execute(f'''
+                DELETE FROM {table} WHERE rowid IN (
+                    SELECT rowid FROM (
+                        SELECT rowid, {size} AS bytes, SUM({size}) OVER (ORDER BY {order}, rowid) AS running
+                        FROM {table} WHERE {evictable}
+                    ) WHERE running - bytes < ?
+                )''', (total - max_bytes,)).rowcount
+        return evicted
+
+    def _incremental_vacuum(self, conn) -> Dict[str, Any]:
+        """
+        回收空闲页；数据库未开启 incremental 模式时跳过（转换需要完整 VACUUM，由建库时完成，
+        不在后台维护中执行）
+        """
+        before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            return {"incremental": False, "released_pages": 0, "freelist_pages": before}
+        conn.execute(f'PRAGMA incremental_vacuum({int(self.vacuum_pages)})').fetchall()
+        after = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        return {"incremental": True, "released_pages": before - after, "freelist_pages": after}
+
+    def _checkpoint(self, conn) -> Dict[str, int]:
+        """把 WAL 写回主库并截断 WAL 文件（有读者占用时本轮只部分完成）"""
+        busy, log_frames, checkpointed = conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+        return {"busy": busy, "log_frames": log_frames, "checkpointed": checkpointed}
+
+    def stats(self) -> Dict[str, Any]:
+        """各表行数、数据量与预算，以及数据库文件占用"""
+        conn = self.connect()
+        try:
+            tables = {}
+            for table, spec in self.tables.items():
+                rows, size = conn.execute(f'SELECT COUNT(*), COALESCE(SUM({spec["size"]}), 0) FROM {table}').fetchone()
+                tables[table] = {
+                    "rows": rows,
+                    "bytes": size,
+                    "max_rows": spec.get("max_rows"),
+                    "max_bytes": spec.get("max_bytes"),
+                }
+            page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+            page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+            freelist = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            auto_vacuum = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+        finally:
+            conn.close()
+        return {
+            "tables": tables,
+            "database": {
+                "file_bytes": _file_size(self.db_path),
+                "wal_bytes": _file_size(self.db_path + '-wal'),
+                "page_size": page_size,
+                "page_count": page_count,
+                "freelist_pages": freelist,
+                "auto_vacuum": {0: "none", 1: "full", 2: "incremental"}.get(auto_vacuum, auto_vacuum),
+            },
+            "last_maintenance": self.last_run,
+        }
+
+
+def _file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
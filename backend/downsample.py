@@ -0,0 +1,147 @@
+"""
+K线图降采样
+
+长周期日线的点数远超图表的像素宽度，按 max_points 在服务端降采样后再返回：
+- ohlc：按连续的等长区间聚合（开盘取首根、收盘取末根、最高 / 最低取极值、成交量求和），保留价格区间
+- lttb：Largest-Triangle-Three-Buckets，按收盘价选出最能保留走势形状的原始K线
+两种方式都只做 NumPy 数组运算（LTTB 每个区间一次向量运算）；返回每根原始K线对应的输出下标，
+用于把信号时间线等按原始下标记录的数据映射到降采样后的K线
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+DOWNSAMPLE_METHODS = ("ohlc", "lttb")
+# 只在发生当天有效的信号，降采样时优先保留
+EVENT_SIGNALS = ("buy", "sell")
+
+
+def bucket_starts(n: int, max_points: int) -> np.ndarray:
+    """把 n 个点分成 max_points 个连续区间，返回各区间的起始下标"""
+    return (np.arange(max_points) * n) // max_points
+
+
+def ohlc_aggregate(opens, closes, lows, highs, volumes, max_points: int):
+    """
+    按区间聚合 OHLC 和成交量
+    返回 (各区间最后一根K线的下标, 开盘, 收盘, 最低, 最高, 成交量)
+    """
+    n = len(closes)
+    starts = bucket_starts(n, max_points)
+    ends = np.append(starts[1:], n) - 1
+    return (
+        ends,
+        np.asarray(opens, dtype=float)[starts],
+        np.asarray(closes, dtype=float)[ends],
+        np.minimum.reduceat(np.asarray(lows, dtype=float), starts),
+        np.maximum.reduceat(np.asarray(highs, dtype=float), starts),
+        np.add.reduceat(np.asarray(volumes, dtype=float), starts),
+    )
+
+
+def lttb_indices(values, max_points: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets：返回选中点的下标（含首尾两点），横坐标为K线序号"""
+    y = np.asarray(values, dtype=float)
+    n = len(y)
+    if max_points >= n:
+        return np.arange(n)
+    if max_points < 3:
+        raise ValueError("LTTB 降采样至少保留 3 个点")
+    x = np.arange(n, dtype=float)
+    # 首尾两点固定，中间 n-2 个点分成 max_points-2 个区间
+    edges = 1 + bucket_starts(n - 2, max_points - 2)
+    edges = np.append(edges, n - 1)
+    # 各区间的均值点，作为下一区间的参照点
+    mean_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / np.diff(edges)
+    mean_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / np.diff(edges)
+    mean_x = np.append(mean_x, x[-1])
+    mean_y = np.append(mean_y, y[-1])
+
+    selected = np.empty(max_points, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for bucket in range(max_points - 2):
+        lo, hi = edges[bucket], edges[bucket + 1]
+        cx, cy = mean_x[bucket + 1], mean_y[bucket + 1]
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[bucket + 1] = a
+    return selected
+
+
+def downsample_chart(k_line_data: List[list], volume_data: List[list], max_points: int,
+                     method: str = "ohlc") -> Tuple[List[list], List[list], Optional[np.ndarray]]:
+    """
+    对 k_line_data（[日期, 开盘, 收盘, 最低, 最高]）和 volume_data（[日期, 成交量]）降采样
+    返回 (k_line_data, volume_data, 原始下标 -> 输出下标)；点数不超过 max_points 时原样返回，映射为 None
+    """
+    if method not in DOWNSAMPLE_METHODS:
+        raise ValueError(f"降采样方式只支持: {', '.join(DOWNSAMPLE_METHODS)}")
+    n = len(k_line_data)
+    if not max_points or max_points <= 0 or n <= max_points:
+        return k_line_data, volume_data, None
+    bars = np.array([row[1:5] for row in k_line_data], dtype=float)
+    volumes = np.array([row[1] for row in volume_data], dtype=float)
+    dates = [row[0] for row in k_line_data]
+
+    if method == "ohlc":
+        ends, opens, closes, lows, highs, volume_sums = ohlc_aggregate(
+            bars[:, 0], bars[:, 1], bars[:, 2], bars[:, 3], volumes, max_points)
+        k_line = [[dates[i], o, c, l, h] for i, o, c, l, h in
+                  zip(ends.tolist(), opens.tolist(), closes.tolist(), lows.tolist(), highs.tolist())]
+        volume = [[dates[i], v] for i, v in zip(ends.tolist(), volume_sums.tolist())]
+        positions = np.repeat(np.arange(max_points), np.diff(np.append(bucket_starts(n, max_points), n)))
+    else:
+        selected = lttb_indices(bars[:, 1], max_points)
+        k_line = [k_line_data[i] for i in selected.tolist()]
+        volume = [volume_data[i] for i in selected.tolist()]
+        positions = np.maximum(np.searchsorted(selected, np.arange(n), side='right') - 1, 0)
+    return k_line, volume, positions
+
+
+def remap_history(history: Dict[str, list], positions: np.ndarray) -> Dict[str, list]:
+    """
+    把信号时间线（index 为原始K线下标）映射到降采样后的下标
+    同一输出点上有多次变化时优先保留其中最后一次 buy / sell（买卖信号通常只持续一天，取最后一次会被随后的 hold 覆盖），
+    该点之后的实际信号在下一个输出点补上；与前一个变化点信号相同的不再保留
+    """
+    changes: "OrderedDict[int, list]" = OrderedDict()
+    for index, signal in zip(history.get("index", []), history.get("signal", [])):
+        if 0 <= index < len(positions):
+            changes.setdefault(int(positions[index]), []).append(signal)
+    remapped: Dict[int, Any] = {}
+    for position, signals in changes.items():
+        events = [signal for signal in signals if signal in EVENT_SIGNALS]
+        remapped[position] = events[-1] if events else signals[-1]
+        if remapped[position] != signals[-1] and position + 1 not in changes and position + 1 <= positions[-1]:
+            remapped[position + 1] = signals[-1]
+    indexes, signals = [], []
+    for index in sorted(remapped):
+        if not signals or signals[-1] != remapped[index]:
+            indexes.append(index)
+            signals.append(remapped[index])
+    return {**history, "index": indexes, "signal": signals}
+
+
+class ResolutionCache:
+    """降采样结果缓存，键为 (股票代码, 数据版本, 复权方式, max_points, 方式)，LRU 淘汰"""
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key: tuple, compute):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        value = compute()
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
@@ -0,0 +1,74 @@
+"""
+错误日志缓冲
+
+请求路径上只把错误记入内存，由后台任务定期批量写库：
+- 同一 (股票, 错误类型) 在一个刷新周期内合并为一条，记录出现次数和最后一条错误信息
+- 每个周期最多新增 max_entries 条，超出部分只计数，写入一条 error_log_overflow 汇总
+上游接口整体故障时，大量失败请求不会变成对 SQLite 写锁的争用
+"""
+import threading
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+OVERFLOW_ERROR_TYPE = "error_log_overflow"
+
+
+class ErrorBuffer:
+    """
+    write_batch(rows) 批量写入，rows 为
+    (stock_code, error_type, error_message, occurrences, first_seen, last_seen) 列表
+    """
+
+    def __init__(self, write_batch: Callable[[List[Tuple]], None], max_entries: int = 200,
+                 max_message_length: int = 500):
+        self.write_batch = write_batch
+        self.max_entries = max_entries
+        self.max_message_length = max_message_length
+        self._pending: Dict[Tuple[Optional[str], str], list] = {}
+        self._dropped = 0
+        self._lock = threading.Lock()
+        # 写库串行执行，保证同一条目按时间顺序落盘
+        self._write_lock = threading.Lock()
+
+    def record(self, stock_code: Optional[str], error_type: str, error_message: str):
+        now = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        message = str(error_message)[:self.max_message_length]
+        key = (stock_code, error_type)
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry is not None:
+                entry[0] = message
+                entry[1] += 1
+                entry[3] = now
+            elif len(self._pending) < self.max_entries:
+                self._pending[key] = [message, 1, now, now]
+            else:
+                self._dropped += 1
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending) + (1 if self._dropped else 0)
+
+    def flush(self) -> int:
+        """写入当前缓冲的错误，返回写入的条数；写入失败时丢弃本批，避免日志影响主要功能"""
+        with self._write_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                dropped, self._dropped = self._dropped, 0
+            rows = [
+                (stock_code, error_type, message, occurrences, first_seen, last_seen)
+                for (stock_code, error_type), (message, occurrences, first_seen, last_seen) in pending.items()
+            ]
+            if dropped:
+                now = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+                rows.append((None, OVERFLOW_ERROR_TYPE,
+                             f"超出每批 {self.max_entries} 条上限，未单独记录的错误 {dropped} 次",
+                             dropped, now, now))
+            if not rows:
+                return 0
+            try:
+                self.write_batch(rows)
+            except Exception as e:
+                print(f"写入错误日志失败: {e}")
+                return 0
+            return len(rows)
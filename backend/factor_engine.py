@@ -0,0 +1,202 @@
+"""
+多因子评分引擎
+
+输入 (股票 × 因子) 矩阵，用 NumPy 向量化执行与单只股票策略完全相同的评分规则：
+- 价值因子：PE、PB、股息率、ROE、资产负债率的线性评分
+- 财务健康：资产负债率、ROE、增长、市值的分档评分
+传入行业百分位时，PE、PB、ROE、资产负债率改为按行业内百分位计分（行业样本不足的股票仍用绝对阈值）
+权重表示各因子满分，可按需调整；使用默认权重时结果与逐只计算一致
+"""
+from __future__ import annotations
+
+from typing import Dict, Optional
+
+import numpy as np
+
+from lazy_import import LazyModule
+
+pd = LazyModule("pandas")
+
+# 价值因子满分（合计 100）
+VALUE_FACTOR_WEIGHTS = {"pe": 25, "pb": 20, "dividend": 15, "roe": 25, "debt": 15}
+# 财务健康满分（合计 100）
+HEALTH_FACTOR_WEIGHTS = {"debt": 30, "roe": 25, "growth": 25, "size": 20}
+
+# 评级阈值（按满分 100 给出，权重调整后等比例缩放）
+VALUE_LEVELS = [(85, "buy", "excellent"), (70, "buy", "good"), (50, "hold", "fair"), (30, "sell", "poor")]
+HEALTH_LEVELS = [(80, "buy", "excellent"), (65, "buy", "good"), (50, "hold", "fair"), (30, "sell", "poor")]
+
+# 可按行业百分位计分的因子：因子名 -> (百分位列名, 是否越低越好)
+VALUE_RELATIVE_FACTORS = {"pe": ("pe_ratio", True), "pb": ("pb_ratio", True), "roe": ("roe", False), "debt": ("debt_ratio", True)}
+HEALTH_RELATIVE_FACTORS = {"debt": ("debt_ratio", True), "roe": ("roe", False)}
+
+
+def _column(factors: pd.DataFrame, name: str) -> np.ndarray:
+    if name not in factors:
+        return np.full(len(factors), np.nan)
+    return pd.to_numeric(factors[name], errors="coerce").to_numpy(dtype=float)
+
+
+def _merge_weights(defaults: Dict[str, float], weights: Optional[Dict[str, float]]) -> Dict[str, float]:
+    merged = dict(defaults)
+    for name, weight in (weights or {}).items():
+        if name not in defaults:
+            raise ValueError(f"未知因子: {name}")
+        merged[name] = weight
+    return merged
+
+
+def _ladder(values: np.ndarray, conditions, points, weight: float, full_points: float) -> np.ndarray:
+    """分档评分；权重与默认满分相同时保持整数分值"""
+    if weight == full_points:
+        return np.select(conditions, points, default=0)
+    scale = weight / full_points
+    return np.select(conditions, [p * scale for p in points], default=0.0)
+
+
+def _relative(scores: Dict[str, np.ndarray], w: Dict[str, float], factors: pd.DataFrame,
+              percentiles: Optional[pd.DataFrame], relative_factors) -> np.ndarray:
+    """
+    有行业百分位的因子改为按百分位计分（越好的一端得分越高，满分为该因子权重），就地替换 scores 中的分值
+    返回每只股票是否至少有一个因子按行业百分位计分
+    """
+    used = np.zeros(len(factors), dtype=bool)
+    if percentiles is None:
+        return used
+    aligned = percentiles.reindex(factors.index)
+    for name, (metric, lower_is_better) in relative_factors.items():
+        if metric not in aligned:
+            continue
+        pct = pd.to_numeric(aligned[metric], errors="coerce").to_numpy(dtype=float)
+        available = ~np.isnan(pct)
+        relative = w[name] * ((1 - pct) if lower_is_better else pct)
+        scores[name] = np.where(available, relative, scores[name])
+        used |= available
+    return used
+
+
+def _grade(total: np.ndarray, levels, weight_sum: float):
+    """按阈值划分信号和评级"""
+    scale = weight_sum / 100
+    conditions = [total >= threshold * scale for threshold, _, _ in levels]
+    signals = np.select(conditions, [signal for _, signal, _ in levels], default="sell")
+    grades = np.select(conditions, [grade for _, _, grade in levels], default="very_poor")
+    return signals, grades
+
+
+def score_value_factors(factors: pd.DataFrame, weights: Optional[Dict[str, float]] = None,
+                        percentiles: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """
+    价值因子评分
+    factors 需包含 pe_ratio、pb_ratio、dividend_yield、roe、debt_ratio 列
+    percentiles 为与 factors 同索引的行业百分位（pe_ratio、pb_ratio、roe、debt_ratio 列，NaN 表示不可用）
+    """
+    w = _merge_weights(VALUE_FACTOR_WEIGHTS, weights)
+    pe = _column(factors, "pe_ratio")
+    pb = _column(factors, "pb_ratio")
+    dividend = _column(factors, "dividend_yield")
+    roe = _column(factors, "roe")
+    debt = _column(factors, "debt_ratio")
+
+    with np.errstate(invalid="ignore"):
+        # PE评分：低 PE 更好
+        pe_score = np.where(pe > 0, np.clip((50 - pe) / 50 * w["pe"], 0, w["pe"]), 0)
+        # PB评分：低 PB 更好
+        pb_score = np.where(pb > 0, np.clip((10 - pb) / 10 * w["pb"], 0, w["pb"]), 0)
+        # 股息率评分：高股息率更好
+        dividend_score = np.where(dividend >= 0, np.minimum(w["dividend"], dividend / 8 * w["dividend"]), 0)
+        # ROE评分：高ROE更好
+        roe_score = np.where(roe > 0, np.minimum(w["roe"], roe / 25 * w["roe"]), 0)
+        # 资产负债率评分：低负债率更好
+        debt_score = np.where(debt >= 0, np.clip((100 - debt) / 100 * w["debt"], 0, w["debt"]), 0)
+
+    scores = {"pe": pe_score, "pb": pb_score, "roe": roe_score, "debt": debt_score}
+    industry_relative = _relative(scores, w, factors, percentiles, VALUE_RELATIVE_FACTORS)
+    pe_score, pb_score, roe_score, debt_score = scores["pe"], scores["pb"], scores["roe"], scores["debt"]
+
+    total_score = pe_score + pb_score + dividend_score + roe_score + debt_score
+    signal, value_level = _grade(total_score, VALUE_LEVELS, sum(w.values()))
+    return pd.DataFrame({
+        "pe_score": pe_score,
+        "pb_score": pb_score,
+        "dividend_score": dividend_score,
+        "roe_score": roe_score,
+        "debt_score": debt_score,
+        "total_score": total_score,
+        "signal": signal,
+        "value_level": value_level,
+        "industry_relative": industry_relative,
+    }, index=factors.index)
+
+
+def score_financial_health(factors: pd.DataFrame, weights: Optional[Dict[str, float]] = None,
+                           percentiles: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """
+    财务健康评分
+    factors 需包含 debt_ratio、roe、revenue_growth、semi_annual_growth、market_cap 列
+    percentiles 同 score_value_factors，资产负债率、ROE 有行业百分位时按百分位计分
+    """
+    w = _merge_weights(HEALTH_FACTOR_WEIGHTS, weights)
+    debt = _column(factors, "debt_ratio")
+    roe = _column(factors, "roe")
+    revenue_growth = _column(factors, "revenue_growth")
+    semi_annual_growth = _column(factors, "semi_annual_growth")
+    market_cap = np.nan_to_num(_column(factors, "market_cap"), nan=0.0)
+
+    # 有半年度数据时按季度60%、半年度40%加权
+    has_semi = ~np.isnan(semi_annual_growth)
+    growth = np.where(has_semi, revenue_growth * 0.6 + semi_annual_growth * 0.4, revenue_growth)
+
+    with np.errstate(invalid="ignore"):
+        debt_score = _ladder(debt, [debt < 30, debt < 50, debt < 70], [30, 20, 10], w["debt"], 30)
+        roe_score = _ladder(roe, [roe > 20, roe > 15, roe > 10, roe > 5], [25, 20, 15, 10], w["roe"], 25)
+        growth_score = _ladder(growth, [growth > 20, growth > 10, growth > 5, growth > 0], [25, 20, 15, 10], w["growth"], 25)
+        size_score = _ladder(market_cap, [market_cap > 1000, market_cap > 500, market_cap > 100, market_cap > 50], [20, 15, 10, 5], w["size"], 20)
+
+    scores = {"debt": debt_score, "roe": roe_score}
+    industry_relative = _relative(scores, w, factors, percentiles, HEALTH_RELATIVE_FACTORS)
+    debt_score, roe_score = scores["debt"], scores["roe"]
+
+    health_score = debt_score + roe_score + growth_score + size_score
+    signal, health_level = _grade(health_score, HEALTH_LEVELS, sum(w.values()))
+    return pd.DataFrame({
+        "debt_score": debt_score,
+        "roe_score": roe_score,
+        "growth_score": growth_score,
+        "size_score": size_score,
+        "health_score": health_score,
+        "combined_growth": np.where(has_semi, growth, np.nan),
+        "growth_period": np.where(has_semi, "综合同比(季度+半年)", "季度同比"),
+        "signal": signal,
+        "health_level": health_level,
+        "industry_relative": industry_relative,
+    }, index=factors.index)
+
+
+def rank_composite(
+    factors: pd.DataFrame,
+    value_weights: Optional[Dict[str, float]] = None,
+    health_weights: Optional[Dict[str, float]] = None,
+    value_share: float = 0.5,
+    percentiles: Optional[pd.DataFrame] = None,
+) -> pd.DataFrame:
+    """
+    综合评分排名：价值因子与财务健康各自归一化到 0-100 后按 value_share 加权
+    percentiles 为行业百分位（见 score_value_factors）
+    """
+    value = score_value_factors(factors, value_weights, percentiles)
+    health = score_financial_health(factors, health_weights, percentiles)
+    value_max = sum(_merge_weights(VALUE_FACTOR_WEIGHTS, value_weights).values()) or 1
+    health_max = sum(_merge_weights(HEALTH_FACTOR_WEIGHTS, health_weights).values()) or 1
+    composite = (value["total_score"] / value_max * value_share + health["health_score"] / health_max * (1 - value_share)) * 100
+    ranked = pd.DataFrame({
+        "composite_score": composite,
+        "value_score": value["total_score"],
+        "value_signal": value["signal"],
+        "health_score": health["health_score"],
+        "health_signal": health["signal"],
+        "industry_relative": value["industry_relative"] | health["industry_relative"],
+    }, index=factors.index)
+    ranked = ranked.sort_values("composite_score", ascending=False, kind="stable")
+    ranked["rank"] = np.arange(1, len(ranked) + 1)
+    return ranked
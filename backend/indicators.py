@@ -0,0 +1,270 @@
+"""
+技术指标计算内核
+
+在 NumPy 数组上直接计算滚动统计、EMA、MACD、RSI，不经过 pandas 的 ewm/rolling：
+- 滚动均值/方差基于累加和，滚动最大/最小值用 van Herk/Gil-Werman 分块前后缀极值，
+  均沿最后一维计算，可直接处理 (股票 × 交易日) 的二维数组
+- EMA 支持 adjust=True（pandas 默认，按全部历史加权归一）和 adjust=False（递推，券商软件通用口径）
+- RSI 支持 sma（简单平均，原有口径）和 wilder（Wilder 平滑，券商软件通用口径）
+- 指数衰减递推 s_t = w * s_{t-1} + x_t 按块转换为缩放累加和，块长保证缩放因子不溢出
+缺失值和除零按各函数说明处理，默认口径的结果与原 pandas 实现一致
+"""
+from typing import Optional, Tuple
+
+import numpy as np
+
+RSI_METHODS = ("sma", "wilder")
+
+# 分块缩放累加时允许的最大缩放倍数
+_MAX_SCALE = 1e12
+
+
+def _decay_sum(values: np.ndarray, decay: float, initial: float = 0.0, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    指数衰减累加：s_t = decay * s_{t-1} + x_t，s_{-1} = initial
+    块内 s_{c+k} = decay^k * (decay * s_{c-1} + Σ_{j<=k} x_{c+j} * decay^{-j})，
+    decay^{-j} 不超过 _MAX_SCALE，块与块之间只传递一个标量
+    """
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    if out is None:
+        out = np.empty(n)
+    if n == 0:
+        return out
+    if decay == 0:
+        out[:] = values
+        return out
+    block = n if decay == 1 else max(1, min(n, int(np.log(_MAX_SCALE) / -np.log(decay))))
+    powers = decay ** np.arange(block)
+    carry = initial
+    for start in range(0, n, block):
+        stop = min(start + block, n)
+        size = stop - start
+        chunk = out[start:stop]
+        np.divide(values[start:stop], powers[:size], out=chunk)
+        np.cumsum(chunk, out=chunk)
+        chunk += decay * carry
+        chunk *= powers[:size]
+        carry = chunk[-1]
+    return out
+
+
+def _window_sums(values: np.ndarray, window: int) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    沿最后一维的窗口和（长度 n - window + 1）及各窗口是否含缺失值
+    无缺失值时只做一次累加；有缺失值时缺失按 0 累加，再单独统计缺失个数
+    """
+    shape = values.shape[:-1] + (values.shape[-1] + 1,)
+    sums = np.zeros(shape)
+    np.cumsum(values, axis=-1, out=sums[..., 1:])
+    if not np.count_nonzero(np.isnan(sums[..., -1])):
+        return sums[..., window:] - sums[..., :-window], None
+    missing = np.isnan(values)
+    np.cumsum(np.where(missing, 0.0, values), axis=-1, out=sums[..., 1:])
+    counts = np.zeros(shape)
+    np.cumsum(missing, axis=-1, out=counts[..., 1:])
+    return sums[..., window:] - sums[..., :-window], counts[..., window:] > counts[..., :-window]
+
+
+def _constant_windows(values: np.ndarray, window: int) -> Optional[np.ndarray]:
+    """
+    各窗口内数值是否完全相同（如停牌），不存在这样的窗口时返回 None
+    累加和相减会留下舍入误差，这些窗口需要单独给出精确结果（pandas 同样特殊处理）
+    """
+    same = values[..., 1:] == values[..., :-1]
+    if window < 2 or np.count_nonzero(same) < window - 1:
+        return None
+    changes = np.zeros(values.shape)
+    np.cumsum(~same, axis=-1, out=changes[..., 1:])
+    constant = changes[..., window - 1:] == changes[..., :values.shape[-1] - window + 1]
+    return constant if np.count_nonzero(constant) else None
+
+
+def rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    滚动均值，等价于 pandas rolling(window).mean()：
+    前 window - 1 个位置及窗口内含缺失值时为 NaN
+    """
+    values = np.asarray(values, dtype=float)
+    if window == 1:
+        return values.copy()
+    result = np.full(values.shape, np.nan)
+    if 1 < window <= values.shape[-1]:
+        means, invalid = _window_sums(values, window)
+        np.divide(means, window, out=result[..., window - 1:])
+        constant = _constant_windows(values, window)
+        if constant is not None:
+            result[..., window - 1:][constant] = values[..., window - 1:][constant]
+        if invalid is not None:
+            result[..., window - 1:][invalid] = np.nan
+    return result
+
+
+def rolling_std(values: np.ndarray, window: int, ddof: int = 1) -> np.ndarray:
+    """
+    滚动标准差，等价于 pandas rolling(window).std()（默认 ddof=1）
+    先按每行均值中心化再由一阶、二阶累加和求方差；窗口内数值全部相同时方差严格为 0，
+    其余舍入误差导致的负方差截断为 0
+    """
+    values = np.asarray(values, dtype=float)
+    result = np.full(values.shape, np.nan)
+    if not (0 < window <= values.shape[-1] and window > ddof):
+        return result
+    center = values.sum(axis=-1, keepdims=True) / values.shape[-1]
+    if np.count_nonzero(np.isnan(center)):
+        center = np.nan_to_num(np.nanmean(values, axis=-1, keepdims=True))
+    centered = values - center
+    squared = centered * centered
+    sums, invalid = _window_sums(centered, window)
+    variance, _ = _window_sums(squared, window)
+    variance -= sums * sums / window
+    constant = _constant_windows(values, window)
+    if constant is not None:
+        variance[constant] = 0.0
+    np.maximum(variance, 0.0, out=variance)
+    variance /= window - ddof
+    np.sqrt(variance, out=result[..., window - 1:])
+    if invalid is not None:
+        result[..., window - 1:][invalid] = np.nan
+    return result
+
+
+def _rolling_extreme(values: np.ndarray, window: int, ufunc) -> np.ndarray:
+    """
+    van Herk/Gil-Werman 滚动极值：按窗口长度分块，分别求块内前缀和后缀极值，
+    窗口 [i, i + window - 1] 的极值 = ufunc(后缀[i], 前缀[i + window - 1])，耗时与窗口长度无关
+    缺失值会传播到包含它的窗口
+    """
+    values = np.asarray(values, dtype=float)
+    n = values.shape[-1]
+    result = np.full(values.shape, np.nan)
+    if not 0 < window <= n:
+        return result
+    blocks = -(-n // window)
+    padded = np.full(values.shape[:-1] + (blocks * window,), np.nan)
+    padded[..., :n] = values
+    shaped = padded.reshape(values.shape[:-1] + (blocks, window))
+    prefix = ufunc.accumulate(shaped, axis=-1).reshape(padded.shape)
+    suffix = ufunc.accumulate(shaped[..., ::-1], axis=-1)[..., ::-1].reshape(padded.shape)
+    # 填充的 NaN 只在最后一块的尾部，不会落入任何完整窗口
+    ufunc(suffix[..., :n - window + 1], prefix[..., window - 1:n], out=result[..., window - 1:])
+    return result
+
+
+def rolling_max(values: np.ndarray, window: int) -> np.ndarray:
+    """滚动最大值，等价于 pandas rolling(window).max()"""
+    return _rolling_extreme(values, window, np.maximum)
+
+
+def rolling_min(values: np.ndarray, window: int) -> np.ndarray:
+    """滚动最小值，等价于 pandas rolling(window).min()"""
+    return _rolling_extreme(values, window, np.minimum)
+
+
+def shift(values: np.ndarray, periods: int = 1) -> np.ndarray:
+    """沿最后一维向后平移，空出的位置为 NaN（同 pandas shift）"""
+    values = np.asarray(values, dtype=float)
+    result = np.full(values.shape, np.nan)
+    if 0 < periods < values.shape[-1]:
+        result[..., periods:] = values[..., :-periods]
+    elif periods == 0:
+        result[...] = values
+    return result
+
+
+def ema(values: np.ndarray, span: int, adjust: bool = True) -> np.ndarray:
+    """
+    指数移动平均，alpha = 2 / (span + 1)
+    adjust=True：y_t = Σ w^(t-i) x_i / Σ w^(t-i)，与 pandas ewm(span).mean() 一致
+    adjust=False：y_0 = x_0，y_t = (1 - alpha) * y_{t-1} + alpha * x_t
+    缺失值不参与加权，输出沿用上一个值；首个有效值之前为 NaN
+    """
+    values = np.asarray(values, dtype=float)
+    alpha = 2.0 / (span + 1)
+    decay = 1.0 - alpha
+    observed = ~np.isnan(values)
+
+    if adjust:
+        if observed.all():
+            # 无缺失值时权重和为等比数列求和，只需一次衰减累加
+            weighted = _decay_sum(values, decay)
+            weighted /= (1.0 - decay ** np.arange(1, len(values) + 1)) / alpha
+            return weighted
+        weighted = _decay_sum(np.where(observed, values, 0.0), decay)
+        weights = _decay_sum(observed.astype(float), decay)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result = weighted / weights
+        # 缺失值位置沿用上一个有效输出
+        last_valid = np.maximum.accumulate(np.where(observed, np.arange(len(values)), -1))
+        result = result[np.maximum(last_valid, 0)]
+        result[last_valid < 0] = np.nan
+        return result
+
+    result = np.full(len(values), np.nan)
+    valid = np.flatnonzero(observed)
+    if len(valid) == 0:
+        return result
+    first = valid[0]
+    if len(valid) == len(values) - first:
+        # 首个有效值之后没有缺失：线性递推，可以直接分块累加
+        _decay_sum(values[first:] * alpha, decay, initial=values[first], out=result[first:])
+        return result
+    # 中间有缺失值时按 pandas 的间隔衰减规则逐个递推
+    weighted, old_weight = values[first], 1.0
+    result[first] = weighted
+    for i in range(first + 1, len(values)):
+        old_weight *= decay
+        if observed[i]:
+            weighted = (old_weight * weighted + alpha * values[i]) / (old_weight + alpha)
+            old_weight = 1.0
+        result[i] = weighted
+    return result
+
+
+def macd(closes: np.ndarray, fast_period: int = 12, slow_period: int = 26, signal_period: int = 9,
+         adjust: bool = True) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """MACD：返回 (MACD线, 信号线, 柱状图)，adjust 为各 EMA 的加权口径"""
+    macd_line = ema(closes, fast_period, adjust) - ema(closes, slow_period, adjust)
+    signal_line = ema(macd_line, signal_period, adjust)
+    return macd_line, signal_line, macd_line - signal_line
+
+
+def rsi(closes: np.ndarray, period: int = 14, method: str = "sma") -> np.ndarray:
+    """
+    相对强弱指数
+    sma：涨跌幅取 period 日简单平均，首日的涨跌按 0 计入窗口（与原 pandas 实现一致）
+    wilder：以前 period 日涨跌均值为种子，之后按 avg = (avg * (period - 1) + x) / period 平滑
+    RSI = 100 * 平均涨幅 / (平均涨幅 + 平均跌幅)：只涨不跌为 100，窗口内无涨跌为 50；
+    缺失的收盘价使相邻两日的涨跌按 0 处理
+    """
+    if method not in RSI_METHODS:
+        raise ValueError(f"未知RSI计算方法: {method}")
+    closes = np.asarray(closes, dtype=float)
+    n = len(closes)
+    result = np.full(n, np.nan)
+    if n < period + 1 or period < 1:
+        return result
+
+    delta = np.zeros(n)
+    np.subtract(closes[1:], closes[:-1], out=delta[1:])
+    delta[np.isnan(delta)] = 0.0
+    gain = np.maximum(delta, 0.0)
+    loss = np.maximum(-delta, 0.0)
+
+    if method == "sma":
+        avg_gain = rolling_mean(gain, period)
+        avg_loss = rolling_mean(loss, period)
+    else:
+        avg_gain = np.full(n, np.nan)
+        avg_loss = np.full(n, np.nan)
+        alpha = 1.0 / period
+        for avg, moves in ((avg_gain, gain), (avg_loss, loss)):
+            seed = moves[1:period + 1].mean()
+            avg[period] = seed
+            _decay_sum(moves[period + 1:] * alpha, 1.0 - alpha, initial=seed, out=avg[period + 1:])
+
+    total = avg_gain + avg_loss
+    with np.errstate(divide='ignore', invalid='ignore'):
+        np.divide(100.0 * avg_gain, total, out=result)
+    result[total == 0] = 50.0
+    return result
@@ -0,0 +1,154 @@
+"""
+行业相对估值
+
+基于全市场基本面宽表，按行业批量计算 PE、PB、ROE、资产负债率的分布：
+- 每只股票在行业内的百分位和 z 分数（一次 groupby 向量化计算）
+- 每个行业的样本数、分位数等汇总
+查询单只股票时只做索引查找，不再逐只请求上游接口
+"""
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+from lazy_import import LazyModule
+
+pd = LazyModule("pandas")
+
+# 参与行业比较的指标，True 表示数值越低越好
+INDUSTRY_METRICS = {
+    "pe_ratio": True,
+    "pb_ratio": True,
+    "roe": False,
+    "debt_ratio": True,
+}
+# 行业样本数低于该值时不计算行业相对评分
+MIN_INDUSTRY_PEERS = 5
+
+
+class IndustryValuation:
+    """
+    行业估值分布
+    load_universe() 返回 (数据版本, DataFrame)，DataFrame 以 stock_code 为索引，
+    包含 industry 列和 INDUSTRY_METRICS 中的各指标列
+    """
+
+    def __init__(self, load_universe: Callable[[], Tuple[int, pd.DataFrame]], refresh_seconds: float = 60):
+        self.load_universe = load_universe
+        self.refresh_seconds = refresh_seconds
+        self.version = None
+        self._stats = None
+        self._summary: Dict[str, Dict[str, Any]] = {}
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self, force: bool = False):
+        """按固定间隔检查基本面宽表是否更新，有更新时整体重算分布，返回数据版本"""
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.refresh_seconds:
+            return self.version
+        with self._lock:
+            self._checked_at = now
+            version, universe = self.load_universe()
+            if version != self.version:
+                self._stats, self._summary = compute_industry_stats(universe)
+                self.version = version
+        return self.version
+
+    def lookup(self, stock_code: str) -> Optional[Dict[str, Any]]:
+        """查询股票的行业相对指标，股票不在宽表中时返回 None"""
+        self.refresh()
+        stats = self._stats
+        if stats is None or stock_code not in stats.index:
+            return None
+        row = stats.loc[stock_code]
+        result = {
+            "industry": row["industry"],
+            "peer_count": int(row["peer_count"]),
+            "percentiles": {},
+            "z_scores": {},
+        }
+        for metric in INDUSTRY_METRICS:
+            pct, z = row[f"{metric}_pct"], row[f"{metric}_z"]
+            result["percentiles"][metric] = round(float(pct), 4) if pd.notna(pct) else None
+            result["z_scores"][metric] = round(float(z), 4) if pd.notna(z) else None
+        return result
+
+    def percentile_frame(self, stock_codes: Iterable[str]) -> pd.DataFrame:
+        """
+        一组股票的行业百分位（列为 INDUSTRY_METRICS 中的指标），供因子评分使用
+        不在宽表中或行业样本数低于 MIN_INDUSTRY_PEERS 的股票为 NaN（评分时退回绝对阈值）
+        """
+        self.refresh()
+        stats = self._stats
+        frame = pd.DataFrame(np.nan, index=pd.Index(list(stock_codes)), columns=list(INDUSTRY_METRICS))
+        if stats is None or stats.empty:
+            return frame
+        known = stats.reindex(frame.index)
+        enough_peers = (known["peer_count"] >= MIN_INDUSTRY_PEERS).to_numpy()
+        for metric in INDUSTRY_METRICS:
+            frame[metric] = known[f"{metric}_pct"].where(enough_peers)
+        return frame
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """各行业指标分布汇总"""
+        self.refresh()
+        return self._summary
+
+
+def compute_industry_stats(universe: pd.DataFrame):
+    """
+    向量化计算行业内百分位和 z 分数
+    返回 (逐股票统计 DataFrame, 行业汇总 dict)
+    """
+    if universe.empty:
+        return pd.DataFrame(), {}
+
+    frame = universe[["industry", *INDUSTRY_METRICS]].copy()
+    # 亏损公司的 PE、PB 没有比较意义
+    for metric in ("pe_ratio", "pb_ratio"):
+        frame.loc[frame[metric] <= 0, metric] = np.nan
+
+    groups = frame.groupby("industry")
+    stats = pd.DataFrame(index=frame.index)
+    stats["industry"] = frame["industry"]
+    stats["peer_count"] = groups["industry"].transform("size")
+    for metric in INDUSTRY_METRICS:
+        grouped = groups[metric]
+        stats[f"{metric}_pct"] = grouped.rank(pct=True, method="max")
+        std = grouped.transform("std").replace(0, np.nan)
+        stats[f"{metric}_z"] = (frame[metric] - grouped.transform("mean")) / std
+
+    quantiles = groups[list(INDUSTRY_METRICS)].quantile([0.25, 0.5, 0.75]).unstack()
+    counts = groups.size()
+    summary = {}
+    for industry, count in counts.items():
+        summary[industry] = {"peer_count": int(count)}
+        for metric in INDUSTRY_METRICS:
+            values = [quantiles.loc[industry, (metric, q)] for q in (0.25, 0.5, 0.75)]
+            summary[industry][metric] = {
+                "p25": float(values[0]) if pd.notna(values[0]) else None,
+                "median": float(values[1]) if pd.notna(values[1]) else None,
+                "p75": float(values[2]) if pd.notna(values[2]) else None,
+            }
+    return stats, summary
+
+
+def relative_score(percentiles: Dict[str, Optional[float]], weights: Dict[str, float]) -> Optional[float]:
+    """
+    按行业百分位计算 0-100 的相对评分
+    越低越好的指标取 1 - 百分位；缺失指标不计入权重
+    """
+    total, weight_sum = 0.0, 0.0
+    for metric, weight in weights.items():
+        pct = percentiles.get(metric)
+        if pct is None:
+            continue
+        total += weight * ((1 - pct) if INDUSTRY_METRICS[metric] else pct)
+        weight_sum += weight
+    if weight_sum == 0:
+        return None
+    return round(total / weight_sum * 100, 1)
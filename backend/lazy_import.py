@@ -0,0 +1,43 @@
+"""
+延迟导入
+
+akshare、pandas 等重量级依赖在进程启动时导入要花数秒，拖慢 worker 启动和扩容后 /health 的响应。
+LazyModule 在模块级占位，第一次访问属性时才真正导入，之后的访问直接转发给真实模块。
+"""
+import importlib
+import types
+
+
+class LazyModule(types.ModuleType):
+    """
+    延迟导入的模块代理，用法：pd = LazyModule("pandas")
+    设置属性同样转发给真实模块（测试中替换上游接口时仍然生效）
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_module"] = None
+
+    def _load(self):
+        module = self.__dict__["_module"]
+        if module is None:
+            # importlib 自带导入锁，多个线程同时首次访问时只会导入一次
+            module = importlib.import_module(self.__name__)
+            self.__dict__["_module"] = module
+        return module
+
+    @property
+    def loaded(self) -> bool:
+        return self.__dict__["_module"] is not None
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        return f"<lazy module '{self.__name__}'{' (loaded)' if self.loaded else ''}>"
@@ -1,20 +1,98 @@
-from fastapi import FastAPI, HTTPException
+from __future__ import annotations
+
+from fastapi import FastAPI, HTTPException, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-import akshare as ak
-import pandas as pd
+from fastapi.responses import JSONResponse, StreamingResponse
 import numpy as np
-from sklearn.linear_model import LinearRegression
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import sqlite3
 import json
-from typing import List, Dict, Any
+import hashlib
+import re
+from typing import List, Dict, Any, Optional, Tuple
 from pydantic import BaseModel
+import indicators
+from momentum_ranking import MomentumUniverse, rolling_momentum
+from industry_valuation import IndustryValuation, MIN_INDUSTRY_PEERS, relative_score
+from factor_engine import score_value_factors, score_financial_health, rank_composite
+from trading_calendar import TradingCalendar, MARKET_TZ, latest_complete_report_period
+from cache_maintenance import AccessTracker, CacheMaintenance
+from error_buffer import ErrorBuffer
+import portfolio
+from signal_hub import SignalHub
+from alert_rules import AlertEngine, validate_conditions
+from stock_search import StockSearchIndex, STOCK_CODE_PATTERN, pinyin_initials
+from negative_cache import NegativeCache, NegativeCacheHit, NOT_FOUND, UPSTREAM_ERROR
+from price_adjust import ADJUST_MODES, adjust_rows, merge_bars
+from downsample import DOWNSAMPLE_METHODS, ResolutionCache, downsample_chart, remap_history
+from watchlist_io import IMPORT_FORMATS, csv_chunks, json_chunks, parse_codes, split_codes
 import time
 from functools import lru_cache
 import asyncio
+import os
+import socket
+import uuid
+import copy
+import threading
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait
+from itertools import islice
+from lazy_import import LazyModule
+
+# akshare、pandas 导入耗时数秒，首次使用时才导入（启动后由 prewarm_imports 在后台预热）
+ak = LazyModule("akshare")
+pd = LazyModule("pandas")
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，退化为单进程模式
+    fcntl = None
 
 app = FastAPI()
 
+# 数据库路径：多 worker 部署时所有进程共享同一个 SQLite 文件（WAL 模式）作为缓存层
+DB_PATH = os.environ.get('STOCKS_DB_PATH', 'stocks.db')
+# 后台刷新任务的执行间隔（秒），只在被选为主进程的 worker 中运行
+REFRESH_INTERVAL_SECONDS = int(os.environ.get('REFRESH_INTERVAL_SECONDS', '600'))
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+# 基本面缓存在披露窗口外的最长有效天数（估值指标随股价变化，不能等到下一个披露窗口）
+FUNDAMENTAL_MAX_STALE_DAYS = float(os.environ.get('FUNDAMENTAL_MAX_STALE_DAYS', '7'))
+# 过期缓存的保留天数（保留期内仍可用于截面排名、行业分布等批量计算）
+CACHE_EXPIRED_RETENTION_DAYS = float(os.environ.get('CACHE_EXPIRED_RETENTION_DAYS', '7'))
+# 错误日志批量写库的间隔（秒）和每批最多记录的 (股票, 错误类型) 条数
+ERROR_LOG_FLUSH_SECONDS = float(os.environ.get('ERROR_LOG_FLUSH_SECONDS', '2'))
+ERROR_LOG_MAX_ENTRIES = int(os.environ.get('ERROR_LOG_MAX_ENTRIES', '200'))
+# 单只股票分析接口的默认耗时预算（毫秒），0 表示等待全部数据；可由 deadline_ms 参数按请求覆盖
+REQUEST_DEADLINE_MS = int(os.environ.get('REQUEST_DEADLINE_MS', '0'))
+# 启动后是否在后台预先导入 akshare、pandas（关闭时在第一个需要它们的请求中导入）
+PREWARM_ON_STARTUP = os.environ.get('PREWARM_ON_STARTUP', '1') != '0'
+# WebSocket 信号推送的计算间隔（秒）
+SIGNAL_PUSH_INTERVAL_SECONDS = float(os.environ.get('SIGNAL_PUSH_INTERVAL_SECONDS', '60'))
+# 每个 WebSocket 连接最多订阅的股票数
+SIGNAL_MAX_CODES_PER_CLIENT = int(os.environ.get('SIGNAL_MAX_CODES_PER_CLIENT', '200'))
+# 预警规则检查新行情的间隔（秒），只在主进程 worker 中运行
+ALERT_INTERVAL_SECONDS = float(os.environ.get('ALERT_INTERVAL_SECONDS', '30'))
+# 全部A股代码名称列表（搜索和代码校验使用）的更新间隔（小时）
+STOCK_LISTING_MAX_AGE_HOURS = float(os.environ.get('STOCK_LISTING_MAX_AGE_HOURS', '24'))
+# 全市场基本面宽表批量更新的间隔（小时）
+FUNDAMENTAL_UNIVERSE_MAX_AGE_HOURS = float(os.environ.get('FUNDAMENTAL_UNIVERSE_MAX_AGE_HOURS', '24'))
+# 上游查询失败结果的缓存时长（秒），按错误类别：not_found 上游返回空数据，upstream_error 上游接口异常
+NEGATIVE_CACHE_TTLS = {"not_found": 600, "upstream_error": 30, **json.loads(os.environ.get('NEGATIVE_CACHE_TTLS') or '{}')}
+# 批量导入：单次最多导入的代码数，并发获取行情和分析的线程数
+MAX_IMPORT_CODES = int(os.environ.get('MAX_IMPORT_CODES', '2000'))
+IMPORT_WORKERS = int(os.environ.get('IMPORT_WORKERS', '8'))
+# 批量任务每处理多少只股票写一次进度（其余股票只检查取消请求）
+JOB_REPORT_EVERY = 20
+
+# 数据库建表/迁移完成后置位；启动时在后台执行，完成前除 /health 外的请求等待
+DATABASE_READY = threading.Event()
+
+def get_db_connection():
+    """打开数据库连接，写锁冲突时等待而不是立即报错"""
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    conn.execute('PRAGMA busy_timeout=30000;')
+    return conn
+
 # 数据模型
 class StockInfo(BaseModel):
     stock_code: str
@@ -23,11 +101,39 @@ class StockInfo(BaseModel):
     highlight: bool = False
     strategies: Dict[str, Any] = {}
 
+class JobRequest(BaseModel):
+    job_type: str  # analysis / screen / batch_refresh / import
+    stock_code: Optional[str] = None  # analysis 任务使用
+    stock_codes: Optional[List[str]] = None  # screen / batch_refresh 任务使用，缺省为全部已保存股票；import 任务必填
+    params: Dict[str, Any] = {}  # 策略参数，缺省使用接口默认值
+    signals: Dict[str, str] = {}  # screen 任务的筛选条件，如 {"macd": "buy"}
+    strategies: Optional[List[str]] = None  # 只运行的策略或策略组，缺省为全部
+
+class PortfolioHolding(BaseModel):
+    stock_code: str
+    weight: float = 1.0
+
+class PortfolioRequest(BaseModel):
+    holdings: Optional[List[PortfolioHolding]] = None  # 缺省为全部已保存股票等权
+    benchmark: str = "000300"  # 计算 beta 的基准指数，默认沪深300
+
+class AlertRuleRequest(BaseModel):
+    strategy: str  # 依赖的技术策略，如 ma_crossover
+    conditions: List[Dict[str, Any]]  # 同时满足的条件，如 [{"field": "signal", "op": "eq", "value": "buy"}]
+    stock_code: Optional[str] = None  # 缺省对全部股票生效
+    name: Optional[str] = None
+
 # 数据库初始化
 def init_database():
     """初始化SQLite数据库"""
-    conn = sqlite3.connect('stocks.db')
+    conn = get_db_connection()
     cursor = conn.cursor()
+    # 缓存维护按页增量回收空间，需要 auto_vacuum=INCREMENTAL：新数据库在建表前设置即可生效，
+    # 旧数据库在这里做一次完整 VACUUM 转换（启动时、后台任务开始之前，多 worker 时在主进程完成）
+    if cursor.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        cursor.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        if cursor.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()[0]:
+            cursor.execute('VACUUM')
     try:
         cursor.execute('PRAGMA journal_mode=WAL;')
     except:
@@ -84,25 +190,246 @@ def init_database():
     )
     ''')
     
+    # 全市场基本面宽表（真实数据），供行业分布和批量因子计算使用
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS fundamental_universe (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        stock_code TEXT UNIQUE NOT NULL,
+        stock_name TEXT,
+        industry TEXT,
+        pe_ratio REAL,
+        pb_ratio REAL,
+        roe REAL,
+        debt_ratio REAL,
+        dividend_yield REAL,
+        revenue_growth REAL,
+        semi_annual_growth REAL,
+        market_cap REAL,
+        data_source TEXT,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+    # 上游拉取租约：多个 worker 同时未命中缓存时只有一个去请求 akshare
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS fetch_leases (
+        lease_key TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    )
+    ''')
+
+    # 异步任务表：任务状态、进度和结果持久化，任意 worker 都能查询
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        job_type TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        status TEXT NOT NULL,
+        progress REAL DEFAULT 0,
+        progress_message TEXT,
+        result TEXT,
+        error TEXT,
+        owner TEXT,
+        cancel_requested INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        started_at TIMESTAMP,
+        finished_at TIMESTAMP
+    )
+    ''')
+
+    # 已删除股票的墓碑记录，供 /api/stocks 增量同步使用
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS stock_deletions (
+        stock_code TEXT PRIMARY KEY,
+        snapshot_version INTEGER NOT NULL,
+        deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+    # 各策略最新信号（独立列+索引，供服务端筛选，无需解码策略 JSON）
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS stock_signals (
+        stock_code TEXT NOT NULL,
+        strategy TEXT NOT NULL,
+        signal TEXT,
+        PRIMARY KEY (stock_code, strategy)
+    )
+    ''')
+
+    # 交易日历（来自上游接口，用于计算缓存过期时间）
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS trading_calendar (
+        trade_date TEXT PRIMARY KEY
+    )
+    ''')
+
+    # 不复权的原始日线（只追加新K线，分红送转不影响已保存的数据），price_cache 中的前复权行情由它和复权因子计算
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS price_bars_raw (
+        stock_code TEXT PRIMARY KEY,
+        rows TEXT NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+    # 后复权累计因子：除权除息日 -> 因子（该日起适用）
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS adjust_factors (
+        stock_code TEXT NOT NULL,
+        ex_date TEXT NOT NULL,
+        hfq_factor REAL NOT NULL,
+        PRIMARY KEY (stock_code, ex_date)
+    )
+    ''')
+
+    # 上游查询失败的结果（负缓存），与真实数据分开存放
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS negative_cache (
+        cache_key TEXT PRIMARY KEY,
+        error_class TEXT NOT NULL,
+        message TEXT,
+        expires_at TIMESTAMP NOT NULL
+    )
+    ''')
+
+    # 全部A股代码、名称及拼音首字母（来自上游接口，每天更新）
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS stock_listing (
+        stock_code TEXT PRIMARY KEY,
+        stock_name TEXT NOT NULL,
+        initials TEXT,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+    # 预警规则：对某个技术策略结果字段的条件（JSON 数组），stock_code 为空表示对全部股票生效
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS alert_rules (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT,
+        stock_code TEXT,
+        strategy TEXT NOT NULL,
+        conditions TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+    # 各规则在各股票上最近一次求值是否命中（边沿触发的依据）
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS alert_rule_state (
+        rule_id INTEGER NOT NULL,
+        stock_code TEXT NOT NULL,
+        matched INTEGER NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (rule_id, stock_code)
+    )
+    ''')
+
+    # 预警记录（按 id 增量读取）
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS alert_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        rule_id INTEGER NOT NULL,
+        rule_name TEXT,
+        stock_code TEXT NOT NULL,
+        strategy TEXT NOT NULL,
+        bar_date TEXT,
+        detail TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+    # 预警求值进度：已处理到的行情缓存 id
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS alert_progress (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        price_cache_id INTEGER NOT NULL
+    )
+    ''')
+
+    # 旧版本数据库补充分析快照字段
+    ensure_columns(cursor, 'stocks', {
+        'snapshot_version': 'INTEGER DEFAULT 0',
+        'analysis_time': 'TEXT',
+        'k_line_data': 'TEXT',
+        'volume_data': 'TEXT',
+    })
+    # 缓存最近访问时间（LRU 淘汰依据，由维护任务批量写回）
+    for table in ('fundamental_cache', 'price_cache'):
+        ensure_columns(cursor, table, {'accessed_at': 'TIMESTAMP'})
+    # 错误日志按批合并，记录合并的次数和最后一次出现的时间
+    ensure_columns(cursor, 'error_logs', {
+        'occurrences': 'INTEGER DEFAULT 1',
+        'last_seen_at': 'TIMESTAMP',
+    })
+    
     try:
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_fundamental_expires ON fundamental_cache(expires_at);')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_stocks_code ON stocks(stock_code);')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_price_expires ON price_cache(expires_at);')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_stocks_snapshot ON stocks(snapshot_version);')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_stocks_highlight ON stocks(highlight, snapshot_version);')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_signals_lookup ON stock_signals(strategy, signal);')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at);')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_universe_industry ON fundamental_universe(industry);')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_alert_events_stock ON alert_events(stock_code, id);')
     except:
         pass
 
+    # 旧版本按本地时间 ISO 格式写入的过期时间，统一转换为与 CURRENT_TIMESTAMP 可比较的 UTC 格式
+    for table in ('fundamental_cache', 'price_cache'):
+        cursor.execute(f"UPDATE {table} SET expires_at = datetime(expires_at, 'utc') WHERE expires_at LIKE '%T%'")
+
+    # 旧版本把模拟的后备基本面数据写入了缓存，删除以免被当作真实数据使用
+    cursor.execute("DELETE FROM fundamental_cache WHERE data_source = 'fallback_simulation'")
+
+    # 旧数据回填信号表
+    cursor.execute('SELECT COUNT(*) FROM stock_signals')
+    if cursor.fetchone()[0] == 0:
+        cursor.execute('SELECT stock_code, strategies FROM stocks')
+        for stock_code, strategies in cursor.fetchall():
+            try:
+                cursor.executemany(
+                    'INSERT OR REPLACE INTO stock_signals (stock_code, strategy, signal) VALUES (?, ?, ?)',
+                    extract_signal_rows(stock_code, json.loads(strategies or '{}'))
+                )
+            except Exception:
+                pass
+
     conn.commit()
     conn.close()
+    DATABASE_READY.set()
+
+def ensure_columns(cursor, table: str, columns: Dict[str, str]):
+    """为已存在的表补充缺失的列（兼容旧版本数据库文件）"""
+    existing = {row[1] for row in cursor.execute(f'PRAGMA table_info({table})')}
+    for name, definition in columns.items():
+        if name not in existing:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {name} {definition}')
 
 # 缓存相关函数
-def save_fundamental_cache(stock_code: str, data: dict, expires_hours: int = 24):
-    """保存基本面数据到缓存"""
-    conn = sqlite3.connect('stocks.db')
+def to_db_timestamp(moment: datetime) -> str:
+    """转换为 UTC 的 'YYYY-MM-DD HH:MM:SS' 格式，与 SQLite 的 CURRENT_TIMESTAMP 直接比较"""
+    return moment.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+def cache_expires_at(expires_hours: Optional[float], calendar_expiry) -> str:
+    """缓存过期时间：指定小时数时按固定时长，否则按交易日历计算"""
+    if expires_hours is not None:
+        return to_db_timestamp(datetime.now(timezone.utc) + timedelta(hours=expires_hours))
+    return to_db_timestamp(calendar_expiry())
+
+def save_fundamental_cache(stock_code: str, data: dict, expires_hours: Optional[float] = None):
+    """
+    保存基本面数据到缓存
+    默认按披露窗口过期（见 TradingCalendar.fundamental_expiry），expires_hours 用于后备数据等固定时长的场景
+    """
+    conn = get_db_connection()
     cursor = conn.cursor()
     
     try:
-        from datetime import datetime, timedelta
-        expires_at = (datetime.now() + timedelta(hours=expires_hours)).isoformat()
+        expires_at = cache_expires_at(expires_hours, lambda: TRADING_CALENDAR.fundamental_expiry(
+            max_stale=timedelta(days=FUNDAMENTAL_MAX_STALE_DAYS)))
         
         try:
             cursor.execute('''
@@ -115,15 +442,21 @@ def save_fundamental_cache(stock_code: str, data: dict, expires_hours: int = 24)
             data.get('data_source', 'unknown'),
             expires_at
         ))
+            # INSERT OR REPLACE 每次都会分配新的自增 id，可直接作为数据版本号
+            version = cursor.lastrowid
+            if data.get('data_source') != 'fallback_simulation':
+                upsert_fundamental_universe(cursor, [(stock_code, data)])
             conn.commit()
         except Exception:
-            pass
+            return None
     finally:
         conn.close()
+    STRATEGY_RESULT_CACHE.invalidate(stock_code, 'fundamental')
+    return version
 
 def get_fundamental_cache(stock_code: str):
     """从缓存获取基本面数据"""
-    conn = sqlite3.connect('stocks.db')
+    conn = get_db_connection()
     cursor = conn.cursor()
     
     try:
@@ -134,6 +467,7 @@ def get_fundamental_cache(stock_code: str):
         
         result = cursor.fetchone()
         if result:
+            ACCESS_TRACKER.touch('fundamental_cache', stock_code)
             data = json.loads(result[0])
             data['cache_source'] = result[1]
             data['cache_hit'] = True
@@ -142,11 +476,148 @@ def get_fundamental_cache(stock_code: str):
     finally:
         conn.close()
 
-def save_price_cache(stock_code: str, rows: List[Dict[str, Any]], expires_hours: int = 6, period: str = 'daily', adjust: str = 'qfq'):
-    conn = sqlite3.connect('stocks.db')
+def get_fundamental_cache_version(stock_code: str):
+    """获取有效基本面缓存的数据版本号，无有效缓存时返回 None"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('''
+        SELECT id FROM fundamental_cache WHERE stock_code = ? AND expires_at > CURRENT_TIMESTAMP
+        ''', (stock_code,))
+        result = cursor.fetchone()
+        return result[0] if result else None
+    finally:
+        conn.close()
+
+FUNDAMENTAL_UNIVERSE_COLUMNS = ['stock_name', 'industry', 'pe_ratio', 'pb_ratio', 'roe', 'debt_ratio',
+                                'dividend_yield', 'revenue_growth', 'semi_annual_growth', 'market_cap', 'data_source']
+
+def upsert_fundamental_universe(cursor, items):
+    """写入基本面宽表，items 为 [(股票代码, 基本面数据)]"""
+    cursor.executemany(f'''
+    INSERT OR REPLACE INTO fundamental_universe
+    (stock_code, {", ".join(FUNDAMENTAL_UNIVERSE_COLUMNS)}, updated_at)
+    VALUES (?, {", ".join("?" for _ in FUNDAMENTAL_UNIVERSE_COLUMNS)}, CURRENT_TIMESTAMP)
+    ''', [(stock_code, *(data.get(column) for column in FUNDAMENTAL_UNIVERSE_COLUMNS)) for stock_code, data in items])
+
+def refresh_fundamental_universe():
+    """用全部基本面缓存（含已过期的真实数据）批量重建基本面宽表"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT stock_code, data FROM fundamental_cache WHERE data_source != 'fallback_simulation'")
+        items = []
+        for stock_code, data in cursor.fetchall():
+            try:
+                items.append((stock_code, json.loads(data)))
+            except Exception:
+                continue
+        cursor.execute('SELECT stock_code FROM fundamental_universe')
+        known = {row[0] for row in cursor.fetchall()}
+        # 只写入宽表中还没有的股票，避免无谓地改变数据版本
+        missing = [item for item in items if item[0] not in known]
+        if missing:
+            upsert_fundamental_universe(cursor, missing)
+        conn.commit()
+    finally:
+        conn.close()
+
+def bulk_number(value, scale: float = 1.0):
+    """批量接口中的数值列转为 float，缺失、非数值时返回 None"""
+    number = pd.to_numeric(value, errors='coerce')
+    return None if pd.isna(number) else float(number) * scale
+
+def fetch_fundamental_universe():
+    """
+    全市场基本面宽表批量更新：三个全市场接口代替逐只请求
+    - 实时行情：名称、市盈率（动态）、市净率、总市值
+    - 业绩报表：所处行业、净资产收益率、营业总收入同比增长
+    - 资产负债表：资产负债率
+    报告类数据取披露截止日已过的最近报告期，各公司口径一致；批量接口没有的字段（股息率等）沿用宽表中已有的值
+    宽表为空或超过 FUNDAMENTAL_UNIVERSE_MAX_AGE_HOURS 时执行，多 worker 下只由取得租约的进程拉取
+    """
+    conn = get_db_connection()
+    try:
+        fresh = conn.execute(
+            "SELECT COUNT(*) FROM fundamental_universe WHERE data_source = 'bulk_universe' AND updated_at > datetime('now', ?)",
+            (f'-{FUNDAMENTAL_UNIVERSE_MAX_AGE_HOURS} hours',)
+        ).fetchone()[0]
+    finally:
+        conn.close()
+    if fresh:
+        return
+    lease_token = acquire_fetch_lease('fundamental_universe')
+    if lease_token is None:
+        return
+    try:
+        period = latest_complete_report_period(datetime.now(MARKET_TZ).date()).strftime('%Y%m%d')
+        spot = ak.stock_zh_a_spot_em()
+        report = ak.stock_yjbb_em(date=period)
+        balance = ak.stock_zcfz_em(date=period)
+
+        bulk: Dict[str, Dict[str, Any]] = {}
+        for _, row in spot.iterrows():
+            bulk[str(row['代码']).zfill(6)] = {
+                "stock_name": str(row['名称']).strip(),
+                "pe_ratio": bulk_number(row.get('市盈率-动态')),
+                "pb_ratio": bulk_number(row.get('市净率')),
+                "market_cap": bulk_number(row.get('总市值'), 1e-8),  # 转换为亿元
+            }
+        for _, row in report.iterrows():
+            data = bulk.setdefault(str(row['股票代码']).zfill(6), {})
+            industry = row.get('所处行业')
+            data["industry"] = str(industry).strip() if pd.notna(industry) and str(industry).strip() else None
+            data["roe"] = bulk_number(row.get('净资产收益率'))
+            data["revenue_growth"] = bulk_number(row.get('营业总收入-同比增长'))
+        for _, row in balance.iterrows():
+            bulk.setdefault(str(row['股票代码']).zfill(6), {})["debt_ratio"] = bulk_number(row.get('资产负债率'))
+        if len(STOCK_SEARCH):
+            bulk = {stock_code: data for stock_code, data in bulk.items() if stock_code in STOCK_SEARCH}
+        if not bulk:
+            return
+
+        conn = get_db_connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            existing = {
+                row[0]: dict(zip(FUNDAMENTAL_UNIVERSE_COLUMNS, row[1:]))
+                for row in conn.execute(f'SELECT stock_code, {", ".join(FUNDAMENTAL_UNIVERSE_COLUMNS)} FROM fundamental_universe')
+            }
+            items = []
+            for stock_code, data in bulk.items():
+                merged = dict(existing.get(stock_code, {}))
+                merged.update({column: value for column, value in data.items() if value is not None})
+                merged["data_source"] = "bulk_universe"
+                items.append((stock_code, merged))
+            upsert_fundamental_universe(conn.cursor(), items)
+            conn.commit()
+        finally:
+            conn.close()
+        print(f"基本面宽表批量更新完成: {len(items)} 只股票，报告期 {period}")
+    except Exception as e:
+        log_error(None, "fundamental_universe_fetch", str(e))
+    finally:
+        release_fetch_lease('fundamental_universe', lease_token)
+
+def load_fundamental_universe():
+    """读取基本面宽表，返回 (数据版本, DataFrame)"""
+    conn = get_db_connection()
+    try:
+        version = conn.execute('SELECT MAX(id), COUNT(*) FROM fundamental_universe').fetchone()
+        frame = pd.read_sql_query(
+            f'SELECT stock_code, {", ".join(FUNDAMENTAL_UNIVERSE_COLUMNS)} FROM fundamental_universe',
+            conn, index_col='stock_code'
+        )
+        return f"{version[0] or 0}-{version[1]}", frame
+    finally:
+        conn.close()
+
+def save_price_cache(stock_code: str, rows: List[Dict[str, Any]], expires_hours: Optional[float] = None, period: str = 'daily', adjust: str = 'qfq'):
+    """保存日线行情缓存，默认有效至下一个交易日收盘后数据更新"""
+    conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        expires_at = (datetime.now() + timedelta(hours=expires_hours)).isoformat()
+        expires_at = cache_expires_at(expires_hours, TRADING_CALENDAR.bar_expiry)
         try:
             cursor.execute('''
         INSERT OR REPLACE INTO price_cache (stock_code, rows, period, adjust, updated_at, expires_at)
@@ -154,241 +625,992 @@ def save_price_cache(stock_code: str, rows: List[Dict[str, Any]], expires_hours:
         ''', (stock_code, json.dumps(rows, ensure_ascii=False, default=str), period, adjust, expires_at))
             conn.commit()
         except Exception:
-            pass
+            return None
     finally:
         conn.close()
+    STRATEGY_RESULT_CACHE.invalidate(stock_code, 'price')
+    return cursor.lastrowid
 
-def get_price_cache(stock_code: str):
-    conn = sqlite3.connect('stocks.db')
+def get_price_cache_entry(stock_code: str, include_expired: bool = False):
+    """读取日线行情缓存，返回 (rows, 数据版本号)，未命中时返回 None；include_expired 时包含已过期的缓存"""
+    conn = get_db_connection()
     cursor = conn.cursor()
     try:
         cursor.execute('''
-        SELECT rows FROM price_cache WHERE stock_code = ? AND expires_at > CURRENT_TIMESTAMP
-        ''', (stock_code,))
+        SELECT rows, id FROM price_cache WHERE stock_code = ? AND (? OR expires_at > CURRENT_TIMESTAMP)
+        ''', (stock_code, include_expired))
         result = cursor.fetchone()
         if result:
+            ACCESS_TRACKER.touch('price_cache', stock_code)
             try:
-                return json.loads(result[0])
+                return json.loads(result[0]), result[1]
             except:
                 return None
         return None
     finally:
         conn.close()
 
-def log_error(stock_code: str, error_type: str, error_message: str):
-    """记录错误日志"""
-    conn = sqlite3.connect('stocks.db')
-    cursor = conn.cursor()
-    
+def get_price_cache(stock_code: str):
+    entry = get_price_cache_entry(stock_code)
+    return entry[0] if entry else None
+
+def get_price_cache_entries(stock_codes: List[str]) -> Dict[str, Any]:
+    """批量读取未过期的行情缓存，返回 股票代码 -> 行情行列表（未命中的不出现）"""
+    entries = {}
+    conn = get_db_connection()
     try:
-        cursor.execute('''
-        INSERT INTO error_logs (stock_code, error_type, error_message)
-        VALUES (?, ?, ?)
-        ''', (stock_code, error_type, str(error_message)[:500]))  # 限制错误消息长度
-        conn.commit()
-    except:
-        pass  # 避免日志记录失败影响主要功能
+        # SQLite 单条语句的参数个数有上限，分批查询
+        for start in range(0, len(stock_codes), 500):
+            chunk = stock_codes[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            for stock_code, rows in conn.execute(
+                f'SELECT stock_code, rows FROM price_cache WHERE stock_code IN ({placeholders}) AND expires_at > CURRENT_TIMESTAMP',
+                chunk
+            ):
+                try:
+                    entries[stock_code] = json.loads(rows)
+                    ACCESS_TRACKER.touch('price_cache', stock_code)
+                except Exception:
+                    continue
     finally:
         conn.close()
+    return entries
 
-def clean_expired_cache():
-    """清理过期的缓存数据"""
-    conn = sqlite3.connect('stocks.db')
-    cursor = conn.cursor()
-    
+def get_raw_bars(stock_code: str) -> Optional[List[Dict[str, Any]]]:
+    """读取不复权的原始日线，没有时返回 None"""
+    conn = get_db_connection()
     try:
-        cursor.execute('DELETE FROM fundamental_cache WHERE expires_at < CURRENT_TIMESTAMP')
-        cursor.execute('DELETE FROM error_logs WHERE created_at < datetime("now", "-7 days")')  # 保留7天错误日志
-        conn.commit()
+        row = conn.execute('SELECT rows FROM price_bars_raw WHERE stock_code = ?', (stock_code,)).fetchone()
+        return json.loads(row[0]) if row else None
     finally:
         conn.close()
 
-# 数据库操作函数
-def save_stock_to_db(stock_data: dict):
-    """保存股票信息到数据库"""
-    conn = sqlite3.connect('stocks.db')
-    cursor = conn.cursor()
-    
+def get_adjust_factors(stock_code: str) -> List[Any]:
+    """读取后复权因子表 [(除权除息日, 累计因子)]，按日期升序"""
+    conn = get_db_connection()
     try:
-        cursor.execute('''
-        INSERT OR REPLACE INTO stocks 
-        (stock_code, stock_name, added_time, highlight, strategies, updated_at)
-        VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-        ''', (
-            stock_data['stock_code'],
-            stock_data['stock_name'],
-            stock_data.get('added_time', datetime.now().isoformat()),
-            stock_data.get('highlight', False),
-            json.dumps(stock_data.get('strategies', {}), ensure_ascii=False, default=str)
-        ))
+        return conn.execute(
+            'SELECT ex_date, hfq_factor FROM adjust_factors WHERE stock_code = ? ORDER BY ex_date', (stock_code,)
+        ).fetchall()
+    finally:
+        conn.close()
+
+def save_raw_bars(stock_code: str, rows: List[Dict[str, Any]], factors: Optional[List[Any]] = None):
+    """保存原始日线；factors 不为 None 时在同一事务中整体替换该股票的复权因子"""
+    conn = get_db_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute('''
+        INSERT OR REPLACE INTO price_bars_raw (stock_code, rows, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)
+        ''', (stock_code, json.dumps(rows, ensure_ascii=False, default=str)))
+        if factors is not None:
+            conn.execute('DELETE FROM adjust_factors WHERE stock_code = ?', (stock_code,))
+            conn.executemany('INSERT INTO adjust_factors (stock_code, ex_date, hfq_factor) VALUES (?, ?, ?)',
+                             [(stock_code, ex_date, factor) for ex_date, factor in factors])
         conn.commit()
     finally:
         conn.close()
 
-def get_saved_stocks() -> List[Dict]:
-    """获取所有保存的股票信息"""
-    conn = sqlite3.connect('stocks.db')
+def exchange_symbol(stock_code: str) -> str:
+    """带交易所前缀的代码（新浪接口使用），如 sh600000、sz000001、bj430047"""
+    if stock_code.startswith(('6', '9')):
+        return f"sh{stock_code}"
+    if stock_code.startswith(('4', '8')):
+        return f"bj{stock_code}"
+    return f"sz{stock_code}"
+
+def fetch_adjust_factors(stock_code: str) -> List[Any]:
+    """从上游拉取后复权因子表（只有除权除息日的记录，数据量很小）"""
+    factor_df = ak.stock_zh_a_daily(symbol=exchange_symbol(stock_code), adjust="hfq-factor")
+    factors = sorted((str(d)[:10], float(f)) for d, f in zip(factor_df['date'], factor_df['hfq_factor']))
+    if not factors:
+        raise ValueError("上游未返回复权因子")
+    return factors
+
+def get_price_cache_updates(since_id: int):
+    """读取 id 大于 since_id 的行情缓存（含已过期），返回 [(id, 股票代码, 日期序列, 收盘价序列)]"""
+    conn = get_db_connection()
     cursor = conn.cursor()
-    
     try:
-        cursor.execute('''
-        SELECT stock_code, stock_name, added_time, highlight, strategies
-        FROM stocks
-        ORDER BY updated_at DESC
-        ''')
-        
-        stocks = []
-        for row in cursor.fetchall():
-            stock = {
-                'stock_code': row[0],
-                'stock_name': row[1],
-                'added_time': row[2],
-                'highlight': bool(row[3]),
-                'strategies': json.loads(row[4] if row[4] else '{}')
-            }
-            stocks.append(stock)
-        return stocks
+        cursor.execute(
+            "SELECT id, stock_code, rows FROM price_cache WHERE id > ? AND stock_code NOT LIKE 'index:%' ORDER BY id",
+            (since_id,)
+        )
+        updates = []
+        for cache_id, stock_code, rows in cursor.fetchall():
+            try:
+                bars = json.loads(rows)
+                dates = [str(r['日期'])[:10] for r in bars]
+                closes = [float(r['收盘']) for r in bars]
+            except Exception:
+                continue
+            updates.append((cache_id, stock_code, dates, closes))
+        return updates
     finally:
         conn.close()
 
-def delete_stock_from_db(stock_code: str):
-    """从数据库删除股票"""
-    conn = sqlite3.connect('stocks.db')
+def get_price_cache_codes() -> List[str]:
+    """行情缓存中当前仍存在的股票代码（不含指数）"""
+    conn = get_db_connection()
     cursor = conn.cursor()
-    
     try:
-        cursor.execute('DELETE FROM stocks WHERE stock_code = ?', (stock_code,))
-        conn.commit()
-        return cursor.rowcount > 0
+        cursor.execute("SELECT stock_code FROM price_cache WHERE stock_code NOT LIKE 'index:%'")
+        return [row[0] for row in cursor.fetchall()]
     finally:
         conn.close()
 
-# 配置 CORS 中间件，允许前端跨域请求
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # 允许所有来源的请求，为了方便本地开发
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+def load_trading_dates() -> List[str]:
+    """
+    读取交易日历；本地表为空或不覆盖今天时从上游拉取并写入本地表
+    上游每年更新一次全年日历，多 worker 下只由取得租约的进程拉取
+    """
+    today = datetime.now(MARKET_TZ).date().isoformat()
+    conn = get_db_connection()
+    try:
+        dates = [row[0] for row in conn.execute('SELECT trade_date FROM trading_calendar ORDER BY trade_date')]
+    finally:
+        conn.close()
+    if dates and dates[-1] >= today:
+        return dates
 
-@app.on_event("startup")
-async def on_startup():
-    init_database()
-    clean_expired_cache()
+    lease_token = acquire_fetch_lease('trading_calendar')
+    if lease_token is None:
+        return dates
+    try:
+        calendar_df = ak.tool_trade_date_hist_sina()
+        fetched = [str(d)[:10] for d in calendar_df['trade_date']]
+        conn = get_db_connection()
+        try:
+            conn.executemany('INSERT OR IGNORE INTO trading_calendar (trade_date) VALUES (?)', [(d,) for d in fetched])
+            conn.commit()
+        finally:
+            conn.close()
+        return sorted(set(dates) | set(fetched))
+    except Exception as e:
+        log_error(None, "trading_calendar_fetch", str(e))
+        return dates
+    finally:
+        release_fetch_lease('trading_calendar', lease_token)
 
-def analyze_stock_highlight_strategy(df: pd.DataFrame):
+# 交易日历：决定行情和基本面缓存的过期时间
+TRADING_CALENDAR = TradingCalendar(load_trading_dates)
+
+def refresh_stock_listing():
     """
-    分析股票是否符合高亮策略
-    策略：最近半个月价格变化不大，并且交易量比之前是缩量状态
+    本地代码名称列表为空或超过 STOCK_LISTING_MAX_AGE_HOURS 时从上游拉取并整体替换（退市股票随之移除）
+    多 worker 下只由取得租约的进程拉取
     """
-    if len(df) < 30:  # 需要至少30天的数据来比较
-        return False
+    conn = get_db_connection()
+    try:
+        fresh = conn.execute(
+            "SELECT COUNT(*) FROM stock_listing WHERE updated_at > datetime('now', ?)",
+            (f'-{STOCK_LISTING_MAX_AGE_HOURS} hours',)
+        ).fetchone()[0]
+    finally:
+        conn.close()
+    if fresh:
+        return
+    lease_token = acquire_fetch_lease('stock_listing')
+    if lease_token is None:
+        return
+    try:
+        listing_df = ak.stock_info_a_code_name()
+        rows = [(str(code).zfill(6), str(name).strip(), pinyin_initials(str(name)))
+                for code, name in zip(listing_df['code'], listing_df['name'])]
+        if not rows:
+            return
+        conn = get_db_connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM stock_listing')
+            conn.executemany('INSERT OR REPLACE INTO stock_listing (stock_code, stock_name, initials) VALUES (?, ?, ?)', rows)
+            conn.commit()
+        finally:
+            conn.close()
+    except Exception as e:
+        log_error(None, "stock_listing_fetch", str(e))
+    finally:
+        release_fetch_lease('stock_listing', lease_token)
 
-    # 1. 定义时间周期
-    recent_period = df.tail(15)  # 最近半个月（约15个交易日）
-    previous_period = df.iloc[-30:-15] # 再之前半个月
+def load_stock_listing():
+    """读取代码名称列表，返回 (数据版本, [(股票代码, 名称, 拼音首字母)])"""
+    conn = get_db_connection()
+    try:
+        version = conn.execute('SELECT COUNT(*), MAX(updated_at) FROM stock_listing').fetchone()
+        rows = conn.execute('SELECT stock_code, stock_name, initials FROM stock_listing').fetchall()
+        return f"{version[0]}-{version[1]}", rows
+    finally:
+        conn.close()
 
-    # 2. 分析价格变化
-    # 我们使用收盘价的标准差来衡量价格波动
-    recent_price_std = recent_period['收盘'].std()
-    previous_price_std = previous_period['收盘'].std()
-    
-    # 策略：近期波动率小于或等于前期波动率的1.1倍（允许小幅增加）
-    price_volatility_condition = recent_price_std <= (previous_price_std * 1.1)
+# 股票搜索索引：每个 worker 在内存中各维护一份，搜索和代码校验不访问数据库
+STOCK_SEARCH = StockSearchIndex(load_stock_listing)
 
-    # 3. 分析交易量
-    recent_avg_volume = recent_period['成交量'].mean()
-    previous_avg_volume = previous_period['成交量'].mean()
+def check_stock_code(stock_code: str) -> str:
+    """
+    在请求上游或读写数据库前校验股票代码，返回去除空白后的代码，不合法时抛出 ValueError
+    代码名称列表尚未加载（如上游不可用）时只校验格式
+    """
+    stock_code = (stock_code or '').strip()
+    if not STOCK_CODE_PATTERN.match(stock_code):
+        raise ValueError(f"股票代码格式错误: {stock_code}，应为6位数字")
+    if len(STOCK_SEARCH) and stock_code not in STOCK_SEARCH:
+        raise ValueError(f"未知的股票代码: {stock_code}")
+    return stock_code
 
-    # 策略：近期平均交易量小于前期平均交易量的 0.8 倍（明显缩量）
-    volume_condition = recent_avg_volume < (previous_avg_volume * 0.8)
-    
-    # 4. 结合两个条件
-    if price_volatility_condition and volume_condition:
-        return True
-    
-    return False
+def write_error_logs(rows):
+    """批量写入合并后的错误日志"""
+    conn = get_db_connection()
+    try:
+        conn.executemany('''
+        INSERT INTO error_logs (stock_code, error_type, error_message, occurrences, created_at, last_seen_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ''', rows)
+        conn.commit()
+    finally:
+        conn.close()
+
+ERROR_BUFFER = ErrorBuffer(write_error_logs, max_entries=ERROR_LOG_MAX_ENTRIES)
+
+def log_error(stock_code: str, error_type: str, error_message: str):
+    """记录错误日志（先进入内存缓冲，由 error_log_writer 批量写库）"""
+    ERROR_BUFFER.record(stock_code, error_type, error_message)
 
+def clean_expired_cache():
+    """清理过期超过保留期的缓存和旧错误日志"""
+    return CACHE_MAINTENANCE.delete_expired()
+
+# 缓存维护：各表的淘汰规则和预算，可用 CACHE_BUDGETS 环境变量（JSON）覆盖预算，
+# 如 {"price_cache": {"max_rows": 2000, "max_bytes": 104857600}}
+_EXPIRED_BEFORE = f"datetime('now', '-{CACHE_EXPIRED_RETENTION_DAYS} days')"
+CACHE_TABLES = {
+    'price_cache': {
+        'key': 'stock_code',
+        'size': 'LENGTH(rows)',
+        'order': 'COALESCE(accessed_at, updated_at)',
+        'expired': f'expires_at < {_EXPIRED_BEFORE}',
+        'max_rows': 5000,
+        'max_bytes': 256 * 1024 * 1024,
+    },
+    'fundamental_cache': {
+        'key': 'stock_code',
+        'size': 'LENGTH(data)',
+        'order': 'COALESCE(accessed_at, updated_at)',
+        # 后备数据过期即删除，真实数据保留一段时间供行业分布重建
+        'expired': f"(data_source = 'fallback_simulation' AND expires_at < CURRENT_TIMESTAMP) OR expires_at < {_EXPIRED_BEFORE}",
+        'max_rows': 10000,
+        'max_bytes': 64 * 1024 * 1024,
+    },
+    'price_bars_raw': {
+        'size': 'LENGTH(rows)',
+        'order': 'updated_at',
+        'max_rows': 5000,
+        'max_bytes': 256 * 1024 * 1024,
+    },
+    'negative_cache': {
+        'size': 'COALESCE(LENGTH(message), 0)',
+        'order': 'expires_at',
+        'expired': 'expires_at < CURRENT_TIMESTAMP',
+        'max_rows': 20000,
+        'max_bytes': 8 * 1024 * 1024,
+    },
+    'error_logs': {
+        'size': 'LENGTH(error_message) + LENGTH(error_type) + COALESCE(LENGTH(stock_code), 0)',
+        'order': 'created_at',
+        'expired': "created_at < datetime('now', '-7 days')",  # 保留7天错误日志
+        'max_rows': 20000,
+        'max_bytes': 16 * 1024 * 1024,
+    },
+    'jobs': {
+        'size': 'LENGTH(payload) + COALESCE(LENGTH(result), 0) + COALESCE(LENGTH(error), 0)',
+        'order': 'created_at',
+        # 只淘汰已结束的任务
+        'evictable': "status IN ('succeeded', 'failed', 'cancelled')",
+        'max_rows': 1000,
+        'max_bytes': 64 * 1024 * 1024,
+    },
+}
+CACHE_BUDGET_KEYS = ('max_rows', 'max_bytes')
 
-def analyze_ma_crossover_strategy(df: pd.DataFrame, short_period=5, long_period=20):
+def parse_cache_budgets(raw: str) -> Dict[str, Dict[str, Optional[int]]]:
     """
-    双均线策略分析
-    短期均线上穿长期均线为买入信号，下穿为卖出信号
+    解析 CACHE_BUDGETS 环境变量，如 {"price_cache": {"max_rows": 5000}}，null 表示不限
+    表名、字段名或取值不合法时抛出 ValueError（启动即失败，而不是悄悄使用默认预算）
     """
-    if len(df) < max(short_period, long_period):
-        return {
-            "signal": "insufficient_data",
-            "current_trend": "unknown",
-            "ma_short": None,
-            "ma_long": None
-        }
-    
-    # 计算移动平均线
-    df['MA_short'] = df['收盘'].rolling(window=short_period).mean()
-    df['MA_long'] = df['收盘'].rolling(window=long_period).mean()
-    
-    # 获取最新值
-    latest = df.iloc[-1]
-    previous = df.iloc[-2] if len(df) > 1 else latest
-    
-    current_short = latest['MA_short']
-    current_long = latest['MA_long']
-    prev_short = previous['MA_short']
-    prev_long = previous['MA_long']
-    
-    # 判断信号
-    signal = "hold"
-    if pd.notna(current_short) and pd.notna(current_long) and pd.notna(prev_short) and pd.notna(prev_long):
-        # 金叉：短期均线上穿长期均线
-        if prev_short <= prev_long and current_short > current_long:
-            signal = "buy"
-        # 死叉：短期均线下穿长期均线
-        elif prev_short >= prev_long and current_short < current_long:
-            signal = "sell"
-    
-    # 当前趋势
-    current_trend = "bullish" if current_short > current_long else "bearish"
-    
-    return {
-        "signal": signal,
-        "current_trend": current_trend,
-        "ma_short": float(current_short) if pd.notna(current_short) else None,
-        "ma_long": float(current_long) if pd.notna(current_long) else None,
-        "short_period": short_period,
-        "long_period": long_period
-    }
+    try:
+        budgets = json.loads(raw or '{}')
+    except json.JSONDecodeError as e:
+        raise ValueError(f"CACHE_BUDGETS 不是合法的 JSON: {e}")
+    if not isinstance(budgets, dict):
+        raise ValueError("CACHE_BUDGETS 需要为 {表名: {\"max_rows\": 行数, \"max_bytes\": 字节数}}")
+    for table, budget in budgets.items():
+        if table not in CACHE_TABLES:
+            raise ValueError(f"CACHE_BUDGETS 中的未知表 {table}，可选: {', '.join(CACHE_TABLES)}")
+        if not isinstance(budget, dict):
+            raise ValueError(f"CACHE_BUDGETS.{table} 需要为对象，如 {{\"max_rows\": 10000}}")
+        for key, value in budget.items():
+            if key not in CACHE_BUDGET_KEYS:
+                raise ValueError(f"CACHE_BUDGETS.{table} 中的未知字段 {key}，可选: {', '.join(CACHE_BUDGET_KEYS)}")
+            if value is not None and (isinstance(value, bool) or not isinstance(value, int) or value < 0):
+                raise ValueError(f"CACHE_BUDGETS.{table}.{key} 需要为非负整数或 null")
+    return budgets
+
+for _table, _budget in parse_cache_budgets(os.environ.get('CACHE_BUDGETS')).items():
+    CACHE_TABLES[_table].update(_budget)
 
+ACCESS_TRACKER = AccessTracker()
+CACHE_MAINTENANCE = CacheMaintenance(get_db_connection, CACHE_TABLES, DB_PATH, ACCESS_TRACKER)
 
-def calculate_macd(df: pd.DataFrame, fast_period=12, slow_period=26, signal_period=9):
+# 多进程协调
+def acquire_fetch_lease(lease_key: str, ttl_seconds: int = 60) -> Optional[str]:
     """
-    计算MACD指标
+    尝试获取上游拉取租约（跨进程单飞）
+    返回租约令牌表示由当前调用方负责拉取，返回 None 表示其他调用方正在拉取；
+    租约超时后自动失效，防止持有者崩溃后死锁
     """
-    if len(df) < slow_period:
-        return None, None, None
+    now = time.time()
+    token = f"{WORKER_ID}:{uuid.uuid4().hex[:8]}"
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('DELETE FROM fetch_leases WHERE lease_key = ? AND expires_at < ?', (lease_key, now))
+        cursor.execute('''
+        INSERT OR IGNORE INTO fetch_leases (lease_key, owner, expires_at)
+        VALUES (?, ?, ?)
+        ''', (lease_key, token, now + ttl_seconds))
+        acquired = cursor.rowcount > 0
+        conn.commit()
+        return token if acquired else None
+    except sqlite3.Error:
+        return token  # 协调失败时退化为直接拉取
+    finally:
+        conn.close()
+
+def release_fetch_lease(lease_key: str, token: Optional[str]):
+    """释放上游拉取租约"""
+    if token is None:
+        return
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute('DELETE FROM fetch_leases WHERE lease_key = ? AND owner = ?', (lease_key, token))
+        conn.commit()
+    except sqlite3.Error:
+        pass
+    finally:
+        conn.close()
+
+def wait_for_shared_cache(load, timeout_seconds: float = 30, interval_seconds: float = 0.2):
+    """其他进程持有租约时轮询共享缓存，等待其写入结果"""
+    deadline = time.monotonic() + timeout_seconds
+    while time.monotonic() < deadline:
+        time.sleep(interval_seconds)
+        result = load()
+        if result:
+            return result
+    return None
+
+def load_negative_cache(cache_key: str):
+    """读取共享的负缓存，返回 (错误类别, 错误信息, 剩余有效秒数)，没有或已过期时返回 None"""
+    conn = get_db_connection()
+    try:
+        return conn.execute('''
+        SELECT error_class, message, (julianday(expires_at) - julianday('now')) * 86400 FROM negative_cache
+        WHERE cache_key = ? AND expires_at > CURRENT_TIMESTAMP
+        ''', (cache_key,)).fetchone()
+    finally:
+        conn.close()
+
+def save_negative_cache(cache_key: str, error_class: str, message: str, ttl_seconds: float):
+    conn = get_db_connection()
+    try:
+        conn.execute('''
+        INSERT OR REPLACE INTO negative_cache (cache_key, error_class, message, expires_at) VALUES (?, ?, ?, ?)
+        ''', (cache_key, error_class, message, to_db_timestamp(datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds))))
+        conn.commit()
+    except sqlite3.Error:
+        pass
+    finally:
+        conn.close()
+
+def delete_negative_cache(cache_key: str):
+    conn = get_db_connection()
+    try:
+        conn.execute('DELETE FROM negative_cache WHERE cache_key = ?', (cache_key,))
+        conn.commit()
+    except sqlite3.Error:
+        pass
+    finally:
+        conn.close()
+
+# 负缓存：键与拉取租约相同（price:代码 / fundamental:代码），等待租约的请求也能看到持有者的失败结果
+NEGATIVE_CACHE = NegativeCache(NEGATIVE_CACHE_TTLS, load_negative_cache, save_negative_cache, delete_negative_cache)
+
+def discard_negative_cache(stock_code: str):
+    """清除股票的行情、基本面负缓存（删除或重新导入股票时，之后的请求重新访问上游）"""
+    for kind in ("price", "fundamental"):
+        NEGATIVE_CACHE.discard(f"{kind}:{stock_code}")
+
+class LeaderElection:
+    """
+    基于文件锁的主进程选举
+    同一台机器上只有一个 worker 能持有锁，持有者负责执行刷新和清理任务；
+    持有者退出时操作系统自动释放锁，其他 worker 在下一轮接管
+    """
+
+    def __init__(self, lock_path: str):
+        self.lock_path = lock_path
+        self._lock_file = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._lock_file is not None
+
+    def try_acquire(self) -> bool:
+        if self._lock_file is not None:
+            return True
+        if fcntl is None:
+            return True
+        lock_file = open(self.lock_path, 'a+')
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(WORKER_ID)
+        lock_file.flush()
+        self._lock_file = lock_file
+        return True
+
+    def release(self):
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+LEADER_ELECTION = LeaderElection(DB_PATH + '.leader')
+
+# 策略结果缓存
+class StrategyResultCache:
+    """
+    策略结果记忆化缓存
+    键为 (股票代码, 策略名, 参数元组, 行情数据版本, 基本面数据版本)，
+    不依赖某类数据的策略在对应位置填 None；行情或基本面缓存更新时自动失效
+    """
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._keys_by_stock: Dict[str, set] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return copy.deepcopy(value)
+
+    def put(self, key: tuple, value: Any):
+        stock_code, name, params = key[:3]
+        with self._lock:
+            keys = self._keys_by_stock.setdefault(stock_code, set())
+            # 同一策略同一参数只保留最新数据版本的结果（其他进程写入新版本时同样生效）
+            for old_key in [k for k in keys if k[1] == name and k[2] == params and k != key]:
+                self._discard(old_key)
+            self._entries[key] = copy.deepcopy(value)
+            self._entries.move_to_end(key)
+            keys.add(key)
+            while len(self._entries) > self.max_entries:
+                oldest, _ = self._entries.popitem(last=False)
+                self._keys_by_stock.get(oldest[0], set()).discard(oldest)
+
+    def invalidate(self, stock_code: str, source: str):
+        """使依赖某类数据（'price' 或 'fundamental'）的缓存条目失效"""
+        index = 3 if source == 'price' else 4
+        with self._lock:
+            for key in [k for k in self._keys_by_stock.get(stock_code, ()) if k[index] is not None]:
+                self._discard(key)
+
+    def _discard(self, key: tuple):
+        self._entries.pop(key, None)
+        keys = self._keys_by_stock.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_stock[key[0]]
+
+STRATEGY_RESULT_CACHE = StrategyResultCache()
+
+# 有耗时预算的分析请求中并发执行行情、名称、基本面获取的线程池（超时的任务在其中继续执行）
+ANALYSIS_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.environ.get('ANALYSIS_WORKERS', '8')), thread_name_prefix="analysis")
+# 行情获取单独的线程池：不排在慢速的基本面、名称请求之后，截止时间只计算行情本身的耗时
+PRICE_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.environ.get('PRICE_WORKERS', '4')), thread_name_prefix="price")
+
+# 截面动量排名（样本为行情缓存中的全部股票）
+MOMENTUM_UNIVERSE = MomentumUniverse(get_price_cache_updates, get_price_cache_codes)
+# 样本数不足时无法做有意义的截面排名，退化为绝对阈值
+MIN_MOMENTUM_UNIVERSE = 5
+
+# 行业估值分布（基于基本面宽表定时重算）
+INDUSTRY_VALUATION = IndustryValuation(load_fundamental_universe)
+
+# 数据库操作函数
+STOCK_FIELDS = {
+    'stock_code': 'stock_code',
+    'stock_name': 'stock_name',
+    'added_time': 'added_time',
+    'highlight': 'highlight',
+    'strategies': 'strategies',
+    'snapshot_version': 'snapshot_version',
+    'analysis_time': 'analysis_time',
+    'updated_at': 'updated_at',
+    'k_line_data': 'k_line_data',
+    'volume_data': 'volume_data',
+}
+DEFAULT_STOCK_FIELDS = ['stock_code', 'stock_name', 'added_time', 'highlight', 'strategies',
+                        'snapshot_version', 'analysis_time', 'updated_at']
+JSON_STOCK_FIELDS = {'strategies', 'k_line_data', 'volume_data'}
+
+def extract_signal_rows(stock_code: str, strategies: Dict[str, Any]):
+    """从策略结果中提取 (股票代码, 策略名, 信号) 行"""
+    return [
+        (stock_code, name, result.get('signal'))
+        for name, result in strategies.items()
+        if isinstance(result, dict) and 'signal' in result
+    ]
+
+def next_snapshot_version(cursor) -> int:
+    """分配新的快照版本号（在写事务内调用，全表单调递增）"""
+    cursor.execute('''
+    SELECT MAX(v) FROM (
+        SELECT MAX(snapshot_version) AS v FROM stocks
+        UNION ALL
+        SELECT MAX(snapshot_version) AS v FROM stock_deletions
+    )
+    ''')
+    return (cursor.fetchone()[0] or 0) + 1
+
+def save_stock_to_db(stock_data: dict):
+    """保存股票信息及分析快照到数据库"""
+    return save_stocks_to_db([stock_data])[0]
+
+def save_stocks_to_db(stock_list: List[dict]) -> List[int]:
+    """
+    批量保存股票信息及分析快照：一个写事务内依次分配快照版本号，各表用 executemany 一次写入
+    返回各股票的快照版本号
+    """
+    if not stock_list:
+        return []
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        first_version = next_snapshot_version(cursor)
+        versions = list(range(first_version, first_version + len(stock_list)))
+        now = datetime.now().isoformat()
+        cursor.executemany('''
+        INSERT OR REPLACE INTO stocks 
+        (stock_code, stock_name, added_time, highlight, strategies, snapshot_version, analysis_time, k_line_data, volume_data, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ''', [
+            (
+                stock_data['stock_code'],
+                stock_data['stock_name'],
+                stock_data.get('added_time', now),
+                stock_data.get('highlight', False),
+                json.dumps(stock_data.get('strategies', {}), ensure_ascii=False, default=str),
+                snapshot_version,
+                stock_data.get('analysis_time', now),
+                json.dumps(stock_data['k_line_data'], ensure_ascii=False, default=str) if 'k_line_data' in stock_data else None,
+                json.dumps(stock_data['volume_data'], ensure_ascii=False, default=str) if 'volume_data' in stock_data else None
+            )
+            for stock_data, snapshot_version in zip(stock_list, versions)
+        ])
+        stock_codes = [(stock_data['stock_code'],) for stock_data in stock_list]
+        cursor.executemany('DELETE FROM stock_deletions WHERE stock_code = ?', stock_codes)
+        cursor.executemany('DELETE FROM stock_signals WHERE stock_code = ?', stock_codes)
+        cursor.executemany(
+            'INSERT INTO stock_signals (stock_code, strategy, signal) VALUES (?, ?, ?)',
+            [row for stock_data in stock_list
+             for row in extract_signal_rows(stock_data['stock_code'], stock_data.get('strategies', {}))]
+        )
+        conn.commit()
+        return versions
+    finally:
+        conn.close()
+
+def get_snapshot_state():
+    """
+    获取快照集合的整体状态 (最新版本号, 股票数量)
+    只读索引列，用于生成 ETag，无需解码任何快照
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute('''
+        SELECT
+            (SELECT MAX(v) FROM (
+                SELECT MAX(snapshot_version) AS v FROM stocks
+                UNION ALL
+                SELECT MAX(snapshot_version) AS v FROM stock_deletions
+            )),
+            (SELECT COUNT(*) FROM stocks)
+        ''')
+        version, count = cursor.fetchone()
+        return version or 0, count
+    finally:
+        conn.close()
+
+def query_saved_stocks(
+    fields: List[str] = None,
+    since: int = None,
+    highlight: bool = None,
+    strategy: str = None,
+    signal: str = None,
+    cursor_token: str = None,
+    limit: int = None,
+    version: int = 0,
+) -> Dict[str, Any]:
+    """
+    分页查询保存的股票分析快照
+    - fields: 返回字段（投影），未列出的 JSON 字段不会被读取和解码
+    - since: 只返回快照版本号大于该值的股票
+    - highlight / strategy+signal: 基于索引列的服务端筛选
+    - cursor_token / limit: 游标分页，按股票代码排序（快照版本和行 id 在重新保存时都会变化，
+      按它们分页会让翻页期间被重新保存的股票跳到游标之前而漏掉）
+    - version: 第一页读取前的快照版本，写入游标并由之后各页原样返回，
+      翻页期间的修改版本号都大于它，下一次 since 同步时补齐
+    返回 {"stocks": [...], "next_cursor": str|None, "version": int}
+    """
+    fields = fields or DEFAULT_STOCK_FIELDS
+    unknown = [f for f in fields if f not in STOCK_FIELDS]
+    if unknown:
+        raise ValueError(f"未知字段: {', '.join(unknown)}")
+
+    columns = ['s.stock_code'] + [f's.{STOCK_FIELDS[f]}' for f in fields]
+    query = f'SELECT {", ".join(columns)} FROM stocks s'
+    conditions, args = [], []
+    if strategy is not None and signal is not None:
+        query += ' JOIN stock_signals g ON g.stock_code = s.stock_code AND g.strategy = ? AND g.signal = ?'
+        args += [strategy, signal]
+    if since is not None:
+        conditions.append('s.snapshot_version > ?')
+        args.append(since)
+    if highlight is not None:
+        conditions.append('s.highlight = ?')
+        args.append(bool(highlight))
+    if cursor_token:
+        version, cursor_code = parse_stocks_cursor(cursor_token)
+        conditions.append('s.stock_code > ?')
+        args.append(cursor_code)
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    query += ' ORDER BY s.stock_code'
+    if limit is not None:
+        query += ' LIMIT ?'
+        args.append(limit + 1)
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute(query, args)
+        rows = cursor.fetchall()
+    finally:
+        conn.close()
+
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = f"{version}:{rows[-1][0]}"
+
+    stocks = []
+    for row in rows:
+        stock = {}
+        for field, value in zip(fields, row[1:]):
+            if field in JSON_STOCK_FIELDS:
+                value = json.loads(value) if value else ({} if field == 'strategies' else None)
+            elif field == 'highlight':
+                value = bool(value)
+            elif field == 'snapshot_version':
+                value = value or 0
+            stock[field] = value
+        stocks.append(stock)
+    return {"stocks": stocks, "next_cursor": next_cursor, "version": version}
+
+def parse_stocks_cursor(cursor_token: str) -> Tuple[int, str]:
+    """解析分页游标 "<快照版本>:<股票代码>"，格式不符时抛出 ValueError"""
+    match = re.fullmatch(r'(\d+):(\d+)', cursor_token)
+    if match is None:
+        raise ValueError("无效的分页游标")
+    return int(match.group(1)), match.group(2)
+
+def get_saved_stocks(include_kline: bool = False, since: int = None) -> List[Dict]:
+    """获取所有保存的股票信息（含分析快照）"""
+    fields = DEFAULT_STOCK_FIELDS + (['k_line_data', 'volume_data'] if include_kline else [])
+    return query_saved_stocks(fields=fields, since=since)["stocks"]
+
+def get_saved_stock_codes() -> List[str]:
+    """获取所有已保存的股票代码"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute('SELECT stock_code FROM stocks')
+        return [row[0] for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+def get_deleted_stocks(since: int) -> List[str]:
+    """获取快照版本号大于 since 之后被删除的股票代码"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute('SELECT stock_code FROM stock_deletions WHERE snapshot_version > ?', (since,))
+        return [row[0] for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+def delete_stock_from_db(stock_code: str):
+    """从数据库删除股票"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('DELETE FROM stocks WHERE stock_code = ?', (stock_code,))
+        deleted = cursor.rowcount > 0
+        cursor.execute('DELETE FROM stock_signals WHERE stock_code = ?', (stock_code,))
+        if deleted:
+            cursor.execute('''
+            INSERT OR REPLACE INTO stock_deletions (stock_code, snapshot_version)
+            VALUES (?, ?)
+            ''', (stock_code, next_snapshot_version(cursor)))
+        conn.commit()
+        return deleted
+    finally:
+        conn.close()
+
+# 配置 CORS 中间件，允许前端跨域请求
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],  # 允许所有来源的请求，为了方便本地开发
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+@app.middleware("http")
+async def wait_for_database(request: Request, call_next):
+    """数据库初始化在后台进行，完成前到达的请求（/health 除外）先等待"""
+    if not DATABASE_READY.is_set() and request.url.path != "/health":
+        await asyncio.to_thread(DATABASE_READY.wait, 60)
+    return await call_next(request)
+
+@app.on_event("startup")
+async def on_startup():
+    # 建表迁移、清理和依赖预热都不在启动关键路径上，/health 立即可用
+    asyncio.create_task(startup_tasks())
+    asyncio.create_task(error_log_writer())
+
+async def startup_tasks():
+    """后台初始化：建表迁移并清理过期缓存后启动刷新任务，最后按需预热重量级依赖"""
+    try:
+        await asyncio.to_thread(init_database)
+        await asyncio.to_thread(clean_expired_cache)
+    except Exception as e:
+        print(f"数据库初始化失败: {e}")
+    finally:
+        DATABASE_READY.set()
+    try:
+        await asyncio.to_thread(STOCK_SEARCH.refresh)
+    except Exception as e:
+        print(f"加载股票列表失败: {e}")
+    asyncio.create_task(refresh_loop())
+    asyncio.create_task(signal_push_loop())
+    asyncio.create_task(alert_loop())
+    if PREWARM_ON_STARTUP:
+        await asyncio.to_thread(prewarm_imports)
+
+def prewarm_imports():
+    """导入 akshare、pandas 并执行一次指标计算，避免第一个分析请求承担导入耗时"""
+    started = time.monotonic()
+    try:
+        pd.DataFrame
+        ak.stock_zh_a_hist
+        indicators.rsi(np.arange(30, dtype=float), 14)
+    except Exception as e:
+        print(f"预热依赖失败: {e}")
+        return
+    print(f"依赖预热完成，耗时 {time.monotonic() - started:.2f}s")
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    ERROR_BUFFER.flush()
+    CACHE_MAINTENANCE.flush_access()
+    LEADER_ELECTION.release()
+
+async def error_log_writer():
+    """后台写入缓冲的错误日志，每个 worker 各自执行"""
+    while True:
+        await asyncio.sleep(ERROR_LOG_FLUSH_SECONDS)
+        if ERROR_BUFFER.pending():
+            await asyncio.to_thread(ERROR_BUFFER.flush)
+
+async def refresh_loop():
+    """
+    后台刷新任务：每个 worker 写回自己记录的缓存访问时间，并按共享的代码名称列表更新搜索索引；
+    当选主进程的 worker 更新代码名称列表和全市场基本面宽表、执行缓存维护（淘汰、压缩、WAL 截断），并为已保存股票预热过期的行情缓存
+    （写入共享数据库，所有 worker 可见）
+    """
+    if REFRESH_INTERVAL_SECONDS <= 0:
+        return
+    while True:
+        try:
+            await asyncio.to_thread(CACHE_MAINTENANCE.flush_access)
+            if LEADER_ELECTION.try_acquire():
+                await asyncio.to_thread(refresh_stock_listing)
+                await asyncio.to_thread(CACHE_MAINTENANCE.run)
+                await asyncio.to_thread(recover_interrupted_jobs)
+                await asyncio.to_thread(refresh_fundamental_universe)
+                await asyncio.to_thread(fetch_fundamental_universe)
+                for stock_code in await asyncio.to_thread(get_saved_stock_codes):
+                    if get_price_cache_entry(stock_code) is None:
+                        try:
+                            await asyncio.to_thread(load_price_history, stock_code)
+                        except Exception as e:
+                            log_error(stock_code, "price_refresh", str(e))
+            await asyncio.to_thread(STOCK_SEARCH.refresh)
+        except Exception as e:
+            print(f"后台刷新任务失败: {e}")
+        await asyncio.sleep(REFRESH_INTERVAL_SECONDS)
+
+def signal_change_points(signals) -> Dict[str, list]:
+    """
+    把逐日信号序列压缩为变化点
+    index 为信号发生变化的K线下标（与 k_line_data 对齐），signal 为自该K线起的信号
+    """
+    signals = np.asarray(signals, dtype=object)
+    if len(signals) == 0:
+        return {"index": [], "signal": []}
+    changes = np.flatnonzero(signals[1:] != signals[:-1]) + 1
+    index = np.concatenate(([0], changes))
+    return {"index": index.tolist(), "signal": signals[index].tolist()}
+
+
+def crossover_signals(fast, slow) -> np.ndarray:
+    """
+    逐日交叉信号：快线上穿慢线为 buy，下穿为 sell，其余（含数据不足）为 hold
+    """
+    fast, slow = np.asarray(fast, dtype=float), np.asarray(slow, dtype=float)
+    prev_fast = np.concatenate(([np.nan], fast[:-1]))
+    prev_slow = np.concatenate(([np.nan], slow[:-1]))
+    valid = ~(np.isnan(fast) | np.isnan(slow) | np.isnan(prev_fast) | np.isnan(prev_slow))
+    with np.errstate(invalid='ignore'):
+        buy = valid & (prev_fast <= prev_slow) & (fast > slow)
+        sell = valid & (prev_fast >= prev_slow) & (fast < slow)
+    return np.select([buy, sell], ["buy", "sell"], default="hold").astype(object)
+
+
+def highlight_signal_series(df: pd.DataFrame) -> np.ndarray:
+    """
+    逐日计算高亮条件：最近15日收盘价波动不超过之前15日的1.1倍，且平均成交量低于之前15日的0.8倍
+    """
+    price_std = indicators.rolling_std(df['收盘'].to_numpy(dtype=float), 15)
+    avg_volume = indicators.rolling_mean(df['成交量'].to_numpy(dtype=float), 15)
+    with np.errstate(invalid='ignore'):
+        # 近期波动率小于或等于前期波动率的1.1倍（允许小幅增加）
+        price_volatility_condition = price_std <= indicators.shift(price_std, 15) * 1.1
+        # 近期平均交易量小于前期平均交易量的 0.8 倍（明显缩量）
+        volume_condition = avg_volume < indicators.shift(avg_volume, 15) * 0.8
+    return price_volatility_condition & volume_condition
+
+
+def analyze_stock_highlight_strategy(df: pd.DataFrame):
+    """
+    分析股票是否符合高亮策略
+    策略：最近半个月价格变化不大，并且交易量比之前是缩量状态
+    """
+    if len(df) < 30:  # 需要至少30天的数据来比较
+        return False
+
+    return bool(highlight_signal_series(df)[-1])
+
+
+def analyze_ma_crossover_strategy(df: pd.DataFrame, short_period=5, long_period=20, include_history=False):
+    """
+    双均线策略分析
+    短期均线上穿长期均线为买入信号，下穿为卖出信号
+    include_history: 同时返回逐日信号的变化点
+    """
+    if len(df) < max(short_period, long_period):
+        return {
+            "signal": "insufficient_data",
+            "current_trend": "unknown",
+            "ma_short": None,
+            "ma_long": None
+        }
+    
+    # 计算移动平均线
+    closes = df['收盘'].to_numpy(dtype=float)
+    ma_short = indicators.rolling_mean(closes, short_period)
+    ma_long = indicators.rolling_mean(closes, long_period)
     
-    # 计算EMA
-    ema_fast = df['收盘'].ewm(span=fast_period).mean()
-    ema_slow = df['收盘'].ewm(span=slow_period).mean()
+    # 逐日信号：金叉买入，死叉卖出
+    signals = crossover_signals(ma_short, ma_long)
     
-    # MACD线 = 快线EMA - 慢线EMA
-    macd_line = ema_fast - ema_slow
+    # 获取最新值
+    current_short = ma_short[-1]
+    current_long = ma_long[-1]
+    
+    # 当前趋势
+    current_trend = "bullish" if current_short > current_long else "bearish"
     
-    # 信号线 = MACD的EMA
-    signal_line = macd_line.ewm(span=signal_period).mean()
+    result = {
+        "signal": signals[-1],
+        "current_trend": current_trend,
+        "ma_short": float(current_short) if pd.notna(current_short) else None,
+        "ma_long": float(current_long) if pd.notna(current_long) else None,
+        "short_period": short_period,
+        "long_period": long_period
+    }
+    if include_history:
+        result["history"] = signal_change_points(signals)
+    return result
+
+
+def calculate_macd(df: pd.DataFrame, fast_period=12, slow_period=26, signal_period=9, adjust=True):
+    """
+    计算MACD指标
+    adjust=True 为 pandas ewm 默认加权口径（原有结果），adjust=False 为券商软件通用的递推口径
+    """
+    if len(df) < slow_period:
+        return None, None, None
     
-    # 柱状图 = MACD - 信号线
-    histogram = macd_line - signal_line
+    # MACD线 = 快线EMA - 慢线EMA，信号线 = MACD的EMA，柱状图 = MACD - 信号线
+    macd_line, signal_line, histogram = indicators.macd(df['收盘'].to_numpy(dtype=float), fast_period, slow_period, signal_period, adjust)
     
-    return macd_line, signal_line, histogram
+    return pd.Series(macd_line, index=df.index), pd.Series(signal_line, index=df.index), pd.Series(histogram, index=df.index)
 
 
-def analyze_macd_strategy(df: pd.DataFrame):
+def analyze_macd_strategy(df: pd.DataFrame, adjust=True, include_history=False):
     """
     MACD策略分析
     MACD上穿信号线为买入信号，下穿为卖出信号
     """
-    macd_line, signal_line, histogram = calculate_macd(df)
+    macd_line, signal_line, histogram = calculate_macd(df, adjust=adjust)
     
     if macd_line is None or signal_line is None or histogram is None:
         return {
@@ -399,73 +1621,49 @@ def analyze_macd_strategy(df: pd.DataFrame):
             "histogram": None
         }
     
+    # 逐日信号：金叉买入，死叉卖出
+    signals = crossover_signals(macd_line, signal_line)
+    
     # 获取最新值
     latest_macd = macd_line.iloc[-1]
     latest_signal = signal_line.iloc[-1]
     latest_histogram = histogram.iloc[-1]
     
-    # 获取前一个值用于判断交叉
-    if len(macd_line) > 1:
-        prev_macd = macd_line.iloc[-2]
-        prev_signal = signal_line.iloc[-2]
-    else:
-        prev_macd = latest_macd
-        prev_signal = latest_signal
-    
-    # 判断信号
-    signal = "hold"
-    if pd.notna(latest_macd) and pd.notna(latest_signal) and pd.notna(prev_macd) and pd.notna(prev_signal):
-        # 金叉：MACD上穿信号线
-        if prev_macd <= prev_signal and latest_macd > latest_signal:
-            signal = "buy"
-        # 死叉：MACD下穿信号线
-        elif prev_macd >= prev_signal and latest_macd < latest_signal:
-            signal = "sell"
-    
     # 当前趋势
     current_trend = "bullish" if latest_macd > latest_signal else "bearish"
     
-    return {
-        "signal": signal,
+    result = {
+        "signal": signals[-1],
         "current_trend": current_trend,
         "macd": float(latest_macd) if pd.notna(latest_macd) else None,
         "signal_line": float(latest_signal) if pd.notna(latest_signal) else None,
         "histogram": float(latest_histogram) if pd.notna(latest_histogram) else None
     }
+    if include_history:
+        result["history"] = signal_change_points(signals)
+    return result
 
 
-def calculate_rsi(df: pd.DataFrame, period=14):
+def calculate_rsi(df: pd.DataFrame, period=14, method="sma"):
     """
     计算RSI指标
+    method: sma 为涨跌幅简单平均（原有结果），wilder 为券商软件通用的 Wilder 平滑
     """
     if len(df) < period + 1:
         return None
     
-    # 计算价格变化
-    delta = df['收盘'].diff()
-    
-    # 分离上涨和下跌
-    gain = delta.where(delta > 0, 0)
-    loss = -delta.where(delta < 0, 0)
-    
-    # 计算平均涨幅和平均跌幅
-    avg_gain = gain.rolling(window=period).mean()
-    avg_loss = loss.rolling(window=period).mean()
+    rsi = indicators.rsi(df['收盘'].to_numpy(dtype=float), period, method)
     
-    # 计算RSI
-    rs = avg_gain / avg_loss
-    rsi = 100 - (100 / (1 + rs))
-    
-    return rsi
+    return pd.Series(rsi, index=df.index)
 
 
-def analyze_rsi_strategy(df: pd.DataFrame, period=14, oversold=30, overbought=70):
+def analyze_rsi_strategy(df: pd.DataFrame, period=14, oversold=30, overbought=70, method="sma", include_history=False):
     """
     RSI策略分析
     RSI < 30 超卖，买入信号
     RSI > 70 超买，卖出信号
     """
-    rsi = calculate_rsi(df, period)
+    rsi = calculate_rsi(df, period, method)
     
     if rsi is None or len(rsi) == 0:
         return {
@@ -476,10 +1674,19 @@ def analyze_rsi_strategy(df: pd.DataFrame, period=14, oversold=30, overbought=70
             "overbought_threshold": overbought
         }
     
+    # 逐日信号
+    rsi_values = rsi.to_numpy(dtype=float)
+    with np.errstate(invalid='ignore'):
+        signals = np.select(
+            [np.isnan(rsi_values), rsi_values <= oversold, rsi_values >= overbought],
+            ["insufficient_data", "buy", "sell"],
+            default="hold"
+        ).astype(object)
+    
     # 获取最新RSI值
-    latest_rsi = rsi.iloc[-1] if hasattr(rsi, 'iloc') else rsi
+    latest_rsi = rsi_values[-1]
     
-    if pd.isna(latest_rsi):
+    if np.isnan(latest_rsi):
         return {
             "signal": "insufficient_data",
             "current_level": "unknown",
@@ -488,24 +1695,19 @@ def analyze_rsi_strategy(df: pd.DataFrame, period=14, oversold=30, overbought=70
             "overbought_threshold": overbought
         }
     
-    # 判断信号
-    signal = "hold"
-    current_level = "normal"
-    
-    if latest_rsi <= oversold:
-        signal = "buy"
-        current_level = "oversold"
-    elif latest_rsi >= overbought:
-        signal = "sell"
-        current_level = "overbought"
+    signal = signals[-1]
+    current_level = {"buy": "oversold", "sell": "overbought"}.get(signal, "normal")
     
-    return {
+    result = {
         "signal": signal,
         "current_level": current_level,
         "rsi": float(latest_rsi),
         "oversold_threshold": oversold,
         "overbought_threshold": overbought
     }
+    if include_history:
+        result["history"] = signal_change_points(signals)
+    return result
 
 
 def calculate_bollinger_bands(df: pd.DataFrame, period=20, std_dev=2):
@@ -515,11 +1717,13 @@ def calculate_bollinger_bands(df: pd.DataFrame, period=20, std_dev=2):
     if len(df) < period:
         return None, None, None
     
+    closes = df['收盘'].to_numpy(dtype=float)
+    
     # 中轨：移动平均线
-    middle_band = df['收盘'].rolling(window=period).mean()
+    middle_band = pd.Series(indicators.rolling_mean(closes, period), index=df.index)
     
     # 标准差
-    std = df['收盘'].rolling(window=period).std()
+    std = pd.Series(indicators.rolling_std(closes, period), index=df.index)
     
     # 上轨和下轨
     upper_band = middle_band + (std * std_dev)
@@ -528,7 +1732,7 @@ def calculate_bollinger_bands(df: pd.DataFrame, period=20, std_dev=2):
     return upper_band, middle_band, lower_band
 
 
-def analyze_bollinger_strategy(df: pd.DataFrame, period=20, std_dev=2):
+def analyze_bollinger_strategy(df: pd.DataFrame, period=20, std_dev=2, include_history=False):
     """
     布林带策略分析
     价格触及下轨买入，触及上轨卖出
@@ -545,13 +1749,23 @@ def analyze_bollinger_strategy(df: pd.DataFrame, period=20, std_dev=2):
             "lower_band": None
         }
     
+    # 逐日信号：价格触及下轨买入，触及上轨卖出
+    prices = df['收盘'].to_numpy(dtype=float)
+    upper, lower = upper_band.to_numpy(dtype=float), lower_band.to_numpy(dtype=float)
+    with np.errstate(invalid='ignore'):
+        signals = np.select(
+            [np.isnan(upper) | np.isnan(lower), prices <= lower, prices >= upper],
+            ["insufficient_data", "buy", "sell"],
+            default="hold"
+        ).astype(object)
+    
     # 获取最新值
-    latest_price = df['收盘'].iloc[-1]
-    latest_upper = upper_band.iloc[-1] if hasattr(upper_band, 'iloc') else upper_band
-    latest_middle = middle_band.iloc[-1] if hasattr(middle_band, 'iloc') else middle_band
-    latest_lower = lower_band.iloc[-1] if hasattr(lower_band, 'iloc') else lower_band
+    latest_price = prices[-1]
+    latest_upper = upper[-1]
+    latest_middle = middle_band.iloc[-1]
+    latest_lower = lower[-1]
     
-    if pd.isna(latest_upper) or pd.isna(latest_lower):
+    if np.isnan(latest_upper) or np.isnan(latest_lower):
         return {
             "signal": "insufficient_data",
             "current_position": "unknown",
@@ -561,23 +1775,18 @@ def analyze_bollinger_strategy(df: pd.DataFrame, period=20, std_dev=2):
             "lower_band": None
         }
     
-    # 判断信号
-    signal = "hold"
-    current_position = "middle"
-    
     # 价格相对于布林带的位置
-    if latest_price <= latest_lower:
-        signal = "buy"
+    signal = signals[-1]
+    if signal == "buy":
         current_position = "lower"
-    elif latest_price >= latest_upper:
-        signal = "sell"
+    elif signal == "sell":
         current_position = "upper"
     elif latest_price > latest_middle:
         current_position = "upper_middle"
     else:
         current_position = "lower_middle"
     
-    return {
+    result = {
         "signal": signal,
         "current_position": current_position,
         "price": float(latest_price),
@@ -586,12 +1795,38 @@ def analyze_bollinger_strategy(df: pd.DataFrame, period=20, std_dev=2):
         "lower_band": float(latest_lower),
         "band_width": float(latest_upper - latest_lower)
     }
+    if include_history:
+        result["history"] = signal_change_points(signals)
+    return result
+
+
+def momentum_signal_series(closes: np.ndarray, dates, lookback_period: int, percentile_threshold: float, stock_code: str = None) -> np.ndarray:
+    """
+    逐日动量信号：当日截面样本足够时按百分位判断，否则按动量绝对值判断
+    """
+    momentum = rolling_momentum(closes[None, :], lookback_period)[0]
+    percentiles = sizes = np.full(len(closes), np.nan)
+    if stock_code:
+        percentiles, sizes = MOMENTUM_UNIVERSE.percentile_history(closes, dates, lookback_period, stock_code)
+    ranked = sizes >= MIN_MOMENTUM_UNIVERSE
+    with np.errstate(invalid='ignore'):
+        return np.select(
+            [np.isnan(momentum),
+             ranked & (percentiles >= percentile_threshold),
+             ranked & (percentiles <= 1 - percentile_threshold),
+             ranked,
+             momentum > 0.15,
+             momentum <= -0.15],
+            ["insufficient_data", "buy", "sell", "hold", "buy", "sell"],
+            default="hold"
+        ).astype(object)
 
 
-def analyze_momentum_strategy(df: pd.DataFrame, lookback_period=20, percentile_threshold=0.8):
+def analyze_momentum_strategy(df: pd.DataFrame, lookback_period=20, percentile_threshold=0.8, stock_code: str = None, include_history=False):
     """
     相对强弱动量策略分析
-    计算过去N天的价格动量，排名前20%的为强势
+    计算过去N天的价格动量，在全部跟踪股票中排名，
+    百分位不低于 percentile_threshold（默认前20%）为强势买入，不高于 1 - percentile_threshold 为弱势卖出
     """
     if len(df) < lookback_period + 1:
         return {
@@ -606,12 +1841,48 @@ def analyze_momentum_strategy(df: pd.DataFrame, lookback_period=20, percentile_t
     past_price = df['收盘'].iloc[-(lookback_period + 1)]
     
     momentum = (current_price / past_price) - 1
+
+    ranking = MOMENTUM_UNIVERSE.rank(stock_code, lookback_period, float(momentum)) if stock_code else None
+    if ranking is not None and ranking["universe_size"] >= MIN_MOMENTUM_UNIVERSE:
+        # 截面排名：按百分位判断动量强度
+        percentile = ranking["percentile"]
+        if percentile >= percentile_threshold:
+            signal = "buy"
+            momentum_strength = "strong"
+        elif percentile <= 1 - percentile_threshold:
+            signal = "sell"
+            momentum_strength = "very_weak"
+        elif percentile >= 0.6:
+            signal = "hold"
+            momentum_strength = "moderate"
+        elif percentile < 0.4:
+            signal = "hold"
+            momentum_strength = "weak"
+        else:
+            signal = "hold"
+            momentum_strength = "normal"
+
+        result = {
+            "signal": signal,
+            "momentum_strength": momentum_strength,
+            "momentum_value": float(momentum),
+            "momentum_percentage": float(momentum * 100),
+            "lookback_period": lookback_period,
+            "ranking_method": "cross_sectional",
+            "percentile": round(percentile, 4),
+            "percentile_threshold": percentile_threshold,
+            "rank": ranking["rank"],
+            "universe_size": ranking["universe_size"]
+        }
+        if include_history:
+            result["history"] = signal_change_points(momentum_signal_series(df['收盘'].to_numpy(dtype=float), df['日期'].astype(str).tolist(), lookback_period, percentile_threshold, stock_code))
+        return result
     
     # 判断动量强度
     signal = "hold"
     momentum_strength = "normal"
     
-    # 简化版本：直接根据动量值判断
+    # 样本不足时退化为按动量绝对值判断
     if momentum > 0.15:  # 15%以上为强势
         signal = "buy"
         momentum_strength = "strong"
@@ -628,16 +1899,21 @@ def analyze_momentum_strategy(df: pd.DataFrame, lookback_period=20, percentile_t
         signal = "sell"
         momentum_strength = "very_weak"
     
-    return {
+    result = {
         "signal": signal,
         "momentum_strength": momentum_strength,
         "momentum_value": float(momentum),
         "momentum_percentage": float(momentum * 100),
-        "lookback_period": lookback_period
+        "lookback_period": lookback_period,
+        "ranking_method": "absolute",
+        "universe_size": ranking["universe_size"] if ranking else 0
     }
+    if include_history:
+        result["history"] = signal_change_points(momentum_signal_series(df['收盘'].to_numpy(dtype=float), df['日期'].astype(str).tolist(), lookback_period, percentile_threshold, stock_code))
+    return result
 
 
-def analyze_breakout_strategy(df: pd.DataFrame, period=20, volume_factor=1.5):
+def analyze_breakout_strategy(df: pd.DataFrame, period=20, volume_factor=1.5, include_history=False):
     """
     突破策略分析
     价格突破N日最高价且成交量放大为买入信号
@@ -652,45 +1928,53 @@ def analyze_breakout_strategy(df: pd.DataFrame, period=20, volume_factor=1.5):
             "volume_ratio": None
         }
     
-    # 获取最新数据
-    current_price = df['收盘'].iloc[-1]
-    current_volume = df['成交量'].iloc[-1]
-    
-    # 计算支撑和阻力位
-    historical_data = df.iloc[-(period + 1):-1]  # 排除当天
-    resistance_level = historical_data['最高'].max()  # N日最高价
-    support_level = historical_data['最低'].min()    # N日最低价
-    avg_volume = historical_data['成交量'].mean()  # 平均成交量
+    # 逐日计算支撑和阻力位（前N日，不含当天）
+    prices = df['收盘'].to_numpy(dtype=float)
+    volumes = df['成交量'].to_numpy(dtype=float)
+    resistance = indicators.shift(indicators.rolling_max(df['最高'].to_numpy(dtype=float), period))  # N日最高价
+    support = indicators.shift(indicators.rolling_min(df['最低'].to_numpy(dtype=float), period))    # N日最低价
+    avg_volume = indicators.shift(indicators.rolling_mean(volumes, period))  # 平均成交量
     
     # 计算成交量比值
-    volume_ratio = current_volume / avg_volume if avg_volume > 0 else 1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        volume_ratio = np.where(avg_volume > 0, volumes / avg_volume, 1.0)
+        # 上方突破买入，下方突破卖出
+        signals = np.select(
+            [np.isnan(resistance),
+             (prices > resistance) & (volume_ratio >= volume_factor),
+             (prices < support) & (volume_ratio >= volume_factor)],
+            ["insufficient_data", "buy", "sell"],
+            default="hold"
+        ).astype(object)
+    
+    # 获取最新数据
+    current_price = prices[-1]
+    resistance_level = resistance[-1]
+    support_level = support[-1]
     
     # 判断突破类型
-    signal = "hold"
+    signal = signals[-1]
     breakout_type = "none"
-    
-    # 上方突破
-    if current_price > resistance_level and volume_ratio >= volume_factor:
-        signal = "buy"
+    if signal == "buy":
         breakout_type = "upward_breakout"
-    # 下方突破
-    elif current_price < support_level and volume_ratio >= volume_factor:
-        signal = "sell"
+    elif signal == "sell":
         breakout_type = "downward_breakout"
     # 接近突破但成交量不足
     elif current_price > resistance_level * 0.98 or current_price < support_level * 1.02:
-        signal = "hold"
         breakout_type = "potential_breakout"
     
-    return {
+    result = {
         "signal": signal,
         "breakout_type": breakout_type,
         "current_price": float(current_price),
         "resistance_level": float(resistance_level),
         "support_level": float(support_level),
-        "volume_ratio": float(volume_ratio),
+        "volume_ratio": float(volume_ratio[-1]),
         "volume_threshold": volume_factor
     }
+    if include_history:
+        result["history"] = signal_change_points(signals)
+    return result
 
 
 def get_real_fundamental_data_with_cache(stock_code: str):
@@ -704,26 +1988,38 @@ def get_real_fundamental_data_with_cache(stock_code: str):
         print(f"使用缓存数据: {stock_code}")
         return cached_data
     
-    # 2. 缓存未命中，获取新数据
+    # 2. 上游最近拉取失败时，有效期内直接使用后备数据，不再请求上游
+    lease_key = f"fundamental:{stock_code}"
+    if NEGATIVE_CACHE.get(lease_key) is not None:
+        return get_fundamental_data_fallback(stock_code)
+
+    # 3. 缓存未命中，其他 worker 正在拉取时等待其结果
+    lease_token = acquire_fetch_lease(lease_key)
+    if lease_token is None:
+        cached_data = wait_for_shared_cache(lambda: get_fundamental_cache(stock_code) or NEGATIVE_CACHE.get(lease_key))
+        if isinstance(cached_data, NegativeCacheHit):
+            return get_fundamental_data_fallback(stock_code)
+        if cached_data:
+            return cached_data
+    
+    # 4. 获取新数据
     try:
         print(f"获取新数据: {stock_code}")
         data = get_real_fundamental_data(stock_code)
         
-        # 3. 保存到缓存
-        save_fundamental_cache(stock_code, data, expires_hours=6)  # 6小时过期
+        # 5. 保存到缓存
+        save_fundamental_cache(stock_code, data)  # 有效至下一个披露窗口或交易日收盘
         
         return data
         
     except Exception as e:
-        # 4. 记录错误并返回后备数据
+        # 6. 记录失败（负缓存）并返回后备数据；后备数据是模拟值，不写入基本面缓存
         log_error(stock_code, "fundamental_data_fetch", str(e))
         print(f"获取真实数据失败，使用后备数据: {stock_code}, 错误: {e}")
-        
-        fallback_data = get_fundamental_data_fallback(stock_code)
-        # 也缓存后备数据，但过期时间较短
-        save_fundamental_cache(stock_code, fallback_data, expires_hours=1)
-        
-        return fallback_data
+        NEGATIVE_CACHE.put(lease_key, UPSTREAM_ERROR, str(e))
+        return get_fundamental_data_fallback(stock_code)
+    finally:
+        release_fetch_lease(lease_key, lease_token)
 
 def get_real_fundamental_data(stock_code: str):
     try:
@@ -852,8 +2148,8 @@ def get_real_fundamental_data(stock_code: str):
         
     except Exception as e:
         print(f"获取真实基本面数据失败 {stock_code}: {e}")
-        # 如果获取真实数据失败，返回默认数据结构
-        return get_fundamental_data_fallback(stock_code)
+        # 由调用方记录失败并决定是否使用后备数据，后备数据不能当作真实数据写入缓存
+        raise
 
 
 def get_timely_financial_data(stock_code: str):
@@ -1066,6 +2362,23 @@ def analyze_peg_strategy(stock_code: str):
         }
 
 
+def industry_relative_valuation(stock_code: str, weights: Dict[str, float]):
+    """
+    行业相对估值：股票各指标在所属行业内的百分位、z 分数及按 weights 加权的相对评分
+    行业样本不足时不给出相对评分
+    """
+    stats = INDUSTRY_VALUATION.lookup(stock_code)
+    if stats is None:
+        return {"available": False, "reason": "不在基本面宽表中"}
+    if stats["peer_count"] < MIN_INDUSTRY_PEERS:
+        return {"available": False, "reason": "行业样本不足", **stats}
+    return {
+        "available": True,
+        "relative_score": relative_score(stats["percentiles"], weights),
+        **stats
+    }
+
+
 def analyze_value_factor_strategy(stock_code: str):
     """
     价值因子策略分析（使用真实数据）
@@ -1082,48 +2395,24 @@ def analyze_value_factor_strategy(stock_code: str):
         debt_ratio = fundamental_data['debt_ratio']
         data_source = fundamental_data.get('data_source', 'unknown')
         
-        # 计算各项评分（优化评分算法）
-        # PE评分：低 PE 更好，最伸25%权重
-        pe_score = max(0, min(25, (50 - pe_ratio) / 50 * 25)) if pe_ratio > 0 else 0
-        
-        # PB评分：低 PB 更好，最伸20%权重  
-        pb_score = max(0, min(20, (10 - pb_ratio) / 10 * 20)) if pb_ratio > 0 else 0
-        
-        # 股息率评分：高股息率更好，最伸15%权重
-        dividend_score = min(15, dividend_yield / 8 * 15) if dividend_yield >= 0 else 0
-        
-        # ROE评分：高ROE更好，最伸25%权重
-        roe_score = min(25, roe / 25 * 25) if roe > 0 else 0
-        
-        # 资产负债率评分：低负债率更好，最伸15%权重
-        debt_score = max(0, min(15, (100 - debt_ratio) / 100 * 15)) if debt_ratio >= 0 else 0
-        
-        total_score = pe_score + pb_score + dividend_score + roe_score + debt_score
-        
-        # 判断信号（优化阈值）
-        signal = "hold"
-        value_level = "fair"
-        
-        if total_score >= 85:
-            signal = "buy"
-            value_level = "excellent"
-        elif total_score >= 70:
-            signal = "buy"
-            value_level = "good"
-        elif total_score >= 50:
-            signal = "hold"
-            value_level = "fair"
-        elif total_score >= 30:
-            signal = "sell"
-            value_level = "poor"
-        else:
-            signal = "sell"
-            value_level = "very_poor"
+        # 计算各项评分（与全市场批量评分共用同一套向量化规则）；行业样本充足时 PE、PB、ROE、负债率按行业百分位计分
+        scores = score_value_factors(pd.DataFrame([fundamental_data], index=[stock_code]),
+                                     percentiles=INDUSTRY_VALUATION.percentile_frame([stock_code]))
+        pe_score = scores['pe_score'].iloc[0].item()
+        pb_score = scores['pb_score'].iloc[0].item()
+        dividend_score = scores['dividend_score'].iloc[0].item()
+        roe_score = scores['roe_score'].iloc[0].item()
+        debt_score = scores['debt_score'].iloc[0].item()
+        total_score = scores['total_score'].iloc[0].item()
+        signal = str(scores['signal'].iloc[0])
+        value_level = str(scores['value_level'].iloc[0])
+        scoring_basis = "industry_relative" if scores['industry_relative'].iloc[0] else "absolute"
         
         return {
             "signal": signal,
             "total_score": round(total_score, 1),
             "value_level": value_level,
+            "scoring_basis": scoring_basis,
             "pe_ratio": pe_ratio,
             "pb_ratio": pb_ratio,
             "dividend_yield": dividend_yield,
@@ -1140,7 +2429,10 @@ def analyze_value_factor_strategy(stock_code: str):
             "stock_name": fundamental_data.get('stock_name', ''),
             "market_cap": fundamental_data.get('market_cap', 0),
             "industry": fundamental_data.get('industry', ''),
-            "current_price": fundamental_data.get('current_price', 0)
+            "current_price": fundamental_data.get('current_price', 0),
+            "industry_relative": industry_relative_valuation(stock_code, {
+                "pe_ratio": 25, "pb_ratio": 20, "roe": 25, "debt_ratio": 15
+            })
         }
         
     except Exception as e:
@@ -1162,6 +2454,702 @@ def analyze_value_factor_strategy(stock_code: str):
 
 
 
+def load_price_history(stock_code: str):
+    """
+    获取最近一年的日线数据（优先使用缓存）
+    返回 (DataFrame, 行情数据版本号)
+    """
+    cached_entry = get_price_cache_entry(stock_code)
+    if cached_entry:
+        cached_rows, price_version = cached_entry
+        return pd.DataFrame(cached_rows), price_version
+
+    # 上游最近对该股票返回空数据或报错时，有效期内直接返回，不再请求上游
+    lease_key = f"price:{stock_code}"
+    hit = NEGATIVE_CACHE.get(lease_key)
+    if hit is None:
+        lease_token = acquire_fetch_lease(lease_key)
+        if lease_token is None:
+            # 其他 worker 正在拉取同一只股票，等待其写入共享缓存（或失败结果）
+            cached_entry = wait_for_shared_cache(lambda: get_price_cache_entry(stock_code) or NEGATIVE_CACHE.get(lease_key))
+            if isinstance(cached_entry, NegativeCacheHit):
+                hit = cached_entry
+            elif cached_entry:
+                cached_rows, price_version = cached_entry
+                return pd.DataFrame(cached_rows), price_version
+    if hit is not None:
+        if hit.error_class == NOT_FOUND:
+            return pd.DataFrame(), None
+        raise hit
+    try:
+        return fetch_price_history(stock_code)
+    finally:
+        release_fetch_lease(lease_key, lease_token)
+
+
+def fetch_price_history(stock_code: str):
+    """
+    拉取最近一年的日线数据，计算前复权行情并写入缓存
+    已有原始日线时只拉取最后一根之后的新K线追加；复权因子每次重新拉取（数据量很小），
+    前复权行情在本地由原始日线和因子计算。因子不可用且本地没有因子时退回直接拉取前复权数据
+    """
+    end_date = datetime.now().strftime('%Y%m%d')
+    start_date = (datetime.now() - timedelta(days=365)).strftime('%Y%m%d')
+    raw_rows = get_raw_bars(stock_code) or []
+    fetch_from = start_date
+    if raw_rows and str(raw_rows[-1]['日期'])[:10].replace('-', '') >= start_date:
+        # 从最后一根K线当天开始拉取，盘中写入的当日K线收盘后会被更新
+        fetch_from = str(raw_rows[-1]['日期'])[:10].replace('-', '')
+    else:
+        raw_rows = []
+    try:
+        new_df = ak.stock_zh_a_hist(symbol=stock_code, period="daily", start_date=fetch_from, end_date=end_date, adjust="")
+        if new_df.empty and not raw_rows:
+            NEGATIVE_CACHE.put(f"price:{stock_code}", NOT_FOUND, "上游未返回行情数据")
+            return pd.DataFrame(), None
+        factors = None
+        try:
+            factors = fetch_adjust_factors(stock_code)
+        except Exception as e:
+            log_error(stock_code, "adjust_factor_fetch", str(e))
+        if factors is None and not get_adjust_factors(stock_code):
+            return fetch_qfq_price_history(stock_code, start_date, end_date)
+    except Exception as e:
+        NEGATIVE_CACHE.put(f"price:{stock_code}", UPSTREAM_ERROR, str(e))
+        raise
+
+    if not new_df.empty:
+        new_df['日期'] = new_df['日期'].astype(str)
+    window_start = f"{start_date[:4]}-{start_date[4:6]}-{start_date[6:]}"
+    raw_rows = merge_bars(raw_rows, new_df.to_dict(orient='records'), window_start)
+    if not raw_rows:
+        NEGATIVE_CACHE.put(f"price:{stock_code}", NOT_FOUND, "上游未返回行情数据")
+        return pd.DataFrame(), None
+    save_raw_bars(stock_code, raw_rows, factors)
+    rows = adjust_rows(raw_rows, factors if factors is not None else get_adjust_factors(stock_code), "qfq")
+    price_version = save_price_cache(stock_code, rows)
+    return pd.DataFrame(rows), price_version
+
+
+def fetch_qfq_price_history(stock_code: str, start_date: str, end_date: str):
+    """直接从上游拉取前复权日线并写入缓存（复权因子不可用时使用，不保存原始日线）"""
+    stock_zh_a_hist_df = ak.stock_zh_a_hist(symbol=stock_code, period="daily", start_date=start_date, end_date=end_date, adjust="qfq")
+    price_version = None
+    if not stock_zh_a_hist_df.empty:
+        stock_zh_a_hist_df['日期'] = stock_zh_a_hist_df['日期'].astype(str)
+        rows = stock_zh_a_hist_df.to_dict(orient='records')
+        price_version = save_price_cache(stock_code, rows)
+    else:
+        NEGATIVE_CACHE.put(f"price:{stock_code}", NOT_FOUND, "上游未返回行情数据")
+    return stock_zh_a_hist_df, price_version
+
+
+def load_index_history(index_code: str):
+    """
+    获取指数最近一年的日线数据（缓存在 price_cache 中，键为 index:代码），返回行情行列表
+    """
+    cache_key = f"index:{index_code}"
+    cached_rows = get_price_cache(cache_key)
+    if cached_rows:
+        return cached_rows
+    lease_key = f"price:{cache_key}"
+    hit = NEGATIVE_CACHE.get(lease_key)
+    if hit is None:
+        lease_token = acquire_fetch_lease(lease_key)
+        if lease_token is None:
+            cached_rows = wait_for_shared_cache(lambda: get_price_cache(cache_key) or NEGATIVE_CACHE.get(lease_key))
+            if isinstance(cached_rows, NegativeCacheHit):
+                hit = cached_rows
+            elif cached_rows:
+                return cached_rows
+    if hit is not None:
+        if hit.error_class == NOT_FOUND:
+            return []
+        raise hit
+    try:
+        end_date = datetime.now().strftime('%Y%m%d')
+        start_date = (datetime.now() - timedelta(days=365)).strftime('%Y%m%d')
+        try:
+            index_df = ak.index_zh_a_hist(symbol=index_code, period="daily", start_date=start_date, end_date=end_date)
+        except Exception as e:
+            NEGATIVE_CACHE.put(lease_key, UPSTREAM_ERROR, str(e))
+            raise
+        if index_df.empty:
+            NEGATIVE_CACHE.put(lease_key, NOT_FOUND, "上游未返回指数数据")
+            return []
+        index_df['日期'] = index_df['日期'].astype(str)
+        rows = index_df[['日期', '收盘']].to_dict(orient='records')
+        save_price_cache(cache_key, rows, adjust='')
+        return rows
+    finally:
+        release_fetch_lease(lease_key, lease_token)
+
+def load_portfolio_closes(stock_codes: List[str]) -> Dict[str, Any]:
+    """
+    批量获取持仓的 (日期, 收盘价)：先一次查询读取全部缓存，未命中的并发拉取
+    返回 股票代码 -> (日期列表, 收盘价列表)，获取失败的股票不出现
+    """
+    entries = get_price_cache_entries(stock_codes)
+    missing = [code for code in stock_codes if code not in entries]
+
+    def fetch(stock_code):
+        try:
+            df, _ = load_price_history(stock_code)
+            return stock_code, df.to_dict(orient='records')
+        except Exception as e:
+            log_error(stock_code, "portfolio_price_fetch", str(e))
+            return stock_code, []
+
+    if missing:
+        with ThreadPoolExecutor(max_workers=min(8, len(missing)), thread_name_prefix="portfolio") as executor:
+            entries.update(executor.map(fetch, missing))
+    closes = {}
+    for stock_code, rows in entries.items():
+        if rows:
+            closes[stock_code] = ([str(r['日期'])[:10] for r in rows], [float(r['收盘']) for r in rows])
+    return closes
+
+def get_signal_rows(stock_codes: List[str]):
+    """读取一组股票各策略的最新信号 [(股票代码, 策略, 信号)]"""
+    conn = get_db_connection()
+    try:
+        rows = []
+        for start in range(0, len(stock_codes), 500):
+            chunk = stock_codes[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            rows.extend(conn.execute(
+                f'SELECT stock_code, strategy, signal FROM stock_signals WHERE stock_code IN ({placeholders})', chunk
+            ).fetchall())
+        return rows
+    finally:
+        conn.close()
+
+def analyze_portfolio_request(request: PortfolioRequest) -> Dict[str, Any]:
+    """组合分析：对齐收益率矩阵后一次性计算相关性、波动率、beta，并汇总各策略信号"""
+    if request.holdings:
+        weights = {}
+        for holding in request.holdings:
+            stock_code = check_stock_code(holding.stock_code)
+            weights[stock_code] = weights.get(stock_code, 0.0) + holding.weight
+    else:
+        weights = {code: 1.0 for code in get_saved_stock_codes()}
+    if not weights:
+        raise ValueError("组合为空：请传入持仓或先添加股票")
+
+    closes = load_portfolio_closes(list(weights))
+    codes = [code for code in weights if code in closes]
+    missing = [code for code in weights if code not in closes]
+    if not codes:
+        raise ValueError("没有可用的行情数据")
+
+    series = [closes[code] for code in codes]
+    benchmark_rows = []
+    if request.benchmark:
+        try:
+            benchmark_rows = load_index_history(request.benchmark)
+        except Exception as e:
+            log_error(None, "benchmark_fetch", str(e))
+    if benchmark_rows:
+        series.append(([str(r['日期'])[:10] for r in benchmark_rows], [float(r['收盘']) for r in benchmark_rows]))
+    dates, panel = portfolio.align_closes(series)
+    # 只保留持仓有数据的交易日（指数比个股多出的日期不参与计算）
+    traded = np.isfinite(panel[:len(codes)]).any(axis=0)
+    dates, panel = dates[traded], panel[:, traded]
+    returns = portfolio.daily_returns(panel)
+    benchmark_returns = returns[len(codes)] if benchmark_rows else None
+
+    weight_vector = np.array([weights[code] for code in codes])
+    result = portfolio.analyze_portfolio(returns[:len(codes)], weight_vector, benchmark_returns)
+    normalized = dict(zip(codes, result["weights"].tolist()))
+    return {
+        "stock_codes": codes,
+        "missing": missing,
+        "benchmark": request.benchmark if benchmark_rows else None,
+        "start_date": str(dates[0]) if len(dates) else None,
+        "end_date": str(dates[-1]) if len(dates) else None,
+        "trading_days": int(returns.shape[1]),
+        "portfolio": {
+            "volatility": round(result["portfolio_volatility"], 6),
+            "beta": round(result["portfolio_beta"], 6) if result["portfolio_beta"] is not None else None,
+        },
+        "holdings": [
+            {
+                "stock_code": code,
+                "weight": round(normalized[code], 6),
+                "volatility": volatility,
+                "beta": beta,
+                "risk_contribution": contribution,
+            }
+            for code, volatility, beta, contribution in zip(
+                codes,
+                portfolio.finite_list(result["volatility"]),
+                portfolio.finite_list(result["beta"]),
+                portfolio.finite_list(result["risk_contribution"]),
+            )
+        ],
+        "correlation": portfolio.finite_list(result["correlation"], 4),
+        "covariance": portfolio.finite_list(result["covariance"]),
+        "signals": portfolio.summarize_signals(get_signal_rows(codes), normalized),
+    }
+
+
+# 策略参数默认值（与接口查询参数的默认值一致）
+DEFAULT_STRATEGY_PARAMS = {
+    "ma_short": 5,
+    "ma_long": 20,
+    "rsi_period": 14,
+    "rsi_oversold": 30,
+    "rsi_overbought": 70,
+    # RSI 平均方式：sma 或 wilder
+    "rsi_method": "sma",
+    # MACD 的 EMA 口径：True 为 pandas 默认加权，False 为递推（与券商软件一致）
+    "macd_adjust": True,
+    "boll_period": 20,
+    "boll_std": 2,
+    "momentum_lookback": 20,
+    "momentum_percentile": 0.8,
+    "breakout_period": 20,
+    "breakout_volume_factor": 1.5,
+    # 是否返回各技术策略的逐日信号变化点
+    "signal_history": False,
+}
+
+# 策略依赖的数据：prices 日线行情，universe 全市场动量排名，
+# fundamentals 基本面（策略内部按需拉取），industry 行业估值分布
+STRATEGY_DEPENDENCIES = {
+    "highlight_strategy": {"prices"},
+    "ma_crossover": {"prices"},
+    "macd": {"prices"},
+    "rsi": {"prices"},
+    "bollinger_bands": {"prices"},
+    "momentum": {"prices", "universe"},
+    "breakout": {"prices"},
+    "peg": {"fundamentals"},
+    "value_factor": {"fundamentals", "industry"},
+    "financial_health": {"fundamentals", "industry"},
+}
+STRATEGY_GROUPS = {
+    "technical": [name for name, needs in STRATEGY_DEPENDENCIES.items() if "fundamentals" not in needs],
+    "fundamental": [name for name, needs in STRATEGY_DEPENDENCIES.items() if "fundamentals" in needs],
+}
+
+def select_strategies(strategies=None) -> List[str]:
+    """
+    解析策略选择：逗号分隔的字符串或列表，可使用策略组 technical / fundamental / all，缺省为全部
+    返回按 STRATEGY_DEPENDENCIES 顺序排列的策略名，未知名称抛出 ValueError
+    """
+    if isinstance(strategies, str):
+        strategies = strategies.split(',')
+    names = [name.strip() for name in strategies or [] if name and name.strip()]
+    if not names or 'all' in names:
+        return list(STRATEGY_DEPENDENCIES)
+    selected = set()
+    for name in names:
+        if name in STRATEGY_GROUPS:
+            selected.update(STRATEGY_GROUPS[name])
+        elif name in STRATEGY_DEPENDENCIES:
+            selected.add(name)
+        else:
+            raise ValueError(f"未知策略: {name}，可选: {', '.join(list(STRATEGY_DEPENDENCIES) + list(STRATEGY_GROUPS))}")
+    return [name for name in STRATEGY_DEPENDENCIES if name in selected]
+
+def strategy_needs(strategies: List[str]) -> set:
+    """所选策略依赖的数据集合"""
+    return set().union(*(STRATEGY_DEPENDENCIES[name] for name in strategies))
+
+def resolve_stock_name(stock_code: str) -> str:
+    """
+    股票名称：依次使用代码名称列表、已保存的快照、基本面宽表，都没有时才请求上游接口
+    """
+    listed_name = STOCK_SEARCH.name(stock_code)
+    if listed_name:
+        return listed_name
+    conn = get_db_connection()
+    try:
+        for query in ('SELECT stock_name FROM stocks WHERE stock_code = ?',
+                      'SELECT stock_name FROM fundamental_universe WHERE stock_code = ?'):
+            row = conn.execute(query, (stock_code,)).fetchone()
+            if row and row[0]:
+                return row[0]
+    finally:
+        conn.close()
+    stock_info = ak.stock_individual_info_em(symbol=stock_code)
+    return str(stock_info.value[stock_info['item'] == '股票简称'].iloc[0])
+
+def stock_name_or_code(stock_code: str) -> str:
+    """股票名称，获取失败时记录错误并暂用股票代码（名称不影响分析结果）"""
+    try:
+        return resolve_stock_name(stock_code)
+    except Exception as e:
+        log_error(stock_code, "stock_name", str(e))
+        return stock_code
+
+def get_saved_strategies(stock_code: str) -> Dict[str, Any]:
+    """读取已保存快照中的策略结果，没有快照时返回空字典"""
+    conn = get_db_connection()
+    try:
+        row = conn.execute('SELECT strategies FROM stocks WHERE stock_code = ?', (stock_code,)).fetchone()
+    finally:
+        conn.close()
+    try:
+        return json.loads(row[0]) if row and row[0] else {}
+    except Exception:
+        return {}
+
+
+def highlight_strategy_result(df: pd.DataFrame, include_history=False):
+    """高亮策略结果，include_history 时附带逐日高亮状态的变化点"""
+    result = {
+        "result": analyze_stock_highlight_strategy(df),
+        "description": "价格稳定性分析和缩量分析"
+    }
+    if include_history:
+        result["history"] = signal_change_points(highlight_signal_series(df).astype(object))
+    return result
+
+
+def run_technical_strategies(stock_code: str, df: pd.DataFrame, price_version, params: Dict[str, Any], selected: List[str]):
+    """运行所选的技术策略（只依赖行情）"""
+    needs = strategy_needs(selected)
+    history = bool(params.get('signal_history'))
+    # 排名依赖全市场行情，排名数据版本作为参数的一部分参与缓存键
+    momentum_version = MOMENTUM_UNIVERSE.refresh() if "universe" in needs else None
+    technical_strategies = {
+        "highlight_strategy": ((history,), lambda: highlight_strategy_result(df.copy(), history)),
+        # 趋势跟踪策略
+        "ma_crossover": ((params['ma_short'], params['ma_long'], history), lambda: analyze_ma_crossover_strategy(df.copy(), short_period=params['ma_short'], long_period=params['ma_long'], include_history=history)),
+        "macd": ((params['macd_adjust'], history), lambda: analyze_macd_strategy(df.copy(), adjust=params['macd_adjust'], include_history=history)),
+        # 均值回归策略
+        "rsi": ((params['rsi_period'], params['rsi_oversold'], params['rsi_overbought'], params['rsi_method'], history), lambda: analyze_rsi_strategy(df.copy(), period=params['rsi_period'], oversold=params['rsi_oversold'], overbought=params['rsi_overbought'], method=params['rsi_method'], include_history=history)),
+        "bollinger_bands": ((params['boll_period'], params['boll_std'], history), lambda: analyze_bollinger_strategy(df.copy(), period=params['boll_period'], std_dev=params['boll_std'], include_history=history)),
+        # 动量策略
+        "momentum": ((params['momentum_lookback'], params['momentum_percentile'], momentum_version, history), lambda: analyze_momentum_strategy(df.copy(), lookback_period=params['momentum_lookback'], percentile_threshold=params['momentum_percentile'], stock_code=stock_code, include_history=history)),
+        "breakout": ((params['breakout_period'], params['breakout_volume_factor'], history), lambda: analyze_breakout_strategy(df.copy(), period=params['breakout_period'], volume_factor=params['breakout_volume_factor'], include_history=history)),
+    }
+
+    strategies_result = {}
+    for name, (strategy_params, compute) in technical_strategies.items():
+        if name not in selected:
+            continue
+        key = (stock_code, name, strategy_params, price_version, None)
+        result = STRATEGY_RESULT_CACHE.get(key) if price_version is not None else None
+        if result is None:
+            result = compute()
+            if price_version is not None:
+                STRATEGY_RESULT_CACHE.put(key, result)
+        strategies_result[name] = result
+    return strategies_result
+
+
+def run_fundamental_strategies(stock_code: str, selected: List[str]):
+    """运行所选的基本面策略（缓存未命中时策略内部拉取基本面数据）"""
+    needs = strategy_needs(selected)
+    if "fundamentals" not in needs:
+        return {}
+    # 基本面量化策略
+    # 行业相对评分依赖全市场基本面，行业分布版本作为参数参与缓存键
+    industry_version = INDUSTRY_VALUATION.refresh() if "industry" in needs else None
+    fundamental_strategies = {
+        "peg": ((), analyze_peg_strategy),
+        "value_factor": ((industry_version,), analyze_value_factor_strategy),
+        "financial_health": ((industry_version,), analyze_financial_health_strategy),
+    }
+
+    strategies_result = {}
+    fundamental_version = get_fundamental_cache_version(stock_code)
+    computed = []
+    for name, (strategy_params, analyze) in fundamental_strategies.items():
+        if name not in selected:
+            continue
+        key = (stock_code, name, strategy_params, None, fundamental_version)
+        result = STRATEGY_RESULT_CACHE.get(key) if fundamental_version is not None else None
+        if result is None:
+            result = analyze(stock_code)
+            computed.append(name)
+        strategies_result[name] = result
+
+    if computed:
+        # 缓存未命中时策略内部会拉取并写入基本面缓存，按写入后的版本保存结果
+        fundamental_version = get_fundamental_cache_version(stock_code)
+        if fundamental_version is not None:
+            for name in computed:
+                if 'error' not in strategies_result[name]:
+                    strategy_params = fundamental_strategies[name][0]
+                    STRATEGY_RESULT_CACHE.put((stock_code, name, strategy_params, None, fundamental_version), strategies_result[name])
+
+    return strategies_result
+
+
+def run_strategies(stock_code: str, df: pd.DataFrame, price_version, params: Dict[str, Any], strategies: List[str] = None):
+    """
+    运行策略分析，strategies 为要运行的策略名（缺省为全部），只准备所选策略依赖的数据
+    结果按 (股票代码, 策略名, 参数, 行情版本, 基本面版本) 记忆化，数据未更新时直接复用
+    """
+    selected = strategies or list(STRATEGY_DEPENDENCIES)
+    strategies_result = run_technical_strategies(stock_code, df, price_version, params, selected)
+    strategies_result.update(run_fundamental_strategies(stock_code, selected))
+    return strategies_result
+
+
+def wait_until(future, deadline_at: Optional[float]):
+    """
+    等待后台任务到截止时间（time.monotonic 时刻，None 表示不限时）
+    返回 (是否完成, 结果)；超时的任务继续在后台执行，任务抛出的异常原样抛出
+    """
+    timeout = None if deadline_at is None else max(0.0, deadline_at - time.monotonic())
+    try:
+        return True, future.result(timeout=timeout)
+    except FutureTimeoutError:
+        return False, None
+
+
+def gather_analysis(stock_code: str, params: Dict[str, Any], selected: List[str], deadline_ms: int = 0, need_name: bool = False):
+    """
+    准备行情、股票名称并运行所选策略
+    deadline_ms > 0 时行情、股票名称、基本面策略并发执行，到截止时间仍未完成的部分：
+    - 行情：使用已过期的行情缓存，没有缓存时返回 504
+    - 股票名称：暂用股票代码（获取失败时同样如此）
+    - 基本面策略：使用已保存快照中的结果（标记 stale），没有时标记为 pending
+    返回 {"df", "price_version", "stock_name", "strategies", "pending": 未完成的策略名,
+          "futures": 仍在后台执行的任务（字段名 -> Future）}
+    """
+    needs = strategy_needs(selected)
+    if not deadline_ms or deadline_ms <= 0:
+        df, price_version = pd.DataFrame(), None
+        if "prices" in needs:
+            df, price_version = load_price_history(stock_code)
+            if df.empty:
+                raise HTTPException(status_code=404, detail="未找到该股票代码的数据")
+        return {
+            "df": df,
+            "price_version": price_version,
+            "stock_name": stock_name_or_code(stock_code) if need_name else None,
+            "strategies": run_strategies(stock_code, df, price_version, params, selected),
+            "pending": [],
+            "futures": {},
+        }
+
+    deadline_at = time.monotonic() + deadline_ms / 1000
+    # 基本面最慢且不依赖行情，最先提交
+    fundamental_future = ANALYSIS_EXECUTOR.submit(run_fundamental_strategies, stock_code, selected) if "fundamentals" in needs else None
+    name_future = ANALYSIS_EXECUTOR.submit(stock_name_or_code, stock_code) if need_name else None
+    futures = {}
+
+    df, price_version = pd.DataFrame(), None
+    if "prices" in needs:
+        done, loaded = wait_until(PRICE_EXECUTOR.submit(load_price_history, stock_code), deadline_at)
+        if done:
+            df, price_version = loaded
+        else:
+            stale_entry = get_price_cache_entry(stock_code, include_expired=True)
+            if stale_entry is None:
+                raise HTTPException(status_code=504, detail="行情数据获取超时，后台仍在获取，请稍后重试")
+            df, price_version = pd.DataFrame(stale_entry[0]), stale_entry[1]
+        if df.empty:
+            raise HTTPException(status_code=404, detail="未找到该股票代码的数据")
+    strategies_result = run_technical_strategies(stock_code, df, price_version, params, selected)
+
+    stock_name = None
+    if name_future is not None:
+        done, stock_name = wait_until(name_future, deadline_at)
+        if not done:
+            futures["stock_name"] = name_future
+            stock_name = stock_code
+
+    pending = []
+    if fundamental_future is not None:
+        done, fundamental_result = wait_until(fundamental_future, deadline_at)
+        if done:
+            strategies_result.update(fundamental_result)
+        else:
+            futures["strategies"] = fundamental_future
+            saved = get_saved_strategies(stock_code)
+            for name in selected:
+                if "fundamentals" not in STRATEGY_DEPENDENCIES[name]:
+                    continue
+                pending.append(name)
+                if isinstance(saved.get(name), dict) and 'error' not in saved[name] and 'status' not in saved[name]:
+                    strategies_result[name] = {**saved[name], "stale": True}
+                else:
+                    strategies_result[name] = {"status": "pending", "description": "数据获取中，完成后更新快照"}
+
+    return {
+        "df": df,
+        "price_version": price_version,
+        "stock_name": stock_name,
+        "strategies": {name: strategies_result[name] for name in STRATEGY_DEPENDENCIES if name in strategies_result},
+        "pending": pending,
+        "futures": futures,
+    }
+
+
+def merge_snapshot(stock_code: str, strategies: Dict[str, Any] = None, stock_name: str = None):
+    """把后台完成的策略结果（及股票名称）合并进已保存快照，快照不存在时忽略"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        row = cursor.execute('SELECT strategies FROM stocks WHERE stock_code = ?', (stock_code,)).fetchone()
+        if row is None:
+            conn.rollback()
+            return None
+        merged = {**json.loads(row[0] or '{}'), **(strategies or {})}
+        snapshot_version = next_snapshot_version(cursor)
+        cursor.execute('''
+        UPDATE stocks SET strategies = ?, stock_name = COALESCE(?, stock_name), snapshot_version = ?,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE stock_code = ?
+        ''', (json.dumps(merged, ensure_ascii=False, default=str), stock_name, snapshot_version, stock_code))
+        cursor.executemany(
+            'INSERT OR REPLACE INTO stock_signals (stock_code, strategy, signal) VALUES (?, ?, ?)',
+            extract_signal_rows(stock_code, strategies or {})
+        )
+        conn.commit()
+        return snapshot_version
+    finally:
+        conn.close()
+
+
+def merge_when_done(stock_code: str, futures: Dict[str, Any]):
+    """截止时间后仍在执行的任务完成时合并进快照，客户端通过 /api/stocks?since= 增量同步"""
+    def merge(field):
+        def callback(future):
+            try:
+                merge_snapshot(stock_code, **{field: future.result()})
+            except Exception as e:
+                log_error(stock_code, "deferred_analysis", str(e))
+        return callback
+
+    for field, future in futures.items():
+        future.add_done_callback(merge(field))
+
+
+def chart_series(records: List[Dict[str, Any]]):
+    """K线图数据：([日期, 开盘, 收盘, 最低, 最高], [日期, 成交量])"""
+    k_line_data = [[str(r['日期']), float(r['开盘']), float(r['收盘']), float(r['最低']), float(r['最高'])] for r in records]
+    volume_data = [[str(r['日期']), float(r['成交量'])] for r in records]
+    return k_line_data, volume_data
+
+def load_adjusted_bars(stock_code: str, adjust: str = "qfq"):
+    """
+    按复权方式返回最近一年的日线：qfq 直接使用行情缓存，hfq / none 由原始日线和复权因子在本地计算
+    返回 (行情行列表, 行情数据版本号)；原始日线或因子更新时前复权缓存同时更新，版本号对三种方式都适用
+    """
+    if adjust not in ADJUST_MODES:
+        raise ValueError(f"复权方式只支持: {', '.join(ADJUST_MODES)}")
+    df, price_version = load_price_history(stock_code)
+    if df.empty:
+        raise HTTPException(status_code=404, detail="未找到该股票代码的数据")
+    if adjust == "qfq":
+        return df.to_dict(orient='records'), price_version
+    raw_rows = get_raw_bars(stock_code)
+    if not raw_rows:
+        raise ValueError("该股票暂无不复权行情（复权因子不可用），只支持 qfq")
+    return adjust_rows(raw_rows, get_adjust_factors(stock_code), adjust), price_version
+
+def check_downsample(max_points: Optional[int], method: str):
+    """校验降采样参数，不合法时抛出 ValueError"""
+    if method not in DOWNSAMPLE_METHODS:
+        raise ValueError(f"downsample 只支持: {', '.join(DOWNSAMPLE_METHODS)}")
+    if max_points is not None and max_points < 10:
+        raise ValueError("max_points 不能小于 10")
+
+# 降采样结果按 (股票代码, 行情版本, 复权方式, 点数, 方式) 缓存，同一分辨率的重复请求直接复用
+CHART_CACHE = ResolutionCache()
+
+def downsample_result(result: Dict[str, Any], stock_code: str, price_version, adjust: str,
+                      max_points: Optional[int], method: str = "ohlc") -> Dict[str, Any]:
+    """
+    K线超过 max_points 时返回降采样后的结果（不修改传入的 result）：
+    替换 k_line_data / volume_data，策略信号时间线的下标映射到降采样后的K线，并附带 downsampled 说明
+    """
+    original_points = len(result["k_line_data"])
+    if not max_points or original_points <= max_points:
+        return result
+    def compute():
+        return downsample_chart(result["k_line_data"], result["volume_data"], max_points, method)
+
+    if price_version is None:
+        k_line_data, volume_data, positions = compute()
+    else:
+        k_line_data, volume_data, positions = CHART_CACHE.get_or_compute(
+            (stock_code, price_version, adjust, max_points, method), compute)
+    downsampled = {**result, "k_line_data": k_line_data, "volume_data": volume_data,
+                   "downsampled": {"method": method, "points": len(k_line_data), "original_points": original_points}}
+    if isinstance(result.get("strategies"), dict):
+        downsampled["strategies"] = {
+            name: {**strategy, "history": remap_history(strategy["history"], positions)}
+            if isinstance(strategy, dict) and isinstance(strategy.get("history"), dict) else strategy
+            for name, strategy in result["strategies"].items()
+        }
+    return downsampled
+
+def build_stock_snapshot(stock_code: str, analysis: Dict[str, Any], selected: List[str]) -> Dict[str, Any]:
+    """
+    由 gather_analysis 的结果组装分析快照（不写库）
+    只运行了部分策略时，未运行的策略沿用已保存快照中的结果
+    """
+    stock_zh_a_hist_df = analysis["df"]
+    stock_zh_a_hist_df['日期'] = stock_zh_a_hist_df['日期'].astype(str)
+
+    computed_result = analysis["strategies"]
+    if len(selected) < len(STRATEGY_DEPENDENCIES):
+        strategies_result = {**get_saved_strategies(stock_code), **computed_result}
+        strategies_result = {name: strategies_result[name] for name in STRATEGY_DEPENDENCIES if name in strategies_result}
+    else:
+        strategies_result = computed_result
+
+    k_line_data, volume_data = chart_series(stock_zh_a_hist_df.to_dict(orient='records'))
+    return {
+        "stock_code": stock_code,
+        "stock_name": analysis["stock_name"],
+        # 分析是否需要高亮
+        "highlight": strategies_result["highlight_strategy"]["result"],
+        "k_line_data": k_line_data,
+        "volume_data": volume_data,
+        "added_time": datetime.now().isoformat(),
+        "analysis_time": datetime.now().isoformat(),
+        "strategies": strategies_result
+    }
+
+def analyze_stock(stock_code: str, params: Dict[str, Any] = None, strategies: List[str] = None, deadline_ms: int = 0,
+                  max_points: Optional[int] = None, downsample: str = "ohlc"):
+    """
+    获取股票日线数据并运行策略分析，结果保存为分析快照
+    strategies 为要运行的策略（缺省为全部）；只运行部分策略时，与已保存快照中其余策略的结果合并，
+    高亮判断是快照的一部分，总是运行
+    deadline_ms > 0 时超时的部分先返回 stale / pending 结果，后台完成后合并进快照
+    max_points 只影响返回的K线点数（见 downsample_result），保存的快照总是完整K线
+    """
+    params = {**DEFAULT_STRATEGY_PARAMS, **(params or {})}
+    selected = select_strategies(strategies)
+    if "highlight_strategy" not in selected:
+        selected.insert(0, "highlight_strategy")
+
+    # 获取最近一年的日线数据和股票名称，运行所选策略分析
+    analysis = gather_analysis(stock_code, params, selected, deadline_ms, need_name=True)
+    stock_result = build_stock_snapshot(stock_code, analysis, selected)
+    computed_result = analysis["strategies"]
+
+    # 保存到数据库
+    stock_result["snapshot_version"] = save_stock_to_db(stock_result)
+    stock_result["computed_strategies"] = [name for name in computed_result if name not in analysis["pending"]]
+    stock_result["pending_strategies"] = analysis["pending"]
+    if analysis["futures"]:
+        merge_when_done(stock_code, analysis["futures"])
+
+    stock_result = downsample_result(stock_result, stock_code, analysis["price_version"], "qfq", max_points, downsample)
+    return json.loads(json.dumps(stock_result, ensure_ascii=False, default=str))
+
+
+@app.get("/api/search")
+async def search_stocks(q: str = "", limit: int = 10):
+    """
+    按股票代码、拼音首字母或名称前缀搜索（如 600、payh、平安），用于输入联想
+    只查询内存索引；代码名称列表尚未加载时返回空列表
+    """
+    return {"results": STOCK_SEARCH.search(q, max(1, min(limit, 50))), "listing_size": len(STOCK_SEARCH)}
+
 @app.get("/api/stock/{stock_code}")
 async def get_stock_data(
     stock_code: str,
@@ -1170,87 +3158,83 @@ async def get_stock_data(
     rsi_period: int = 14,
     rsi_oversold: int = 30,
     rsi_overbought: int = 70,
+    rsi_method: str = "sma",
+    macd_adjust: bool = True,
     boll_period: int = 20,
     boll_std: int = 2,
     momentum_lookback: int = 20,
     momentum_percentile: float = 0.8,
     breakout_period: int = 20,
     breakout_volume_factor: float = 1.5,
+    signal_history: bool = False,
+    strategies: Optional[str] = None,
+    deadline_ms: Optional[int] = None,
+    max_points: Optional[int] = None,
+    downsample: str = "ohlc",
 ):
     """
     根据股票代码获取股票日线数据和策略分析结果
+    - strategies: 逗号分隔的策略名或策略组（technical / fundamental），缺省为全部；
+      只选技术策略时不会拉取基本面数据，未选的策略沿用已保存快照中的结果
+    - deadline_ms: 耗时预算（毫秒），缺省为 REQUEST_DEADLINE_MS；超时的基本面策略返回上次快照结果（stale）
+      或 pending，后台完成后更新快照
+    - max_points: K线超过该点数时在服务端降采样，downsample 为 ohlc（区间聚合，默认）或 lttb
     """
+    if rsi_method not in indicators.RSI_METHODS:
+        raise HTTPException(status_code=400, detail=f"rsi_method 只支持: {', '.join(indicators.RSI_METHODS)}")
     try:
-        # 获取股票历史数据
-        # 我们获取最近一年的数据用于分析和展示
-        end_date = datetime.now().strftime('%Y%m%d')
-        start_date = (datetime.now() - timedelta(days=365)).strftime('%Y%m%d')
-        
-        cached_rows = get_price_cache(stock_code)
-        if cached_rows:
-            stock_zh_a_hist_df = pd.DataFrame(cached_rows)
-        else:
-            stock_zh_a_hist_df = await asyncio.to_thread(ak.stock_zh_a_hist, symbol=stock_code, period="daily", start_date=start_date, end_date=end_date, adjust="qfq")
-            if not stock_zh_a_hist_df.empty:
-                stock_zh_a_hist_df['日期'] = stock_zh_a_hist_df['日期'].astype(str)
-                rows = stock_zh_a_hist_df.to_dict(orient='records')
-                save_price_cache(stock_code, rows, expires_hours=6)
-
-        if stock_zh_a_hist_df.empty:
-            raise HTTPException(status_code=404, detail="未找到该股票代码的数据")
-            
-        stock_zh_a_hist_df['日期'] = stock_zh_a_hist_df['日期'].astype(str)
-        # 获取股票名称
-        stock_info = await asyncio.to_thread(ak.stock_individual_info_em, symbol=stock_code)
-        stock_name = str(stock_info.value[stock_info['item'] == '股票简称'].iloc[0])
-
-        # 分析是否需要高亮
-        should_highlight = analyze_stock_highlight_strategy(stock_zh_a_hist_df)
-        
-        # 运行所有策略分析
-        strategies_result = {
-            "highlight_strategy": {
-                "result": should_highlight,
-                "description": "价格稳定性分析和缩量分析"
-            },
-            # 趋势跟踪策略
-            "ma_crossover": analyze_ma_crossover_strategy(stock_zh_a_hist_df.copy(), short_period=ma_short, long_period=ma_long),
-            "macd": analyze_macd_strategy(stock_zh_a_hist_df.copy()),
-            # 均值回归策略
-            "rsi": analyze_rsi_strategy(stock_zh_a_hist_df.copy(), period=rsi_period, oversold=rsi_oversold, overbought=rsi_overbought),
-            "bollinger_bands": analyze_bollinger_strategy(stock_zh_a_hist_df.copy(), period=boll_period, std_dev=boll_std),
-            # 动量策略
-            "momentum": analyze_momentum_strategy(stock_zh_a_hist_df.copy(), lookback_period=momentum_lookback, percentile_threshold=momentum_percentile),
-            "breakout": analyze_breakout_strategy(stock_zh_a_hist_df.copy(), period=breakout_period, volume_factor=breakout_volume_factor),
-            # 基本面量化策略
-            "peg": analyze_peg_strategy(stock_code),
-            "value_factor": analyze_value_factor_strategy(stock_code),
-            # 新增基本面分析维度
-            "financial_health": analyze_financial_health_strategy(stock_code)
-
-        }
-
-        records = stock_zh_a_hist_df[['日期', '开盘', '收盘', '最低', '最高', '成交量']].to_dict(orient='records')
-        k_line_data = [[str(r['日期']), float(r['开盘']), float(r['收盘']), float(r['最低']), float(r['最高'])] for r in records]
-        volume_data = [[str(r['日期']), float(r['成交量'])] for r in records]
-
-        # 保存到数据库
-        stock_result = {
-            "stock_code": stock_code,
-            "stock_name": stock_name,
-            "highlight": should_highlight,
-            "k_line_data": k_line_data,
-            "volume_data": volume_data,
-            "added_time": datetime.now().isoformat(),
-            "strategies": strategies_result
-        }
-        
-        save_stock_to_db(stock_result)
+        stock_code = check_stock_code(stock_code)
+        selected = select_strategies(strategies)
+        check_downsample(max_points, downsample)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        return await asyncio.to_thread(analyze_stock, stock_code, {
+            "ma_short": ma_short,
+            "ma_long": ma_long,
+            "rsi_period": rsi_period,
+            "rsi_oversold": rsi_oversold,
+            "rsi_overbought": rsi_overbought,
+            "rsi_method": rsi_method,
+            "macd_adjust": macd_adjust,
+            "boll_period": boll_period,
+            "boll_std": boll_std,
+            "momentum_lookback": momentum_lookback,
+            "momentum_percentile": momentum_percentile,
+            "breakout_period": breakout_period,
+            "breakout_volume_factor": breakout_volume_factor,
+            "signal_history": signal_history,
+        }, selected, REQUEST_DEADLINE_MS if deadline_ms is None else deadline_ms, max_points, downsample)
 
-        return json.loads(json.dumps(stock_result, ensure_ascii=False, default=str))
+    except HTTPException:
+        raise
+    except NegativeCacheHit as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(int(e.retry_after) + 1)})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/stock/{stock_code}/bars")
+async def get_stock_bars(stock_code: str, adjust: str = "qfq", max_points: Optional[int] = None, downsample: str = "ohlc"):
+    """
+    最近一年的日线（不运行策略）
+    - adjust: qfq 前复权（默认）/ hfq 后复权 / none 不复权，均由本地保存的原始日线和复权因子计算
+    - max_points / downsample: 同 /api/stock/{stock_code}
+    """
+    try:
+        stock_code = check_stock_code(stock_code)
+        check_downsample(max_points, downsample)
+        records, price_version = await asyncio.to_thread(load_adjusted_bars, stock_code, adjust)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except NegativeCacheHit as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(int(e.retry_after) + 1)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    k_line_data, volume_data = chart_series(records)
+    return downsample_result({"stock_code": stock_code, "adjust": adjust, "k_line_data": k_line_data, "volume_data": volume_data},
+                             stock_code, price_version, adjust, max_points, downsample)
 
 @app.get("/api/stock/{stock_code}/strategies")
 async def get_stock_strategies(
@@ -1260,76 +3244,235 @@ async def get_stock_strategies(
     rsi_period: int = 14,
     rsi_oversold: int = 30,
     rsi_overbought: int = 70,
+    rsi_method: str = "sma",
+    macd_adjust: bool = True,
     boll_period: int = 20,
     boll_std: int = 2,
     momentum_lookback: int = 20,
     momentum_percentile: float = 0.8,
     breakout_period: int = 20,
     breakout_volume_factor: float = 1.5,
+    signal_history: bool = False,
+    strategies: Optional[str] = None,
+    deadline_ms: Optional[int] = None,
 ):
     """
-    获取指定股票的所有策略分析结果
+    获取指定股票的策略分析结果
+    - strategies: 逗号分隔的策略名或策略组（technical / fundamental），缺省为全部；
+      只选基本面策略时不读取行情，只选技术策略时不拉取基本面数据
+    - deadline_ms: 耗时预算（毫秒），缺省为 REQUEST_DEADLINE_MS；超时的基本面策略返回上次快照结果（stale）
+      或 pending，后台继续计算并写入缓存
     """
+    if rsi_method not in indicators.RSI_METHODS:
+        raise HTTPException(status_code=400, detail=f"rsi_method 只支持: {', '.join(indicators.RSI_METHODS)}")
     try:
-        # 获取股票历史数据
-        end_date = datetime.now().strftime('%Y%m%d')
-        start_date = (datetime.now() - timedelta(days=365)).strftime('%Y%m%d')
-        
-        cached_rows = get_price_cache(stock_code)
-        if cached_rows:
-            stock_zh_a_hist_df = pd.DataFrame(cached_rows)
-        else:
-            stock_zh_a_hist_df = await asyncio.to_thread(ak.stock_zh_a_hist, symbol=stock_code, period="daily", start_date=start_date, end_date=end_date, adjust="qfq")
-            if not stock_zh_a_hist_df.empty:
-                stock_zh_a_hist_df['日期'] = stock_zh_a_hist_df['日期'].astype(str)
-                rows = stock_zh_a_hist_df.to_dict(orient='records')
-                save_price_cache(stock_code, rows, expires_hours=6)
-
-        if stock_zh_a_hist_df.empty:
-            raise HTTPException(status_code=404, detail="未找到该股票代码的数据")
-        
-        # 运行所有策略分析
-        strategies_result = {
-            "highlight_strategy": {
-                "result": analyze_stock_highlight_strategy(stock_zh_a_hist_df.copy()),
-                "description": "价格稳定性分析和缩量分析"
-            },
-            # 趋势跟踪策略
-            "ma_crossover": analyze_ma_crossover_strategy(stock_zh_a_hist_df.copy(), short_period=ma_short, long_period=ma_long),
-            "macd": analyze_macd_strategy(stock_zh_a_hist_df.copy()),
-            # 均值回归策略
-            "rsi": analyze_rsi_strategy(stock_zh_a_hist_df.copy(), period=rsi_period, oversold=rsi_oversold, overbought=rsi_overbought),
-            "bollinger_bands": analyze_bollinger_strategy(stock_zh_a_hist_df.copy(), period=boll_period, std_dev=boll_std),
-            # 动量策略
-            "momentum": analyze_momentum_strategy(stock_zh_a_hist_df.copy(), lookback_period=momentum_lookback, percentile_threshold=momentum_percentile),
-            "breakout": analyze_breakout_strategy(stock_zh_a_hist_df.copy(), period=breakout_period, volume_factor=breakout_volume_factor),
-            # 基本面量化策略
-            "peg": analyze_peg_strategy(stock_code),
-            "value_factor": analyze_value_factor_strategy(stock_code),
-            # 新增基本面分析维度
-            "financial_health": analyze_financial_health_strategy(stock_code)
-        }
+        stock_code = check_stock_code(stock_code)
+        selected = select_strategies(strategies)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        # 获取所需数据并运行所选策略分析
+        analysis = await asyncio.to_thread(gather_analysis, stock_code, {
+            "ma_short": ma_short,
+            "ma_long": ma_long,
+            "rsi_period": rsi_period,
+            "rsi_oversold": rsi_oversold,
+            "rsi_overbought": rsi_overbought,
+            "rsi_method": rsi_method,
+            "macd_adjust": macd_adjust,
+            "boll_period": boll_period,
+            "boll_std": boll_std,
+            "momentum_lookback": momentum_lookback,
+            "momentum_percentile": momentum_percentile,
+            "breakout_period": breakout_period,
+            "breakout_volume_factor": breakout_volume_factor,
+            "signal_history": signal_history,
+        }, selected, REQUEST_DEADLINE_MS if deadline_ms is None else deadline_ms)
         
         return json.loads(json.dumps({
             "stock_code": stock_code,
             "analysis_time": datetime.now().isoformat(),
-            "strategies": strategies_result
+            "strategies": analysis["strategies"],
+            "pending_strategies": analysis["pending"],
         }, ensure_ascii=False, default=str))
         
+    except HTTPException:
+        raise
+    except NegativeCacheHit as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(int(e.retry_after) + 1)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/stocks")
-async def get_all_stocks():
+async def get_all_stocks(
+    request: Request,
+    include_kline: bool = False,
+    since: Optional[int] = None,
+    fields: Optional[str] = None,
+    highlight: Optional[bool] = None,
+    strategy: Optional[str] = None,
+    signal: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = 100,
+):
     """
-    获取所有已保存的股票信息
+    获取已保存的股票分析快照
+    - include_kline: 是否附带快照中的K线和成交量数据
+    - since: 只返回快照版本号大于该值的股票，并列出其后删除的股票代码
+    - fields: 逗号分隔的返回字段，如 stock_code,stock_name,highlight
+    - highlight / strategy+signal: 服务端筛选，如 strategy=macd&signal=buy
+    - cursor / limit: 游标分页，下一页游标见 next_cursor
+    支持 ETag / If-None-Match 条件请求，快照未变化时返回 304
     """
+    if (strategy is None) != (signal is None):
+        raise HTTPException(status_code=400, detail="strategy 和 signal 参数需要同时提供")
+    limit = max(1, min(limit, 1000))
+    field_list = [f.strip() for f in fields.split(',') if f.strip()] if fields else list(DEFAULT_STOCK_FIELDS)
+    if include_kline:
+        field_list += [f for f in ('k_line_data', 'volume_data') if f not in field_list]
+
     try:
-        saved_stocks = get_saved_stocks()
-        return {"stocks": saved_stocks}
+        version, count = get_snapshot_state()
+        query_digest = hashlib.md5(str(sorted(request.query_params.multi_items())).encode()).hexdigest()[:12]
+        etag = f'W/"{version}-{count}-{query_digest}"'
+        if request.headers.get('if-none-match') == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+
+        page = query_saved_stocks(
+            fields=field_list,
+            since=since,
+            highlight=highlight,
+            strategy=strategy,
+            signal=signal,
+            cursor_token=cursor,
+            limit=limit,
+            version=version,
+        )
+        content = {
+            "stocks": page["stocks"],
+            "next_cursor": page["next_cursor"],
+            "version": page["version"],
+            "deleted": get_deleted_stocks(since) if since is not None and not cursor else []
+        }
+        return JSONResponse(content=content, headers={"ETag": etag})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/stocks/import", status_code=202)
+async def import_stocks(
+    request: Request,
+    format: Optional[str] = None,
+    strategies: Optional[str] = None,
+    refresh_existing: bool = False,
+):
+    """
+    批量导入自选股，请求体为 CSV（stock_code / code / 代码 列，或第一列）或 JSON（代码列表或 {"stock_codes": [...]}）
+    - format: csv / json，缺省按 Content-Type 判断
+    - strategies: 导入时运行的策略，缺省为技术策略
+    - refresh_existing: 是否重新分析已保存的股票，缺省跳过
+    代码在提交前校验，合法代码作为一个 import 任务后台执行，进度和结果见 /api/jobs/{job_id}
+    """
+    if format is None:
+        format = "json" if "json" in request.headers.get("content-type", "") else "csv"
+    body = await request.body()
+    try:
+        raw_codes = parse_codes(body.decode("utf-8-sig"), format)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="请求体需要为 UTF-8 编码")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not raw_codes:
+        raise HTTPException(status_code=400, detail="未解析到股票代码")
+    if len(raw_codes) > MAX_IMPORT_CODES:
+        raise HTTPException(status_code=400, detail=f"单次最多导入 {MAX_IMPORT_CODES} 个代码")
+
+    stock_codes, invalid, duplicates = split_codes(raw_codes, check_stock_code)
+    existing = []
+    if not refresh_existing:
+        saved = set(await asyncio.to_thread(get_saved_stock_codes))
+        existing = [stock_code for stock_code in stock_codes if stock_code in saved]
+        stock_codes = [stock_code for stock_code in stock_codes if stock_code not in saved]
+
+    job_id = None
+    if stock_codes:
+        job_request = JobRequest(
+            job_type="import",
+            stock_codes=stock_codes,
+            strategies=[name.strip() for name in strategies.split(',') if name.strip()] if strategies else None,
+        )
+        try:
+            job_id = await asyncio.to_thread(JOB_MANAGER.submit, job_request)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except OverflowError as e:
+            raise HTTPException(status_code=429, detail=str(e))
+    return {
+        "job_id": job_id,
+        "status": "queued" if job_id else "nothing_to_import",
+        "accepted": stock_codes,
+        "existing": existing,
+        "duplicates": duplicates,
+        "invalid": invalid,
+    }
+
+def iter_export_rows(page_size: int = 500):
+    """
+    按股票代码顺序逐页读取已保存股票及各策略最新信号
+    每页单独打开连接（流式响应的各块可能在不同线程中生成），不持有长时间的读事务
+    """
+    last_code = ''
+    while True:
+        conn = get_db_connection()
+        try:
+            stocks = conn.execute('''
+            SELECT stock_code, stock_name, added_time, analysis_time, highlight, snapshot_version
+            FROM stocks WHERE stock_code > ? ORDER BY stock_code LIMIT ?
+            ''', (last_code, page_size)).fetchall()
+            if not stocks:
+                return
+            placeholders = ','.join('?' * len(stocks))
+            signals = {}
+            for stock_code, strategy, signal in conn.execute(
+                f'SELECT stock_code, strategy, signal FROM stock_signals WHERE stock_code IN ({placeholders})',
+                [row[0] for row in stocks]
+            ):
+                signals.setdefault(stock_code, {})[strategy] = signal
+        finally:
+            conn.close()
+        for stock_code, stock_name, added_time, analysis_time, highlight, snapshot_version in stocks:
+            yield {
+                "stock_code": stock_code,
+                "stock_name": stock_name,
+                "added_time": added_time,
+                "analysis_time": analysis_time,
+                "highlight": bool(highlight),
+                "snapshot_version": snapshot_version,
+                "signals": signals.get(stock_code, {}),
+            }
+        last_code = stocks[-1][0]
+
+@app.get("/api/stocks/export")
+async def export_stocks(format: str = "csv"):
+    """
+    流式导出已保存的股票及各策略最新信号
+    - format: csv（每个策略一列，可直接用于 /api/stocks/import）或 json
+    """
+    if format not in IMPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"导出格式只支持: {', '.join(IMPORT_FORMATS)}")
+    if format == "csv":
+        strategy_columns = [name for name in STRATEGY_DEPENDENCIES if name != "highlight_strategy"]
+        columns = ["stock_code", "stock_name", "added_time", "analysis_time", "highlight", "snapshot_version"] + strategy_columns
+        content = csv_chunks(columns, ({**row.pop("signals"), **row} for row in iter_export_rows()))
+        media_type = "text/csv; charset=utf-8"
+    else:
+        content = json_chunks(iter_export_rows())
+        media_type = "application/json"
+    filename = f"watchlist-{datetime.now().strftime('%Y%m%d')}.{format}"
+    return StreamingResponse(content, media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
 @app.delete("/api/stock/{stock_code}")
 async def delete_stock(stock_code: str):
     """
@@ -1337,6 +3480,7 @@ async def delete_stock(stock_code: str):
     """
     try:
         success = delete_stock_from_db(stock_code)
+        discard_negative_cache(stock_code)
         if success:
             return {"message": f"股票 {stock_code} 已删除"}
         else:
@@ -1344,14 +3488,764 @@ async def delete_stock(stock_code: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/industries/valuation")
+async def get_industry_valuation():
+    """
+    各行业 PE、PB、ROE、资产负债率的分布汇总（分位数与样本数）
+    """
+    try:
+        summary = await asyncio.to_thread(INDUSTRY_VALUATION.summary)
+        return {"version": INDUSTRY_VALUATION.version, "industries": summary}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def parse_factor_weights(weights: Optional[str]) -> Dict[str, float]:
+    """解析因子权重参数，格式如 pe:30,roe:20"""
+    parsed = {}
+    for item in (weights or '').split(','):
+        if not item.strip():
+            continue
+        name, _, value = item.partition(':')
+        parsed[name.strip()] = float(value)
+    return parsed
+
+@app.get("/api/factors/ranking")
+async def get_factor_ranking(
+    value_weights: Optional[str] = None,
+    health_weights: Optional[str] = None,
+    value_share: float = 0.5,
+    industry: Optional[str] = None,
+    limit: int = 50,
+):
+    """
+    全市场多因子综合评分排名（基于基本面宽表批量向量化计算）
+    行业样本充足的股票，PE、PB、ROE、资产负债率按行业内百分位计分（industry_relative 为 true），其余按绝对阈值
+    - value_weights: 价值因子满分，如 pe:30,pb:20,dividend:10,roe:25,debt:15
+    - health_weights: 财务健康满分，如 debt:30,roe:25,growth:25,size:20
+    - value_share: 综合评分中价值因子所占比例，其余为财务健康
+    """
+    try:
+        _, universe = await asyncio.to_thread(load_fundamental_universe)
+        if industry:
+            universe = universe[universe['industry'] == industry]
+        percentiles = await asyncio.to_thread(INDUSTRY_VALUATION.percentile_frame, universe.index)
+        ranked = rank_composite(
+            universe,
+            value_weights=parse_factor_weights(value_weights),
+            health_weights=parse_factor_weights(health_weights),
+            value_share=min(max(value_share, 0.0), 1.0),
+            percentiles=percentiles,
+        ).head(max(1, min(limit, 5000)))
+        ranked.insert(0, 'stock_name', universe.loc[ranked.index, 'stock_name'])
+        ranked.insert(1, 'industry', universe.loc[ranked.index, 'industry'])
+        ranked = ranked.round({'composite_score': 1, 'value_score': 1, 'health_score': 1})
+        return {
+            "universe_size": len(universe),
+            "ranking": json.loads(ranked.reset_index().to_json(orient='records', force_ascii=False))
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/portfolio/analyze")
+async def portfolio_analyze(request: PortfolioRequest):
+    """
+    组合分析：持仓间相关系数 / 协方差矩阵（年化）、组合与个股年化波动率、相对基准指数的 beta、
+    各持仓风险贡献，以及各策略最新信号的持仓数与权重汇总
+    - holdings: [{"stock_code": "000001", "weight": 0.3}, ...]，缺省为全部已保存股票等权
+    - benchmark: 基准指数代码，默认 000300（沪深300），传空字符串则不计算 beta
+    """
+    try:
+        return await asyncio.to_thread(analyze_portfolio_request, request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# 实时信号推送：每个 worker 为自己的 WebSocket 客户端维护订阅，被订阅的股票每个周期计算一次
+SIGNAL_HUB = SignalHub(max_codes_per_client=SIGNAL_MAX_CODES_PER_CLIENT)
+
+def evaluate_signal_state(stock_code: str):
+    """
+    计算推送用的股票状态：K线（含成交量）、技术策略信号、高亮，行情和策略结果均走缓存
+    推送的变化只涉及K线，不运行基本面策略（每个周期都请求基本面接口会绕过负缓存反复访问上游）
+    """
+    df, price_version = load_price_history(stock_code)
+    if df.empty:
+        return None
+    strategies = run_strategies(stock_code, df, price_version, DEFAULT_STRATEGY_PARAMS, STRATEGY_GROUPS["technical"])
+    records = df[['日期', '开盘', '收盘', '最低', '最高', '成交量']].to_dict(orient='records')
+    return {
+        "bars": [[str(r['日期']), float(r['开盘']), float(r['收盘']), float(r['最低']), float(r['最高']), float(r['成交量'])] for r in records],
+        "signals": {name: result.get('signal') for name, result in strategies.items() if isinstance(result, dict) and 'signal' in result},
+        "highlight": bool(strategies["highlight_strategy"]["result"]),
+    }
+
+async def signal_push_loop():
+    """按间隔计算所有被订阅的股票（与客户端数量无关），把变化推送给订阅者"""
+    while True:
+        await SIGNAL_HUB.wait(SIGNAL_PUSH_INTERVAL_SECONDS)
+        stock_codes = SIGNAL_HUB.subscribed_codes()
+        if not stock_codes:
+            continue
+        states = await asyncio.gather(
+            *(asyncio.to_thread(evaluate_signal_state, stock_code) for stock_code in stock_codes),
+            return_exceptions=True
+        )
+        for stock_code, state in zip(stock_codes, states):
+            if isinstance(state, Exception):
+                log_error(stock_code, "signal_push", str(state))
+            elif state is not None:
+                SIGNAL_HUB.publish(stock_code, state)
+
+@app.websocket("/ws/signals")
+async def signals_websocket(websocket: WebSocket):
+    """
+    实时信号推送
+    客户端发送 {"action": "subscribe" | "unsubscribe", "codes": ["000001", ...]}；
+    服务端推送 subscribed（确认）、error（不合法或超出订阅上限的代码）、snapshot（订阅后的完整状态）、
+    delta（bars 新K线 / signals 变化的信号 / highlight 高亮翻转，只含有变化的字段）
+    """
+    await websocket.accept()
+    queue = SIGNAL_HUB.connect()
+
+    async def receive():
+        while True:
+            message = await websocket.receive_json()
+            codes = [str(code).strip() for code in message.get("codes", []) if str(code).strip()]
+            if message.get("action") == "subscribe":
+                # 与其他接口一样，代码在触发上游请求前校验，不合法的代码不订阅
+                valid, rejected = [], {}
+                for code in codes:
+                    try:
+                        valid.append(check_stock_code(code))
+                    except ValueError as e:
+                        rejected[code] = str(e)
+                if rejected:
+                    queue.put_nowait({"type": "error", "detail": "股票代码不合法", "codes": rejected})
+                SIGNAL_HUB.subscribe(queue, valid)
+            elif message.get("action") == "unsubscribe":
+                SIGNAL_HUB.unsubscribe(queue, codes)
+            else:
+                queue.put_nowait({"type": "error", "detail": "action 只支持 subscribe / unsubscribe"})
+
+    async def send():
+        while True:
+            message = await queue.get()
+            await websocket.send_json(message)
+            if message["type"] == "overflow":
+                await websocket.close(code=1013)
+                return
+
+    tasks = [asyncio.create_task(receive()), asyncio.create_task(send())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        SIGNAL_HUB.disconnect(queue)
+
+# 预警规则：新行情写入缓存后，只计算被规则引用的技术策略，只检查受影响的规则
+def load_alert_rules():
+    """读取全部预警规则，版本号由规则数和最大 id 组成（新增、删除都会改变）"""
+    conn = get_db_connection()
+    try:
+        count, max_id = conn.execute('SELECT COUNT(*), COALESCE(MAX(id), 0) FROM alert_rules').fetchone()
+        rules = [
+            {"id": rule_id, "name": name, "stock_code": stock_code, "strategy": strategy, "conditions": json.loads(conditions)}
+            for rule_id, name, stock_code, strategy, conditions in conn.execute(
+                'SELECT id, name, stock_code, strategy, conditions FROM alert_rules'
+            )
+        ]
+        return f"{max_id}-{count}", rules
+    finally:
+        conn.close()
+
+ALERT_ENGINE = AlertEngine(load_alert_rules)
+
+def load_alert_bars(since_id: int = None, stock_codes: List[str] = None):
+    """
+    读取需要检查预警的行情缓存（含已过期）：id 大于 since_id 的更新，或指定股票的当前行情
+    只返回有规则引用的股票，返回 ([(股票代码, 行情行列表, 数据版本号)], 读到的最大 id)
+    """
+    ALERT_ENGINE.refresh()
+    conn = get_db_connection()
+    try:
+        if stock_codes is None:
+            cursor = conn.execute(
+                "SELECT id, stock_code, rows FROM price_cache WHERE id > ? AND stock_code NOT LIKE 'index:%' ORDER BY id",
+                (since_id or 0,)
+            )
+            fetched = cursor.fetchall()
+        else:
+            fetched = []
+            for start in range(0, len(stock_codes), 500):
+                chunk = stock_codes[start:start + 500]
+                fetched += conn.execute(
+                    f"SELECT id, stock_code, rows FROM price_cache WHERE stock_code IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall()
+    finally:
+        conn.close()
+    bars, max_id = [], since_id or 0
+    for cache_id, stock_code, rows in fetched:
+        max_id = max(max_id, cache_id)
+        if not ALERT_ENGINE.strategies_for(stock_code):
+            continue
+        try:
+            bars.append((stock_code, json.loads(rows), cache_id))
+        except Exception:
+            continue
+    return bars, max_id
+
+def evaluate_alert_rules(bars) -> List[Dict[str, Any]]:
+    """
+    对新行情检查预警规则，bars 为 load_alert_bars 的返回值
+    策略结果走记忆化缓存；规则状态的读取和写入在同一个写事务中，多个 worker 同时检查同一批行情时不会重复触发
+    返回新写入的预警记录
+    """
+    evaluated = []
+    for stock_code, rows, price_version in bars:
+        strategies = ALERT_ENGINE.strategies_for(stock_code)
+        if not strategies or not rows:
+            continue
+        try:
+            results = run_technical_strategies(stock_code, pd.DataFrame(rows), price_version, DEFAULT_STRATEGY_PARAMS, strategies)
+        except Exception as e:
+            log_error(stock_code, "alert_evaluate", str(e))
+            continue
+        evaluated.append((stock_code, str(rows[-1].get('日期')), results))
+    if not evaluated:
+        return []
+
+    events = []
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        states: Dict[str, Dict[int, bool]] = {}
+        stock_codes = [stock_code for stock_code, _, _ in evaluated]
+        for start in range(0, len(stock_codes), 500):
+            chunk = stock_codes[start:start + 500]
+            for rule_id, stock_code, matched in cursor.execute(
+                f"SELECT rule_id, stock_code, matched FROM alert_rule_state WHERE stock_code IN ({','.join('?' * len(chunk))})",
+                chunk
+            ):
+                states.setdefault(stock_code, {})[rule_id] = bool(matched)
+        state_rows = []
+        for stock_code, bar_date, results in evaluated:
+            changed, fired = ALERT_ENGINE.evaluate(stock_code, results, states.get(stock_code, {}))
+            state_rows += [(rule_id, stock_code, int(matched)) for rule_id, matched in changed.items()]
+            for rule in fired:
+                result = results[rule["strategy"]]
+                detail = {"signal": result.get("signal"), **{c["field"]: result.get(c["field"]) for c in rule["conditions"]}}
+                events.append({
+                    "rule_id": rule["id"], "rule_name": rule["name"], "stock_code": stock_code,
+                    "strategy": rule["strategy"], "bar_date": bar_date, "detail": detail,
+                })
+        cursor.executemany('''
+        INSERT OR REPLACE INTO alert_rule_state (rule_id, stock_code, matched, updated_at)
+        VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        ''', state_rows)
+        cursor.executemany('''
+        INSERT INTO alert_events (rule_id, rule_name, stock_code, strategy, bar_date, detail)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ''', [(e["rule_id"], e["rule_name"], e["stock_code"], e["strategy"], e["bar_date"],
+               json.dumps(e["detail"], ensure_ascii=False, default=str)) for e in events])
+        conn.commit()
+    finally:
+        conn.close()
+    return events
+
+def process_new_bars():
+    """从上次的进度开始检查新写入的行情，处理完成后推进进度"""
+    conn = get_db_connection()
+    try:
+        row = conn.execute('SELECT price_cache_id FROM alert_progress WHERE id = 1').fetchone()
+    finally:
+        conn.close()
+    since_id = row[0] if row else 0
+    bars, max_id = load_alert_bars(since_id=since_id)
+    events = evaluate_alert_rules(bars)
+    if max_id != since_id:
+        conn = get_db_connection()
+        try:
+            conn.execute('INSERT OR REPLACE INTO alert_progress (id, price_cache_id) VALUES (1, ?)', (max_id,))
+            conn.commit()
+        finally:
+            conn.close()
+    return events
+
+async def alert_loop():
+    """按间隔检查新行情触发的预警，只在主进程 worker 中运行"""
+    if ALERT_INTERVAL_SECONDS <= 0:
+        return
+    while True:
+        await asyncio.sleep(ALERT_INTERVAL_SECONDS)
+        try:
+            if LEADER_ELECTION.try_acquire():
+                await asyncio.to_thread(process_new_bars)
+        except Exception as e:
+            print(f"预警检查失败: {e}")
+
+def log_alert_baseline_error(rule_id: int, stock_code: Optional[str], future):
+    """预警规则初始状态计算失败时写入错误日志（否则异常随 Future 被丢弃）"""
+    error = future.exception()
+    if error is not None:
+        log_error(stock_code, "alert_baseline", f"预警规则 {rule_id} 初始状态计算失败: {error}")
+
+def create_alert_rule(request: AlertRuleRequest):
+    if request.strategy not in STRATEGY_DEPENDENCIES:
+        raise ValueError(f"未知策略: {request.strategy}")
+    if "fundamentals" in STRATEGY_DEPENDENCIES[request.strategy]:
+        raise ValueError("预警规则只支持技术策略（随新行情求值）")
+    conditions = validate_conditions(request.conditions)
+    stock_code = check_stock_code(request.stock_code) if request.stock_code and request.stock_code.strip() else None
+    conn = get_db_connection()
+    try:
+        cursor = conn.execute(
+            'INSERT INTO alert_rules (name, stock_code, strategy, conditions) VALUES (?, ?, ?, ?)',
+            (request.name, stock_code, request.strategy, json.dumps(conditions, ensure_ascii=False))
+        )
+        conn.commit()
+        rule_id = cursor.lastrowid
+    finally:
+        conn.close()
+    # 用当前已缓存的行情记录初始状态，之后的新行情才能判断“从不满足变为满足”；后台执行，失败时记录错误日志
+    bars, _ = load_alert_bars(stock_codes=[stock_code] if stock_code else None)
+    ANALYSIS_EXECUTOR.submit(evaluate_alert_rules, bars).add_done_callback(
+        lambda future: log_alert_baseline_error(rule_id, stock_code, future))
+    return {"id": rule_id, "name": request.name, "stock_code": stock_code, "strategy": request.strategy, "conditions": conditions}
+
+@app.post("/api/alerts/rules")
+async def add_alert_rule(request: AlertRuleRequest):
+    """
+    新增预警规则：某个技术策略的结果满足全部条件时触发（从不满足变为满足时记录一次）
+    - strategy: 技术策略名，如 ma_crossover、breakout
+    - conditions: [{"field": "signal", "op": "eq", "value": "buy"}, {"field": "volume_ratio", "op": "gt", "value": 2}]，
+      op 可选 eq / ne / gt / gte / lt / lte
+    - stock_code: 缺省对全部股票生效
+    """
+    try:
+        return await asyncio.to_thread(create_alert_rule, request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/alerts/rules")
+async def list_alert_rules():
+    _, rules = await asyncio.to_thread(load_alert_rules)
+    return {"rules": rules}
+
+def remove_alert_rule(rule_id: int) -> bool:
+    """删除预警规则及其状态，返回规则是否存在"""
+    conn = get_db_connection()
+    try:
+        deleted = conn.execute('DELETE FROM alert_rules WHERE id = ?', (rule_id,)).rowcount
+        conn.execute('DELETE FROM alert_rule_state WHERE rule_id = ?', (rule_id,))
+        conn.commit()
+        return bool(deleted)
+    finally:
+        conn.close()
+
+@app.delete("/api/alerts/rules/{rule_id}")
+async def delete_alert_rule(rule_id: int):
+    """删除预警规则及其状态，已产生的预警记录保留"""
+    if not await asyncio.to_thread(remove_alert_rule, rule_id):
+        raise HTTPException(status_code=404, detail="预警规则不存在")
+    return {"message": "预警规则已删除"}
+
+def load_alert_events(since: int, limit: int, stock_code: Optional[str] = None) -> List[Dict[str, Any]]:
+    """读取 id 大于 since 的预警记录，按 id 升序"""
+    conn = get_db_connection()
+    try:
+        query = 'SELECT id, rule_id, rule_name, stock_code, strategy, bar_date, detail, created_at FROM alert_events WHERE id > ?'
+        args: List[Any] = [since]
+        if stock_code:
+            query += ' AND stock_code = ?'
+            args.append(stock_code)
+        rows = conn.execute(query + ' ORDER BY id LIMIT ?', (*args, limit)).fetchall()
+    finally:
+        conn.close()
+    return [
+        {"id": r[0], "rule_id": r[1], "rule_name": r[2], "stock_code": r[3], "strategy": r[4],
+         "bar_date": r[5], "detail": json.loads(r[6] or '{}'), "created_at": r[7]}
+        for r in rows
+    ]
+
+@app.get("/api/alerts/events")
+async def list_alert_events(since: int = 0, limit: int = 100, stock_code: Optional[str] = None):
+    """
+    预警记录，按 id 升序返回 id 大于 since 的记录
+    客户端保存返回的 next，下次以 since=next 增量拉取
+    """
+    events = await asyncio.to_thread(load_alert_events, since, max(1, min(limit, 1000)), stock_code)
+    return {"events": events, "next": events[-1]["id"] if events else since}
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    """
+    缓存占用统计：各表行数、数据量（数据列字节数）与预算，数据库和 WAL 文件大小，最近一次维护结果
+    """
+    return await asyncio.to_thread(CACHE_MAINTENANCE.stats)
+
 @app.get("/health")
 async def health():
-    return {"status": "ok"}
+    """存活检查，不依赖数据库；ready 表示数据库初始化是否完成"""
+    return {
+        "status": "ok",
+        "ready": DATABASE_READY.is_set(),
+        "modules": {"pandas": pd.loaded, "akshare": ak.loaded},
+    }
 
 @app.get("/version")
 async def version():
     return {"version": "1.0.0"}
 
+# 异步任务
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+MAX_PENDING_JOBS = int(os.environ.get('MAX_PENDING_JOBS', '100'))
+
+class JobCancelled(Exception):
+    """任务被取消"""
+
+class JobContext:
+    """任务执行上下文：汇报进度并在检查点响应取消请求"""
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.partial_result = None
+
+    def report(self, done: int, total: int, message: str = None):
+        """更新进度；检测到取消请求时抛出 JobCancelled"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute('''
+            UPDATE jobs SET progress = ?, progress_message = ? WHERE id = ?
+            ''', (round(done / total, 4) if total else 1.0, message, self.job_id))
+            cursor.execute('SELECT cancel_requested FROM jobs WHERE id = ?', (self.job_id,))
+            row = cursor.fetchone()
+            conn.commit()
+        finally:
+            conn.close()
+        if row and row[0]:
+            raise JobCancelled()
+
+    def check_cancelled(self):
+        """只检查取消请求（不更新进度），检测到时抛出 JobCancelled"""
+        conn = get_db_connection()
+        try:
+            row = conn.execute('SELECT cancel_requested FROM jobs WHERE id = ?', (self.job_id,)).fetchone()
+        finally:
+            conn.close()
+        if row and row[0]:
+            raise JobCancelled()
+
+    def checkpoint(self, done: int, total: int, message: str = None):
+        """
+        逐只处理前调用：每 JOB_REPORT_EVERY 只写一次进度，其余只做只读的取消检查，
+        避免每只股票都提交一次写事务、与请求争用写锁
+        """
+        if done % JOB_REPORT_EVERY == 0:
+            self.report(done, total, message)
+        else:
+            self.check_cancelled()
+
+def run_analysis_job(request: JobRequest, context: JobContext):
+    """单只股票完整分析"""
+    if not request.stock_code:
+        raise ValueError("analysis 任务需要 stock_code")
+    context.report(0, 1, request.stock_code)
+    result = analyze_stock(request.stock_code, request.params, request.strategies)
+    context.report(1, 1, request.stock_code)
+    return result
+
+def run_batch_refresh_job(request: JobRequest, context: JobContext):
+    """批量重新分析并更新快照"""
+    stock_codes = request.stock_codes or get_saved_stock_codes()
+    context.partial_result = {"refreshed": [], "failed": {}}
+    for index, stock_code in enumerate(stock_codes):
+        context.checkpoint(index, len(stock_codes), stock_code)
+        try:
+            analyze_stock(stock_code, request.params, request.strategies)
+            context.partial_result["refreshed"].append(stock_code)
+        except Exception as e:
+            context.partial_result["failed"][stock_code] = str(e)
+    context.report(len(stock_codes), len(stock_codes))
+    return context.partial_result
+
+def run_screen_job(request: JobRequest, context: JobContext):
+    """按策略信号筛选股票"""
+    stock_codes = request.stock_codes or get_saved_stock_codes()
+    params = {**DEFAULT_STRATEGY_PARAMS, **request.params}
+    selected = select_strategies(request.strategies)
+    if "highlight_strategy" not in selected:
+        selected.insert(0, "highlight_strategy")
+    context.partial_result = {"matches": [], "failed": {}, "conditions": request.signals}
+    for index, stock_code in enumerate(stock_codes):
+        context.checkpoint(index, len(stock_codes), stock_code)
+        try:
+            df, price_version = load_price_history(stock_code)
+            if df.empty:
+                raise ValueError("未找到该股票代码的数据")
+            strategies = run_strategies(stock_code, df, price_version, params, selected)
+        except Exception as e:
+            context.partial_result["failed"][stock_code] = str(e)
+            continue
+        signals = {name: result.get('signal') for name, result in strategies.items() if 'signal' in result}
+        if all(signals.get(name) == signal for name, signal in request.signals.items()):
+            context.partial_result["matches"].append({
+                "stock_code": stock_code,
+                "highlight": strategies["highlight_strategy"]["result"],
+                "signals": signals
+            })
+    context.report(len(stock_codes), len(stock_codes))
+    return context.partial_result
+
+def run_import_job(request: JobRequest, context: JobContext):
+    """
+    批量导入：多线程并发获取行情并分析（行情经 load_price_history 写入共享缓存），
+    全部完成后在一个事务内批量写入快照；缺省只运行技术策略，基本面结果由之后的批量刷新补齐
+    """
+    if not request.stock_codes:
+        raise ValueError("import 任务需要 stock_codes")
+    stock_codes = request.stock_codes
+    params = {**DEFAULT_STRATEGY_PARAMS, **request.params}
+    selected = select_strategies(request.strategies or ["technical"])
+    if "highlight_strategy" not in selected:
+        selected.insert(0, "highlight_strategy")
+    # 最后一步为写库
+    total = len(stock_codes) + 1
+    context.partial_result = {"imported": [], "failed": {}}
+    snapshots = {}
+    executor = ThreadPoolExecutor(max_workers=IMPORT_WORKERS, thread_name_prefix="import")
+    remaining = iter(stock_codes)
+    running = {}
+    done = 0
+
+    def submit(count: int):
+        # 每提交一只前检查取消请求，取消后不再开始新的代码
+        for stock_code in islice(remaining, count):
+            context.check_cancelled()
+            running[executor.submit(gather_analysis, stock_code, params, selected, 0, True)] = stock_code
+
+    try:
+        # 同时执行的代码数不超过线程数，完成一只补充一只
+        submit(IMPORT_WORKERS)
+        while running:
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stock_code = running.pop(future)
+                done += 1
+                try:
+                    snapshots[stock_code] = build_stock_snapshot(stock_code, future.result(), selected)
+                except Exception as e:
+                    context.partial_result["failed"][stock_code] = getattr(e, 'detail', None) or str(e)
+                if done % JOB_REPORT_EVERY == 0:
+                    context.report(done, total, stock_code)
+            submit(len(finished))
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    # 按导入顺序分配快照版本号
+    ordered = [snapshots[stock_code] for stock_code in stock_codes if stock_code in snapshots]
+    context.report(len(stock_codes), total, "saving")
+    save_stocks_to_db(ordered)
+    context.partial_result["imported"] = [stock_data["stock_code"] for stock_data in ordered]
+    for stock_code in context.partial_result["imported"]:
+        discard_negative_cache(stock_code)
+    context.report(total, total)
+    return context.partial_result
+
+JOB_HANDLERS = {
+    "analysis": run_analysis_job,
+    "screen": run_screen_job,
+    "batch_refresh": run_batch_refresh_job,
+    "import": run_import_job,
+}
+
+class JobManager:
+    """
+    异步任务管理：有界线程池执行耗时分析，状态与结果写入 SQLite
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor = None
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def submit(self, request: JobRequest) -> str:
+        if request.job_type not in JOB_HANDLERS:
+            raise ValueError(f"未知任务类型: {request.job_type}")
+        select_strategies(request.strategies)
+        # 股票代码在排队前校验，不合法的代码不进入任务队列
+        if request.stock_code:
+            request.stock_code = check_stock_code(request.stock_code)
+        if request.stock_codes:
+            request.stock_codes = [check_stock_code(stock_code) for stock_code in request.stock_codes]
+        with self._lock:
+            if len(self._futures) >= MAX_PENDING_JOBS:
+                raise OverflowError("排队任务过多，请稍后再试")
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+            job_id = uuid.uuid4().hex
+            update_job(job_id, insert=True, job_type=request.job_type,
+                       payload=request.model_dump_json(), status='queued', owner=WORKER_ID)
+            future = self._executor.submit(self._run, job_id, request)
+            self._futures[job_id] = future
+        future.add_done_callback(lambda _: self._forget(job_id))
+        return job_id
+
+    def cancel(self, job_id: str) -> bool:
+        """取消任务：排队中的直接取消，运行中的在下一个检查点停止"""
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is not None and future.cancel():
+            update_job(job_id, status='cancelled', finished=True)
+            return True
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute('''
+            UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status IN ('queued', 'running')
+            ''', (job_id,))
+            conn.commit()
+            return cursor.rowcount > 0
+        finally:
+            conn.close()
+
+    def _forget(self, job_id: str):
+        with self._lock:
+            self._futures.pop(job_id, None)
+
+    def _run(self, job_id: str, request: JobRequest):
+        context = JobContext(job_id)
+        try:
+            update_job(job_id, status='running', started=True)
+            result = JOB_HANDLERS[request.job_type](request, context)
+            update_job(job_id, status='succeeded', progress=1.0, result=result, finished=True)
+        except JobCancelled:
+            update_job(job_id, status='cancelled', result=context.partial_result, finished=True)
+        except Exception as e:
+            log_error(request.stock_code, f"job_{request.job_type}", str(e))
+            update_job(job_id, status='failed', error=str(e), result=context.partial_result, finished=True)
+
+JOB_MANAGER = JobManager(JOB_WORKERS)
+
+def update_job(job_id: str, insert: bool = False, started: bool = False, finished: bool = False, **fields):
+    """写入任务状态"""
+    if 'result' in fields:
+        fields['result'] = json.dumps(fields['result'], ensure_ascii=False, default=str) if fields['result'] is not None else None
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        if insert:
+            cursor.execute(f'''
+            INSERT INTO jobs (id, {", ".join(fields)}) VALUES (?, {", ".join("?" for _ in fields)})
+            ''', (job_id, *fields.values()))
+        else:
+            assignments = [f"{name} = ?" for name in fields]
+            if started:
+                assignments.append("started_at = CURRENT_TIMESTAMP")
+            if finished:
+                assignments.append("finished_at = CURRENT_TIMESTAMP")
+            cursor.execute(f'UPDATE jobs SET {", ".join(assignments)} WHERE id = ?', (*fields.values(), job_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+def get_job(job_id: str):
+    """读取任务状态和结果"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('''
+        SELECT id, job_type, payload, status, progress, progress_message, result, error,
+               cancel_requested, created_at, started_at, finished_at
+        FROM jobs WHERE id = ?
+        ''', (job_id,))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        return {
+            "job_id": row[0],
+            "job_type": row[1],
+            "request": json.loads(row[2]),
+            "status": row[3],
+            "progress": row[4],
+            "progress_message": row[5],
+            "result": json.loads(row[6]) if row[6] else None,
+            "error": row[7],
+            "cancel_requested": bool(row[8]),
+            "created_at": row[9],
+            "started_at": row[10],
+            "finished_at": row[11]
+        }
+    finally:
+        conn.close()
+
+def recover_interrupted_jobs():
+    """把本机已退出进程遗留的排队/运行中任务标记为失败"""
+    host = socket.gethostname()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT id, owner FROM jobs WHERE status IN ('queued', 'running')")
+        interrupted = []
+        for job_id, owner in cursor.fetchall():
+            owner_host, _, owner_pid = (owner or '').rpartition(':')
+            if owner_host != host or not owner_pid.isdigit():
+                continue
+            try:
+                os.kill(int(owner_pid), 0)
+            except ProcessLookupError:
+                interrupted.append((job_id,))
+            except OSError:
+                pass
+        cursor.executemany('''
+        UPDATE jobs SET status = 'failed', error = '服务重启，任务中断', finished_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+        ''', interrupted)
+        conn.commit()
+    finally:
+        conn.close()
+
+@app.post("/api/jobs", status_code=202)
+async def submit_job(request: JobRequest):
+    """
+    提交异步任务（analysis / screen / batch_refresh / import），立即返回任务ID
+    """
+    try:
+        job_id = await asyncio.to_thread(JOB_MANAGER.submit, request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except OverflowError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return {"job_id": job_id, "status": "queued"}
+
+@app.get("/api/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """
+    查询任务状态、进度和结果
+    """
+    job = await asyncio.to_thread(get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
+
+@app.delete("/api/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """
+    取消排队中或运行中的任务
+    """
+    if not await asyncio.to_thread(JOB_MANAGER.cancel, job_id):
+        raise HTTPException(status_code=404, detail="任务不存在或已结束")
+    return {"job_id": job_id, "message": "已请求取消"}
+
 def analyze_financial_health_strategy(stock_code: str):
     """
     财务健康策略分析（使用更及时的季度数据）
@@ -1367,87 +4261,26 @@ def analyze_financial_health_strategy(stock_code: str):
         market_cap = fundamental_data.get('market_cap', 0)
         data_period = fundamental_data.get('data_period', 'annual')
         
-        # 财务健康评分系统（优化后的评分）
-        health_score = 0
-        
-        # 1. 资产负债率评分 (30%权重)
-        if debt_ratio < 30:
-            debt_score = 30
-        elif debt_ratio < 50:
-            debt_score = 20
-        elif debt_ratio < 70:
-            debt_score = 10
-        else:
-            debt_score = 0
-        
-        # 2. ROE评分 (25%权重)
-        if roe > 20:
-            roe_score = 25
-        elif roe > 15:
-            roe_score = 20
-        elif roe > 10:
-            roe_score = 15
-        elif roe > 5:
-            roe_score = 10
-        else:
-            roe_score = 0
-        
-        # 3. 增长稳定性评分 (25%权重) - 优先使用季度数据
-        growth_data = revenue_growth
-        growth_period = '季度同比'
-        
-        # 如果有半年度数据，也考虑在内（作为参考）
-        if semi_annual_growth is not None:
-            # 使用加权平均，季度数据权重60%，半年度数据权重40%
-            growth_data = revenue_growth * 0.6 + semi_annual_growth * 0.4
-            growth_period = '综合同比(季度+半年)'
-        
-        if growth_data > 20:
-            growth_score = 25
-        elif growth_data > 10:
-            growth_score = 20
-        elif growth_data > 5:
-            growth_score = 15
-        elif growth_data > 0:
-            growth_score = 10
-        else:
-            growth_score = 0
-        
-        # 4. 市值规模评分 (20%权重)
-        if market_cap > 1000:
-            size_score = 20
-        elif market_cap > 500:
-            size_score = 15
-        elif market_cap > 100:
-            size_score = 10
-        elif market_cap > 50:
-            size_score = 5
-        else:
-            size_score = 0
-        
-        health_score = debt_score + roe_score + growth_score + size_score
-        
-        # 判断财务健康等级
-        if health_score >= 80:
-            health_level = "excellent"
-            signal = "buy"
-        elif health_score >= 65:
-            health_level = "good"
-            signal = "buy"
-        elif health_score >= 50:
-            health_level = "fair"
-            signal = "hold"
-        elif health_score >= 30:
-            health_level = "poor"
-            signal = "sell"
-        else:
-            health_level = "very_poor"
-            signal = "sell"
+        # 财务健康评分（与全市场批量评分共用同一套向量化规则）；行业样本充足时负债率、ROE 按行业百分位计分
+        scores = score_financial_health(pd.DataFrame([fundamental_data], index=[stock_code]),
+                                        percentiles=INDUSTRY_VALUATION.percentile_frame([stock_code]))
+        debt_score = scores['debt_score'].iloc[0].item()
+        roe_score = scores['roe_score'].iloc[0].item()
+        growth_score = scores['growth_score'].iloc[0].item()
+        size_score = scores['size_score'].iloc[0].item()
+        health_score = scores['health_score'].iloc[0].item()
+        health_level = str(scores['health_level'].iloc[0])
+        signal = str(scores['signal'].iloc[0])
+        growth_period = str(scores['growth_period'].iloc[0])
+        combined_growth = scores['combined_growth'].iloc[0].item()
+        growth_data = revenue_growth if np.isnan(combined_growth) else combined_growth
+        scoring_basis = "industry_relative" if scores['industry_relative'].iloc[0] else "absolute"
         
         return {
             "signal": signal,
             "health_score": round(health_score, 1),
             "health_level": health_level,
+            "scoring_basis": scoring_basis,
             "debt_ratio": debt_ratio,
             "roe": roe,
             "revenue_growth": revenue_growth,
@@ -1464,7 +4297,10 @@ def analyze_financial_health_strategy(stock_code: str):
             "data_source": fundamental_data.get('data_source', 'unknown'),
             "data_period": data_period,
             "stock_name": fundamental_data.get('stock_name', ''),
-            "last_update": fundamental_data.get('last_update', '')
+            "last_update": fundamental_data.get('last_update', ''),
+            "industry_relative": industry_relative_valuation(stock_code, {
+                "debt_ratio": 30, "roe": 25
+            })
         }
         
     except Exception as e:
@@ -1478,7 +4314,21 @@ def analyze_financial_health_strategy(stock_code: str):
         }
 
 if __name__ == "__main__":
-    init_database()
-    clean_expired_cache()
+    import argparse
     import uvicorn
-    uvicorn.run(app, host="127.0.0.1", port=8000)
\ No newline at end of file
+
+    parser = argparse.ArgumentParser(description="股票分析后端服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", "1")),
+                        help="worker 进程数，多个 worker 共享 STOCKS_DB_PATH 指向的缓存数据库")
+    args = parser.parse_args()
+
+    # 绝对路径保证所有 worker 打开同一个数据库文件
+    os.environ['STOCKS_DB_PATH'] = os.path.abspath(DB_PATH)
+    # 多 worker 时先在主进程完成建表迁移，避免各 worker 并发执行 ALTER TABLE；过期清理由 worker 在后台执行
+    if args.workers > 1:
+        init_database()
+        uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers)
+    else:
+        uvicorn.run(app, host=args.host, port=args.port)
\ No newline at end of file
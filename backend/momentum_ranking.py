@@ -0,0 +1,180 @@
+"""
+截面动量排名
+
+维护已跟踪股票（行情缓存中的全部股票）的 N 日动量有序索引：
+- 首次使用某个回看期时，对各股票最近 N+1 根K线做一次向量化计算
+- 之后只增量读取新写入的行情缓存，逐只更新有序索引；行情缓存行被淘汰或删除的股票定期移出样本
+- 单只股票的百分位查询为 O(log n) 的二分查找，被分析股票以本次分析的行情参与排名
+- 历史逐日百分位按交易日期对齐各股票的逐日动量（停牌日不参与当日排名），用于生成信号时间线
+"""
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+class MomentumUniverse:
+    """
+    全市场动量排名服务
+    fetch_updates(since_id) 返回 [(行情缓存id, 股票代码, 日期序列, 收盘价序列)]，按 id 递增
+    fetch_codes() 返回行情缓存中当前仍存在的股票代码，至多每 prune_seconds 秒调用一次，
+    不在其中的股票从样本中移除
+    """
+
+    def __init__(self, fetch_updates: Callable[[int], Iterable[Tuple[int, str, List[str], List[float]]]],
+                 fetch_codes: Optional[Callable[[], Iterable[str]]] = None,
+                 history_size: int = 260, prune_seconds: float = 60):
+        self.fetch_updates = fetch_updates
+        self.fetch_codes = fetch_codes
+        self.history_size = history_size
+        self.prune_seconds = prune_seconds
+        # 数据版本：最大行情缓存 id 与样本数（移除股票时 id 不变，样本数变化）
+        self.version = "0-0"
+        self._last_id = 0
+        self._pruned_at: Optional[float] = None
+        # 股票代码 -> (日期数组, 收盘价数组)，日期升序
+        self._series: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        # 回看期 -> (股票代码 -> 动量值, 有序动量值列表)
+        self._indexes: Dict[int, Tuple[Dict[str, float], List[float]]] = {}
+        # 回看期 -> 股票代码 -> 逐日动量（与该股票日期数组等长），按需计算
+        self._rolling: Dict[int, Dict[str, np.ndarray]] = {}
+        self._lock = threading.Lock()
+
+    def refresh(self) -> str:
+        """读取新写入的行情、移除已不在行情缓存中的股票，增量更新各回看期的排名，返回当前数据版本"""
+        updates = list(self.fetch_updates(self._last_id))
+        present = None
+        now = time.monotonic()
+        if self.fetch_codes is not None and (self._pruned_at is None or now - self._pruned_at >= self.prune_seconds):
+            # 在读取更新之后取代码集合：两次读取之间新写入的股票在集合中，不会被误删
+            present = set(self.fetch_codes())
+            self._pruned_at = now
+        if not updates and present is None:
+            return self.version
+        with self._lock:
+            for cache_id, stock_code, dates, closes in updates:
+                self._series[stock_code] = (
+                    np.asarray([str(d)[:10] for d in dates[-self.history_size:]]),
+                    np.asarray(closes[-self.history_size:], dtype=float),
+                )
+                self._update(stock_code)
+                self._last_id = max(self._last_id, cache_id)
+            if present is not None:
+                for stock_code in [code for code in self._series if code not in present]:
+                    del self._series[stock_code]
+                    self._update(stock_code)
+            self.version = f"{self._last_id}-{len(self._series)}"
+        return self.version
+
+    def rank(self, stock_code: str, lookback: int, momentum: Optional[float] = None) -> Optional[Dict[str, float]]:
+        """
+        查询股票在全市场中的动量百分位
+        momentum 为本次分析行情算出的动量，替代样本中该股票（可能较旧）的值参与排名；
+        未传入时使用样本中的值
+        返回 {"momentum", "percentile", "rank", "universe_size"}，无可用动量时返回 None
+        """
+        with self._lock:
+            values, ordered = self._indexes.get(lookback) or self._build_index(lookback)
+            stored = values.get(stock_code)
+            if momentum is None:
+                momentum = stored
+            if momentum is None or not np.isfinite(momentum):
+                return None
+            # 其他股票中不高于该动量的个数，加上股票自身
+            others_at_or_below = bisect_right(ordered, momentum) - (1 if stored is not None and stored <= momentum else 0)
+            at_or_below = others_at_or_below + 1
+            size = len(ordered) - (1 if stored is not None else 0) + 1
+            return {
+                "momentum": float(momentum),
+                # 百分位：不高于该股票动量的样本占比
+                "percentile": at_or_below / size,
+                # 名次：1 为动量最强
+                "rank": size - at_or_below + 1,
+                "universe_size": size,
+            }
+
+    def percentile_history(self, closes, dates, lookback: int, stock_code: str = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        计算一段收盘价序列逐日的 N 日动量在全市场中的百分位
+        其他股票的动量在各自K线上计算，再按日期对齐到 dates（当日无K线的股票不参与当日排名）；
+        样本中的 stock_code 本身以传入的 closes 计入。
+        返回 (百分位数组, 样本数数组)，长度与 closes 相同，当日动量无法计算时百分位为 NaN
+        """
+        closes = np.asarray(closes, dtype=float)
+        dates = np.asarray([str(d)[:10] for d in dates])
+        own = rolling_momentum(closes[None, :], lookback)[0]
+        with self._lock:
+            rolling = self._rolling.setdefault(lookback, {})
+            series = []
+            for code, (other_dates, other_closes) in self._series.items():
+                if code == stock_code or len(other_dates) == 0:
+                    continue
+                if code not in rolling:
+                    rolling[code] = rolling_momentum(other_closes[None, :], lookback)[0]
+                series.append((other_dates, rolling[code]))
+        panel = np.full((len(series), len(closes)), np.nan)
+        for row, (other_dates, momentum) in zip(panel, series):
+            positions = np.searchsorted(other_dates, dates)
+            clipped = np.minimum(positions, len(other_dates) - 1)
+            matched = (positions < len(other_dates)) & (other_dates[clipped] == dates)
+            row[matched] = momentum[clipped[matched]]
+        valid = np.isfinite(panel)
+        own_valid = np.isfinite(own)
+        sizes = valid.sum(axis=0) + own_valid
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # 百分位：不高于该股票当日动量的样本占比（含自身），与 rank() 的定义一致
+            percentiles = ((valid & (panel <= own)).sum(axis=0) + 1) / sizes
+        percentiles[~own_valid] = np.nan
+        return percentiles, sizes
+
+    def _build_index(self, lookback: int):
+        """对各股票最近 N+1 根K线向量化计算 N 日动量并建立有序索引"""
+        codes = [code for code, (_, closes) in self._series.items() if len(closes) > lookback]
+        values, ordered = {}, []
+        if codes:
+            panel = np.vstack([self._series[code][1][-(lookback + 1):] for code in codes])
+            with np.errstate(divide='ignore', invalid='ignore'):
+                momentum = panel[:, -1] / panel[:, 0] - 1
+            valid = np.isfinite(momentum)
+            values = dict(zip(np.asarray(codes)[valid].tolist(), momentum[valid].tolist()))
+            ordered = np.sort(momentum[valid]).tolist()
+        self._indexes[lookback] = (values, ordered)
+        return values, ordered
+
+    def _update(self, stock_code: str):
+        """股票行情变化或被移除后，更新各回看期的有序索引并丢弃其逐日动量缓存"""
+        for lookback, index in self._indexes.items():
+            self._reposition(index, stock_code, self._momentum(stock_code, lookback))
+        for rolling in self._rolling.values():
+            rolling.pop(stock_code, None)
+
+    def _momentum(self, stock_code: str, lookback: int) -> Optional[float]:
+        if stock_code not in self._series:
+            return None
+        closes = self._series[stock_code][1]
+        if len(closes) <= lookback or closes[-(lookback + 1)] == 0:
+            return None
+        momentum = float(closes[-1] / closes[-(lookback + 1)] - 1)
+        return momentum if np.isfinite(momentum) else None
+
+    @staticmethod
+    def _reposition(index, stock_code: str, momentum: Optional[float]):
+        values, ordered = index
+        previous = values.pop(stock_code, None)
+        if previous is not None:
+            del ordered[bisect_left(ordered, previous)]
+        if momentum is not None:
+            values[stock_code] = momentum
+            insort(ordered, momentum)
+
+
+def rolling_momentum(panel: np.ndarray, lookback: int) -> np.ndarray:
+    """逐日 N 日动量：现价 / N 日前价格 - 1，前 N 根K线及除零结果为 NaN"""
+    momentum = np.full(panel.shape, np.nan)
+    if 0 < lookback < panel.shape[1]:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            momentum[:, lookback:] = panel[:, lookback:] / panel[:, :-lookback] - 1
+        momentum[~np.isfinite(momentum)] = np.nan
+    return momentum
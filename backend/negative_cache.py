@@ -0,0 +1,97 @@
+"""
+负缓存
+
+记住上游查询失败的结果，短时间内重复的请求在本地直接返回，不再请求上游：
+- not_found：上游返回空数据（退市、代码不存在等）
+- upstream_error：上游接口抛出异常（超时、限流、接口变更等）
+各错误类别有各自的有效期；与真实数据分开存放，不会被当作真实数据使用。
+内存中保存一份（命中只需一次字典查找），并写入共享存储，其他 worker 和等待租约的请求也能看到
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+NOT_FOUND = "not_found"
+UPSTREAM_ERROR = "upstream_error"
+
+
+class NegativeCacheHit(Exception):
+    """命中负缓存：上游最近对该查询返回了错误，在有效期内不再重试"""
+
+    def __init__(self, key: str, error_class: str, message: str, retry_after: float):
+        super().__init__(f"{message}（{int(retry_after) + 1} 秒内不再重试）")
+        self.key = key
+        self.error_class = error_class
+        self.message = message
+        self.retry_after = retry_after
+
+
+class NegativeCache:
+    """
+    ttls: 错误类别 -> 有效期（秒）
+    load(key) 从共享存储读取 (错误类别, 错误信息, 剩余有效秒数)，没有时返回 None
+    save(key, 错误类别, 错误信息, 有效秒数) 写入共享存储
+    remove(key) 从共享存储删除
+    """
+
+    def __init__(self, ttls: Dict[str, float],
+                 load: Optional[Callable[[str], Optional[Tuple[str, str, float]]]] = None,
+                 save: Optional[Callable[[str, str, str, float], None]] = None,
+                 remove: Optional[Callable[[str], None]] = None,
+                 max_entries: int = 10000):
+        self.ttls = ttls
+        self.load = load
+        self.save = save
+        self.remove = remove
+        self.max_entries = max_entries
+        # 键 -> (错误类别, 错误信息, 失效时刻 time.monotonic)
+        self._entries: "OrderedDict[str, Tuple[str, str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, shared: bool = True) -> Optional[NegativeCacheHit]:
+        """查询负缓存，命中时返回 NegativeCacheHit（不抛出），shared 为 False 时只查内存"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[2] > now:
+                    return NegativeCacheHit(key, entry[0], entry[1], entry[2] - now)
+                del self._entries[key]
+        if not shared or self.load is None:
+            return None
+        loaded = self.load(key)
+        if loaded is None:
+            return None
+        error_class, message, remaining = loaded
+        if remaining <= 0:
+            return None
+        self._remember(key, error_class, message, now + remaining)
+        return NegativeCacheHit(key, error_class, message, remaining)
+
+    def put(self, key: str, error_class: str, message: str):
+        """记录一次失败，有效期按错误类别；未配置有效期的类别不缓存"""
+        ttl = self.ttls.get(error_class, 0)
+        if ttl <= 0:
+            return
+        message = str(message)[:500]
+        self._remember(key, error_class, message, time.monotonic() + ttl)
+        if self.save is not None:
+            self.save(key, error_class, message, ttl)
+
+    def discard(self, key: str):
+        """移除负缓存（内存和共享存储），之后的请求重新访问上游"""
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.remove is not None:
+            self.remove(key)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remember(self, key: str, error_class: str, message: str, expires_at: float):
+        with self._lock:
+            self._entries[key] = (error_class, message, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
@@ -0,0 +1,130 @@
+"""
+组合风险分析
+
+对一组持仓一次性向量化计算，不逐只调用单股分析接口：
+- 按交易日对齐各持仓的收盘价，得到 (持仓 × 交易日) 收益率矩阵，停牌等缺失日为 NaN
+- 协方差 / 相关系数按两两共同有效的交易日计算（pairwise complete），
+  全部由掩码矩阵乘法得到，单只股票停牌不会让其余持仓丢掉这些交易日
+- 组合波动率、相对基准指数的 beta、各持仓的风险贡献
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+TRADING_DAYS_PER_YEAR = 252
+# 两两共同有效的交易日少于该值时不计算协方差 / 相关系数
+MIN_OBSERVATIONS = 20
+
+
+def align_closes(series: Sequence[Tuple[Sequence[str], Sequence[float]]]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    把各持仓的 (日期, 收盘价) 按日期并集对齐
+    返回 (日期数组, 收盘价面板)，面板形状为 (持仓数, 日期数)，无数据的位置为 NaN
+    """
+    if not series:
+        return np.array([], dtype=str), np.empty((0, 0))
+    all_dates = np.unique(np.concatenate([np.asarray(dates, dtype=str) for dates, _ in series]))
+    panel = np.full((len(series), len(all_dates)), np.nan)
+    for row, (dates, closes) in zip(panel, series):
+        row[np.searchsorted(all_dates, np.asarray(dates, dtype=str))] = np.asarray(closes, dtype=float)
+    return all_dates, panel
+
+
+def daily_returns(panel: np.ndarray) -> np.ndarray:
+    """逐日收益率，前一日或当日缺失、价格非正时为 NaN；长度比输入少 1"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = panel[..., 1:] / panel[..., :-1] - 1
+    returns[~np.isfinite(returns) | (panel[..., :-1] <= 0)] = np.nan
+    return returns
+
+
+def pairwise_moments(x: np.ndarray, y: np.ndarray, min_observations: int = MIN_OBSERVATIONS):
+    """
+    x (m × T) 与 y (n × T) 各行两两在共同有效日上的样本协方差及双方方差
+    返回 (协方差, x 方差, y 方差, 共同样本数)，均为 (m × n)，样本不足处为 NaN
+    """
+    mask_x, mask_y = np.isfinite(x), np.isfinite(y)
+    fx, fy = mask_x.astype(float), mask_y.astype(float)
+    vx, vy = np.where(mask_x, x, 0.0), np.where(mask_y, y, 0.0)
+    count = fx @ fy.T
+    sum_x = vx @ fy.T          # x_i 在 y_j 有效日上的和
+    sum_y = fx @ vy.T          # y_j 在 x_i 有效日上的和
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cross = vx @ vy.T - sum_x * sum_y / count
+        var_x = (vx * vx) @ fy.T - sum_x * sum_x / count
+        var_y = fx @ (vy * vy).T - sum_y * sum_y / count
+        scale = 1.0 / (count - 1)
+    insufficient = count < max(min_observations, 2)
+    results = []
+    for moment in (cross * scale, np.maximum(var_x, 0.0) * scale, np.maximum(var_y, 0.0) * scale):
+        moment[insufficient] = np.nan
+        results.append(moment)
+    return results[0], results[1], results[2], count
+
+
+def analyze_portfolio(returns: np.ndarray, weights: np.ndarray, benchmark: Optional[np.ndarray] = None,
+                      min_observations: int = MIN_OBSERVATIONS) -> Dict[str, object]:
+    """
+    returns: (持仓数 × 交易日) 日收益率，weights: 持仓权重（按绝对值之和归一化）
+    benchmark: 与 returns 对齐的基准指数日收益率（可选）
+    年化口径按每年 TRADING_DAYS_PER_YEAR 个交易日
+    """
+    weights = np.asarray(weights, dtype=float)
+    gross = np.abs(weights).sum()
+    weights = weights / gross if gross > 0 else weights
+
+    covariance, var_i, var_j, observations = pairwise_moments(returns, returns, min_observations)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        correlation = covariance / np.sqrt(var_i * var_j)
+    np.clip(correlation, -1.0, 1.0, out=correlation)
+    volatility = np.sqrt(np.diag(covariance) * TRADING_DAYS_PER_YEAR)
+
+    # 样本不足的持仓对按不相关处理，组合方差只用可计算的部分
+    usable = np.nan_to_num(covariance)
+    marginal = usable @ weights
+    portfolio_variance = max(float(weights @ marginal), 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        risk_contribution = weights * marginal / portfolio_variance if portfolio_variance > 0 else np.full(len(weights), np.nan)
+
+    result = {
+        "weights": weights,
+        "covariance": covariance * TRADING_DAYS_PER_YEAR,
+        "correlation": correlation,
+        "observations": observations,
+        "volatility": volatility,
+        "risk_contribution": risk_contribution,
+        "portfolio_volatility": float(np.sqrt(portfolio_variance * TRADING_DAYS_PER_YEAR)),
+        "beta": np.full(len(weights), np.nan),
+        "portfolio_beta": None,
+    }
+    if benchmark is not None and np.isfinite(benchmark).sum() >= min_observations:
+        cross, _, benchmark_var, _ = pairwise_moments(returns, benchmark[None, :], min_observations)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            beta = (cross / benchmark_var)[:, 0]
+        result["beta"] = beta
+        valid = np.isfinite(beta)
+        if valid.any():
+            # 无法计算 beta 的持仓不计入，剩余权重按比例放大
+            covered = np.abs(weights[valid]).sum()
+            result["portfolio_beta"] = float(weights[valid] @ beta[valid] / covered) if covered > 0 else None
+    return result
+
+
+def summarize_signals(signal_rows: Sequence[Tuple[str, str, str]], weights: Dict[str, float]) -> Dict[str, Dict[str, float]]:
+    """
+    汇总各策略的最新信号：signal_rows 为 (股票代码, 策略, 信号)
+    返回 策略 -> {信号: 持仓数, "<信号>_weight": 权重合计}
+    """
+    summary: Dict[str, Dict[str, float]] = {}
+    for stock_code, strategy, signal in signal_rows:
+        bucket = summary.setdefault(strategy, {})
+        signal = signal or "unknown"
+        bucket[signal] = bucket.get(signal, 0) + 1
+        bucket[f"{signal}_weight"] = bucket.get(f"{signal}_weight", 0.0) + weights.get(stock_code, 0.0)
+    return summary
+
+
+def finite_list(values: np.ndarray, digits: int = 6) -> List:
+    """转为 JSON 可序列化的嵌套列表，NaN / inf 转为 None"""
+    values = np.asarray(values, dtype=float)
+    return np.where(np.isfinite(values), np.round(values, digits), None).tolist()
@@ -0,0 +1,71 @@
+"""
+本地复权计算
+
+行情只保存一份不复权的原始K线，另存每只股票的后复权因子（除权除息日 -> 累计因子），
+前复权 / 后复权 / 不复权都由原始K线和因子在本地向量化计算：
+- 后复权价 = 原始价 × 当日适用的累计因子
+- 前复权价 = 原始价 × 当日因子 / 最新因子
+分红送转只改变因子表，已保存的原始K线不受影响，增量追加新K线后历史数据依然有效
+"""
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+ADJUST_MODES = ("qfq", "hfq", "none")
+PRICE_COLUMNS = ("开盘", "收盘", "最高", "最低")
+
+
+def factors_at(bar_dates: Sequence[str], factor_dates: Sequence[str], factors: Sequence[float]) -> np.ndarray:
+    """
+    每根K线适用的累计因子：不晚于K线日期的最近一个除权除息日的因子
+    早于第一个除权除息日的K线使用第一个因子；没有因子时全部为 1
+    """
+    if len(factors) == 0:
+        return np.ones(len(bar_dates))
+    positions = np.searchsorted(np.asarray(factor_dates, dtype=str), np.asarray(bar_dates, dtype=str), side='right') - 1
+    return np.asarray(factors, dtype=float)[np.clip(positions, 0, None)]
+
+
+def adjust_rows(rows: List[Dict[str, Any]], factor_table: List[Tuple[str, float]], mode: str) -> List[Dict[str, Any]]:
+    """
+    按复权方式计算K线，rows 为按日期升序的原始K线，factor_table 为按日期升序的 [(除权除息日, 累计因子)]
+    价格列按因子缩放，涨跌额、涨跌幅按复权后的收盘价重算，成交量、成交额不变
+    """
+    if mode not in ADJUST_MODES:
+        raise ValueError(f"复权方式只支持: {', '.join(ADJUST_MODES)}")
+    if mode == "none" or not rows:
+        return [dict(row) for row in rows]
+    dates = [str(row['日期'])[:10] for row in rows]
+    scale = factors_at(dates, [d for d, _ in factor_table], [f for _, f in factor_table])
+    if mode == "qfq":
+        scale = scale / scale[-1]
+
+    adjusted = {column: np.array([float(row[column]) for row in rows]) * scale
+                for column in PRICE_COLUMNS if column in rows[0]}
+    closes = adjusted.get('收盘')
+    if closes is not None:
+        previous = np.concatenate(([np.nan], closes[:-1]))
+        change = closes - previous
+        with np.errstate(invalid='ignore', divide='ignore'):
+            change_pct = change / previous * 100
+
+    result = []
+    for i, row in enumerate(rows):
+        item = dict(row)
+        for column, values in adjusted.items():
+            item[column] = round(float(values[i]), 4)
+        if closes is not None and i > 0:
+            if '涨跌额' in item:
+                item['涨跌额'] = round(float(change[i]), 4)
+            if '涨跌幅' in item:
+                item['涨跌幅'] = round(float(change_pct[i]), 2)
+        result.append(item)
+    return result
+
+
+def merge_bars(existing: List[Dict[str, Any]], new: List[Dict[str, Any]], start_date: str) -> List[Dict[str, Any]]:
+    """合并增量K线（同一日期以新数据为准），丢弃早于 start_date 的K线，按日期升序返回"""
+    merged = {str(row['日期'])[:10]: row for row in existing}
+    for row in new:
+        merged[str(row['日期'])[:10]] = {**row, '日期': str(row['日期'])[:10]}
+    return [merged[d] for d in sorted(merged) if d >= start_date]
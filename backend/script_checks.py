@@ -0,0 +1,24 @@
+"""
+脚本式测试与基准的结果汇总
+
+test_*.py / bench_*.py 以脚本方式运行（python test_xxx.py）：逐项调用 check() 打印 ✅ / ❌，
+最后调用 finish() 打印失败数，有失败项时以非零状态退出
+"""
+_failures = 0
+
+
+def check(name: str, ok: bool, detail="") -> bool:
+    """记录一项检查，失败时附带 detail 便于定位"""
+    global _failures
+    if ok:
+        print(f"✅ {name}")
+    else:
+        _failures += 1
+        print(f"❌ {name} {detail}")
+    return ok
+
+
+def finish(label: str = "Testing"):
+    print(f"\n{label} complete! {_failures} failed")
+    if _failures:
+        raise SystemExit(1)
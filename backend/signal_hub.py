@@ -0,0 +1,137 @@
+"""
+实时信号推送
+
+客户端通过 WebSocket 订阅一组股票，服务端按固定间隔对所有被订阅的股票各计算一次，
+只把相对上一次的变化推送给订阅了该股票的客户端：
+- bars：新增的K线
+- signals：发生变化的策略信号
+- highlight：高亮状态翻转
+计算次数与客户端数量无关，N 个客户端 × M 只股票的轮询变为每只股票每个周期一次计算
+"""
+import asyncio
+from typing import Any, Dict, List, Optional, Set
+
+
+class SignalHub:
+    """
+    订阅管理与增量分发（在事件循环线程中使用）
+    每个客户端对应一个有界队列，队列满时断开该客户端，慢客户端不会拖慢其他客户端
+    """
+
+    def __init__(self, max_queue: int = 256, max_codes_per_client: int = 200):
+        self.max_queue = max_queue
+        self.max_codes_per_client = max_codes_per_client
+        self._subscriptions: Dict[asyncio.Queue, Set[str]] = {}
+        # 股票代码 -> 最近一次计算的状态
+        self._states: Dict[str, Dict[str, Any]] = {}
+        self._wake = asyncio.Event()
+
+    def connect(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.max_queue)
+        self._subscriptions[queue] = set()
+        return queue
+
+    def disconnect(self, queue: asyncio.Queue):
+        self._subscriptions.pop(queue, None)
+        self._forget_unsubscribed()
+
+    def subscribe(self, queue: asyncio.Queue, codes: List[str]) -> List[str]:
+        """订阅股票，已有状态的立即推送一次完整快照；返回本次新增的订阅"""
+        subscribed = self._subscriptions.setdefault(queue, set())
+        requested = [code for code in dict.fromkeys(codes) if code not in subscribed]
+        added = requested[:max(0, self.max_codes_per_client - len(subscribed))]
+        subscribed.update(added)
+        if len(added) < len(requested):
+            self._send(queue, {
+                "type": "error",
+                "detail": f"每个连接最多订阅 {self.max_codes_per_client} 只股票",
+                "codes": requested[len(added):],
+            })
+        self._send(queue, {"type": "subscribed", "codes": added})
+        pending = False
+        for code in added:
+            state = self._states.get(code)
+            if state is None:
+                pending = True
+            else:
+                self._send(queue, {"type": "snapshot", "stock_code": code, **state})
+        if pending:
+            # 新股票不等到下一个周期，立即计算
+            self._wake.set()
+        return added
+
+    def unsubscribe(self, queue: asyncio.Queue, codes: List[str]):
+        self._subscriptions.get(queue, set()).difference_update(codes)
+        self._forget_unsubscribed()
+
+    def subscribed_codes(self) -> List[str]:
+        """全部客户端订阅的股票（去重）"""
+        return sorted(set().union(*self._subscriptions.values())) if self._subscriptions else []
+
+    def client_count(self) -> int:
+        return len(self._subscriptions)
+
+    async def wait(self, timeout: float):
+        """等待下一个计算周期，有新订阅时提前返回"""
+        try:
+            await asyncio.wait_for(self._wake.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._wake.clear()
+
+    def publish(self, stock_code: str, state: Dict[str, Any]):
+        """
+        发布一只股票的最新状态：state 包含 bars（K线列表）、signals（策略 -> 信号）、highlight
+        第一次发布时推送完整快照，之后只推送变化，没有变化时不推送
+        """
+        previous = self._states.get(stock_code)
+        stored = {
+            "bars": state["bars"][-1:],
+            "signals": dict(state["signals"]),
+            "highlight": state["highlight"],
+        }
+        self._states[stock_code] = stored
+        if previous is None:
+            message = {"type": "snapshot", "stock_code": stock_code, **stored}
+        else:
+            message = self._delta(stock_code, previous, state)
+            if message is None:
+                return
+        for queue, codes in list(self._subscriptions.items()):
+            if stock_code in codes:
+                self._send(queue, message)
+
+    @staticmethod
+    def _delta(stock_code: str, previous: Dict[str, Any], state: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        delta: Dict[str, Any] = {}
+        last_date = previous["bars"][-1][0] if previous["bars"] else None
+        # 新K线：日期晚于上次最后一根的K线；最后一根K线的数据被修正时也重新推送
+        new_bars = [bar for bar in state["bars"] if last_date is None or bar[0] > last_date]
+        if not new_bars and state["bars"] and previous["bars"] and state["bars"][-1] != previous["bars"][-1]:
+            new_bars = state["bars"][-1:]
+        if new_bars:
+            delta["bars"] = new_bars
+        changed = {name: signal for name, signal in state["signals"].items() if previous["signals"].get(name) != signal}
+        if changed:
+            delta["signals"] = changed
+        if state["highlight"] != previous["highlight"]:
+            delta["highlight"] = state["highlight"]
+        if not delta:
+            return None
+        return {"type": "delta", "stock_code": stock_code, **delta}
+
+    def _send(self, queue: asyncio.Queue, message: Dict[str, Any]):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # 客户端消费不过来：清空队列并通知断开，由连接处理协程关闭连接
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait({"type": "overflow"})
+            self._subscriptions.pop(queue, None)
+
+    def _forget_unsubscribed(self):
+        """不再被任何客户端订阅的股票丢弃状态，重新订阅时推送完整快照"""
+        subscribed = set(self.subscribed_codes())
+        for code in [code for code in self._states if code not in subscribed]:
+            del self._states[code]
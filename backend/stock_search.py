@@ -0,0 +1,88 @@
+"""
+股票代码 / 名称搜索
+
+内存中维护全部A股的代码、名称、拼音首字母三组有序键，前缀查询为二分查找，
+每次搜索不访问数据库和上游接口；同一份索引也用于在请求上游前校验股票代码是否存在
+"""
+import re
+import threading
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+STOCK_CODE_PATTERN = re.compile(r'^\d{6}$')
+
+
+def pinyin_initials(name: str) -> str:
+    """名称的拼音首字母（小写），如 平安银行 -> payh；未安装 pypinyin 时返回空字符串"""
+    try:
+        from pypinyin import Style, lazy_pinyin
+    except ImportError:
+        return ''
+    return ''.join(part[0] for part in lazy_pinyin(name, style=Style.FIRST_LETTER) if part and part[0].isalnum()).lower()
+
+
+class StockSearchIndex:
+    """
+    前缀搜索索引
+    load_listing() 返回 (数据版本, [(股票代码, 股票名称, 拼音首字母)])
+    """
+
+    def __init__(self, load_listing: Callable[[], Tuple[Any, Iterable[Tuple[str, str, str]]]]):
+        self.load_listing = load_listing
+        self.version = None
+        self._names: Dict[str, Tuple[str, str]] = {}
+        # 按匹配优先级排列：代码、拼音首字母、名称，各自为 [(键, 股票代码)] 有序列表
+        self._keys: List[List[Tuple[str, str]]] = [[], [], []]
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """数据版本变化时重建索引"""
+        version, listing = self.load_listing()
+        if version == self.version:
+            return
+        names, keys = {}, [[], [], []]
+        for stock_code, stock_name, initials in listing:
+            names[stock_code] = (stock_name, initials or '')
+            keys[0].append((stock_code, stock_code))
+            if initials:
+                keys[1].append((initials.lower(), stock_code))
+            if stock_name:
+                keys[2].append((stock_name.lower(), stock_code))
+        for key_list in keys:
+            key_list.sort()
+        with self._lock:
+            self._names, self._keys, self.version = names, keys, version
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, stock_code: str) -> bool:
+        return stock_code in self._names
+
+    def name(self, stock_code: str):
+        """代码名称列表中的股票名称，没有时返回 None"""
+        entry = self._names.get(stock_code)
+        return entry[0] if entry else None
+
+    def search(self, query: str, limit: int = 10) -> List[Dict[str, str]]:
+        """前缀匹配代码、拼音首字母或名称，按此优先级返回最多 limit 条"""
+        query = (query or '').strip().lower()
+        if not query or limit <= 0:
+            return []
+        with self._lock:
+            names, keys = self._names, self._keys
+        found: Dict[str, None] = {}
+        for key_list in keys:
+            position = bisect_left(key_list, (query, ''))
+            while position < len(key_list) and len(found) < limit:
+                key, stock_code = key_list[position]
+                if not key.startswith(query):
+                    break
+                found.setdefault(stock_code)
+                position += 1
+            if len(found) >= limit:
+                break
+        return [
+            {"stock_code": stock_code, "stock_name": names[stock_code][0], "initials": names[stock_code][1]}
+            for stock_code in found
+        ]
@@ -0,0 +1,110 @@
+import numpy as np
+
+from downsample import bucket_starts, downsample_chart, lttb_indices, remap_history
+from script_checks import check, finish
+
+print("Testing chart downsampling against direct per-bucket references...")
+
+rng = np.random.default_rng(20261019)
+
+
+def random_chart(n):
+    closes = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    opens = closes * (1 + rng.normal(0, 0.005, n))
+    highs = np.maximum(opens, closes) * (1 + np.abs(rng.normal(0, 0.01, n)))
+    lows = np.minimum(opens, closes) * (1 - np.abs(rng.normal(0, 0.01, n)))
+    volumes = rng.integers(1e5, 1e6, n).astype(float)
+    dates = [f"d{i:05d}" for i in range(n)]
+    k_line = [[d, o, c, l, h] for d, o, c, l, h in zip(dates, opens.tolist(), closes.tolist(), lows.tolist(), highs.tolist())]
+    volume = [[d, v] for d, v in zip(dates, volumes.tolist())]
+    return k_line, volume
+
+
+def lttb_reference(values, max_points):
+    # 按 LTTB 原始描述逐区间计算（浮点区间边界）
+    n = len(values)
+    every = (n - 2) / (max_points - 2)
+    selected, a = [0], 0
+    for i in range(max_points - 2):
+        start, end = int(i * every) + 1, int((i + 1) * every) + 1
+        next_start, next_end = end, min(int((i + 2) * every) + 1, n - 1)
+        if i == max_points - 3:
+            cx, cy = n - 1, values[n - 1]
+        else:
+            cx, cy = np.mean(np.arange(next_start, next_end)), np.mean(values[next_start:next_end])
+        areas = [abs((a - cx) * (values[j] - values[a]) - (a - j) * (cy - values[a])) for j in range(start, end)]
+        a = start + int(np.argmax(areas))
+        selected.append(a)
+    selected.append(n - 1)
+    return np.array(selected)
+
+
+# Test 1: OHLC 区间聚合 = 区间首根开盘、末根收盘、最高价最大值、最低价最小值、成交量之和
+mismatches = 0
+for n, max_points in ((1003, 100), (5000, 800), (257, 256), (40, 10)):
+    k_line, volume = random_chart(n)
+    k_out, v_out, positions = downsample_chart(k_line, volume, max_points, "ohlc")
+    starts = np.append(bucket_starts(n, max_points), n)
+    if len(k_out) != max_points or len(v_out) != max_points:
+        mismatches += 1
+        continue
+    for b in range(max_points):
+        bucket = k_line[starts[b]:starts[b + 1]]
+        expected = [bucket[-1][0], bucket[0][1], bucket[-1][2], min(r[3] for r in bucket), max(r[4] for r in bucket)]
+        expected_volume = sum(r[1] for r in volume[starts[b]:starts[b + 1]])
+        if k_out[b][0] != expected[0] or not np.allclose(k_out[b][1:], expected[1:]) \
+                or not np.isclose(v_out[b][1], expected_volume):
+            mismatches += 1
+check("1. OHLC buckets take first open, last close, max high, min low, summed volume", mismatches == 0, f"{mismatches} mismatches")
+
+# Test 2: LTTB 保留首尾点、点数恰为 max_points，与逐区间参考实现一致
+mismatches = 0
+for n, max_points in ((1003, 100), (5000, 500), (12, 10), (300, 3)):
+    values = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    selected = lttb_indices(values, max_points)
+    if len(selected) != max_points or selected[0] != 0 or selected[-1] != n - 1 \
+            or not np.all(np.diff(selected) > 0) or not np.array_equal(selected, lttb_reference(values, max_points)):
+        mismatches += 1
+k_line, volume = random_chart(2000)
+k_out, v_out, _ = downsample_chart(k_line, volume, 400, "lttb")
+check("2. LTTB keeps endpoints, returns max_points points and matches the reference",
+      mismatches == 0 and len(k_out) == 400 and k_out[0] == k_line[0] and k_out[-1] == k_line[-1]
+      and all(row in k_line for row in k_out), f"{mismatches} mismatches")
+
+# Test 3: 原始下标 -> 输出下标映射指向包含该K线的区间，remap_history 按该映射移动信号变化点
+n, max_points = 1000, 100
+k_line, volume = random_chart(n)
+_, _, ohlc_positions = downsample_chart(k_line, volume, max_points, "ohlc")
+starts = bucket_starts(n, max_points)
+_, _, lttb_positions = downsample_chart(k_line, volume, max_points, "lttb")
+selected = lttb_indices([row[2] for row in k_line], max_points)
+check("3a. every bar maps to the bucket that contains it",
+      all(starts[ohlc_positions[i]] <= i and (ohlc_positions[i] + 1 == max_points or i < starts[ohlc_positions[i] + 1])
+          for i in range(n))
+      and all(selected[lttb_positions[i]] <= i and (lttb_positions[i] + 1 == max_points or i < selected[lttb_positions[i] + 1])
+              for i in range(n)))
+
+# 每个区间最多一次变化时，变化点原样映射到所在区间
+change_bars = sorted(rng.choice(np.arange(1, max_points), 30, replace=False) * (n // max_points) + 3)
+history = {"index": [0] + [int(i) for i in change_bars],
+           "signal": ["hold"] + ["buy" if j % 2 == 0 else "hold" for j in range(len(change_bars))]}
+remapped = remap_history(history, ohlc_positions)
+check("3b. remap_history moves each change point to its containing bucket",
+      remapped["index"] == [int(ohlc_positions[i]) for i in history["index"]] and remapped["signal"] == history["signal"],
+      remapped)
+
+# 同一区间内 buy 后立即回到 hold：保留 buy，hold 顺延到下一个输出点
+history = {"index": [0, 25, 26], "signal": ["hold", "buy", "hold"]}
+remapped = remap_history(history, ohlc_positions)
+check("3c. one-day buy/sell events inside a bucket are kept",
+      remapped == {"index": [0, 2, 3], "signal": ["hold", "buy", "hold"]}, remapped)
+
+# Test 4: max_points 不小于K线数时原样返回
+k_line, volume = random_chart(120)
+unchanged = all(
+    downsample_chart(k_line, volume, max_points, method) == (k_line, volume, None)
+    for max_points in (120, 500) for method in ("ohlc", "lttb")
+)
+check("4. max_points >= len(data) returns the data unchanged", unchanged)
+
+finish()
@@ -0,0 +1,151 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+import indicators
+from script_checks import check, finish
+
+from numpy.lib.stride_tricks import sliding_window_view
+
+print("Testing indicator kernels against pandas...")
+
+rng = np.random.default_rng(20240601)
+
+
+def random_closes(n, with_nan=False):
+    closes = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    if with_nan and n > 10:
+        closes[rng.integers(0, n, 3)] = np.nan
+        closes[:rng.integers(0, n // 2)] = np.nan
+    return closes
+
+
+def pandas_rsi(closes, period):
+    # 原 calculate_rsi 的实现
+    delta = pd.Series(closes).diff()
+    gain = delta.where(delta > 0, 0)
+    loss = -delta.where(delta < 0, 0)
+    rs = gain.rolling(window=period).mean() / loss.rolling(window=period).mean()
+    return (100 - (100 / (1 + rs))).to_numpy()
+
+
+# Test 1: EMA（adjust=True / False，含缺失值）
+mismatches = 0
+for trial in range(200):
+    closes = random_closes(int(rng.integers(1, 2000)), with_nan=trial % 2 == 0)
+    for span in (1, 2, 9, 12, 26, 200):
+        for adjust in (True, False):
+            expected = pd.Series(closes).ewm(span=span, adjust=adjust).mean().to_numpy()
+            actual = indicators.ema(closes, span, adjust)
+            if not np.allclose(actual, expected, rtol=1e-10, atol=1e-12, equal_nan=True):
+                mismatches += 1
+check("1. EMA matches pandas ewm", mismatches == 0, f"{mismatches} mismatches")
+
+# Test 2: MACD 默认口径与原实现一致
+closes = random_closes(250)
+series = pd.Series(closes)
+expected_macd = series.ewm(span=12).mean() - series.ewm(span=26).mean()
+expected_signal = expected_macd.ewm(span=9).mean()
+macd_line, signal_line, histogram = indicators.macd(closes)
+check("2. MACD matches previous pandas output",
+      np.allclose(macd_line, expected_macd) and np.allclose(signal_line, expected_signal)
+      and np.allclose(histogram, expected_macd - expected_signal))
+
+# Test 3: SMA 口径 RSI 与原实现一致（原实现产生有限值的位置）
+mismatches = 0
+for trial in range(200):
+    closes = random_closes(int(rng.integers(2, 1000)), with_nan=trial % 3 == 0)
+    for period in (2, 6, 14):
+        if len(closes) < period + 1:
+            continue
+        expected = pandas_rsi(closes, period)
+        actual = indicators.rsi(closes, period)
+        finite = np.isfinite(expected)
+        if not np.allclose(actual[finite], expected[finite], rtol=1e-9, atol=1e-9):
+            mismatches += 1
+check("3. SMA RSI matches previous pandas output", mismatches == 0, f"{mismatches} mismatches")
+
+# Test 4: 除零处理
+rising = np.arange(1.0, 31.0)
+flat = np.full(30, 10.0)
+check("4. RSI is 100 without losses and 50 on a flat window",
+      indicators.rsi(rising, 14)[-1] == 100 and indicators.rsi(flat, 14)[-1] == 50
+      and indicators.rsi(rising, 14, "wilder")[-1] == 100 and indicators.rsi(flat, 14, "wilder")[-1] == 50)
+
+# Test 5: Wilder RSI 与按定义逐日递推的结果一致
+closes = random_closes(500)
+delta = np.diff(closes)
+gains, losses = np.maximum(delta, 0), np.maximum(-delta, 0)
+avg_gain, avg_loss = gains[:14].mean(), losses[:14].mean()
+expected = [100 * avg_gain / (avg_gain + avg_loss)]
+for gain, loss in zip(gains[14:], losses[14:]):
+    avg_gain = (avg_gain * 13 + gain) / 14
+    avg_loss = (avg_loss * 13 + loss) / 14
+    expected.append(100 * avg_gain / (avg_gain + avg_loss))
+actual = indicators.rsi(closes, 14, "wilder")
+check("5. Wilder RSI matches the recursive definition",
+      np.isnan(actual[:14]).all() and np.allclose(actual[14:], expected, rtol=1e-10))
+
+# Test 6: 滚动均值/标准差/最大/最小值（含缺失值、停牌平台），以逐窗口直接计算为基准
+mismatches = 0
+for trial in range(200):
+    closes = random_closes(int(rng.integers(1, 600)), with_nan=trial % 3 == 0)
+    if trial % 4 == 0 and len(closes) > 40:
+        closes[5:35] = closes[5]
+    series = pd.Series(closes)
+    for window in (1, 2, 5, 15, 20, 60):
+        if window > len(closes):
+            continue
+        windows = sliding_window_view(closes, window)
+        pad = np.full(window - 1, np.nan)
+        exact_std = np.concatenate((pad, windows.std(axis=1, ddof=1))) if window > 1 else np.full(len(closes), np.nan)
+        checks = [
+            (indicators.rolling_mean(closes, window), series.rolling(window).mean().to_numpy(), 1e-9),
+            (indicators.rolling_std(closes, window), exact_std, 1e-6),
+            (indicators.rolling_max(closes, window), np.concatenate((pad, windows.max(axis=1))), 0),
+            (indicators.rolling_min(closes, window), np.concatenate((pad, windows.min(axis=1))), 0),
+        ]
+        for actual, expected, tolerance in checks:
+            if not np.allclose(actual, expected, rtol=tolerance, atol=tolerance, equal_nan=True):
+                mismatches += 1
+check("6. Rolling kernels match windowed reference", mismatches == 0, f"{mismatches} mismatches")
+
+# Test 7: 二维 (股票 × 交易日) 批量计算与逐只计算一致
+panel = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, (300, 250)), axis=1))
+panel[7, 40] = np.nan
+panel[9, 100:130] = panel[9, 100]
+ok = True
+for kernel in (indicators.rolling_mean, indicators.rolling_std, indicators.rolling_max, indicators.rolling_min):
+    per_stock = np.vstack([kernel(row, 20) for row in panel])
+    ok = ok and np.allclose(kernel(panel, 20), per_stock, equal_nan=True)
+check("7. Batched rolling kernels match per-stock results", ok)
+
+# Test 8: 耗时对比
+closes = random_closes(250)
+series = pd.Series(closes)
+
+
+def timed(func, repeat=500):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def compare(name, baseline, kernel, repeat=500):
+    baseline_us, kernel_us = timed(baseline, repeat), timed(kernel, repeat)
+    print(f"   {name}: pandas {baseline_us:.0f}µs, kernel {kernel_us:.0f}µs ({baseline_us / kernel_us:.1f}x)")
+
+
+print("\n8. Timing per call (250 bars):")
+compare("RSI", lambda: pandas_rsi(closes, 14), lambda: indicators.rsi(closes, 14))
+compare("MACD", lambda: (series.ewm(span=12).mean() - series.ewm(span=26).mean()).ewm(span=9).mean(),
+        lambda: indicators.macd(closes))
+for name in ("mean", "std", "max", "min"):
+    kernel = getattr(indicators, f"rolling_{name}")
+    compare(f"rolling {name}", lambda: getattr(series.rolling(20), name)(), lambda: kernel(closes, 20))
+frame = pd.DataFrame(panel.T)
+compare("300 stocks rolling std (2-D)", lambda: frame.rolling(20).std(), lambda: indicators.rolling_std(panel, 20), 20)
+
+finish()
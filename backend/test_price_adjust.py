@@ -0,0 +1,69 @@
+import numpy as np
+
+from price_adjust import adjust_rows, factors_at, merge_bars
+from script_checks import check, finish
+
+print("Testing local price adjustment against hand-computed qfq/hfq prices...")
+
+
+def bar(day, open_, close, high, low, volume=1000.0):
+    return {"日期": day, "开盘": open_, "收盘": close, "最高": high, "最低": low,
+            "成交量": volume, "涨跌额": 0.0, "涨跌幅": 0.0}
+
+
+# 原始（不复权）K线：01-08 除权除息，收盘价从 12 跳到 10
+raw = [
+    bar("2026-01-02", 9.8, 10.0, 10.1, 9.7),    # 早于第一个因子日期
+    bar("2026-01-05", 10.0, 10.5, 10.6, 9.9),
+    bar("2026-01-06", 10.5, 11.0, 11.2, 10.4),
+    bar("2026-01-07", 11.0, 12.0, 12.1, 10.9),
+    bar("2026-01-08", 10.0, 10.0, 10.3, 9.8),   # 除权除息日
+    bar("2026-01-09", 10.0, 10.2, 10.4, 9.9),
+]
+# 后复权累计因子：第一个除权除息日之前的K线沿用第一个因子
+factor_table = [("2026-01-05", 2.0), ("2026-01-08", 2.4)]
+
+# Test 1: 因子对齐（searchsorted）
+check("1. factors_at aligns bars to the latest factor date, earlier bars use the first factor",
+      np.array_equal(factors_at([r["日期"] for r in raw], [d for d, _ in factor_table], [f for _, f in factor_table]),
+                     [2.0, 2.0, 2.0, 2.0, 2.4, 2.4])
+      and np.array_equal(factors_at(["2026-01-02"], [], []), [1.0]))
+
+# Test 2: 后复权 = 原始价 × 当日因子
+hfq = adjust_rows(raw, factor_table, "hfq")
+expected_hfq_close = [20.0, 21.0, 22.0, 24.0, 24.0, 24.48]
+expected_hfq_high = [20.2, 21.2, 22.4, 24.2, 24.72, 24.96]
+check("2. hfq prices match raw × factor",
+      np.allclose([r["收盘"] for r in hfq], expected_hfq_close)
+      and np.allclose([r["最高"] for r in hfq], expected_hfq_high)
+      and np.allclose([r["开盘"] for r in hfq], [19.6, 20.0, 21.0, 22.0, 24.0, 24.0])
+      and np.allclose([r["最低"] for r in hfq], [19.4, 19.8, 20.8, 21.8, 23.52, 23.76]),
+      [r["收盘"] for r in hfq])
+
+# Test 3: 前复权 = 原始价 × 当日因子 / 最新因子，最新一段与原始价一致
+qfq = adjust_rows(raw, factor_table, "qfq")
+expected_qfq_close = [8.3333, 8.75, 9.1667, 10.0, 10.0, 10.2]
+check("3. qfq prices match raw × factor / latest factor",
+      np.allclose([r["收盘"] for r in qfq], expected_qfq_close, atol=1e-4)
+      and [r["收盘"] for r in qfq[4:]] == [10.0, 10.2],
+      [r["收盘"] for r in qfq])
+
+# Test 4: 涨跌额、涨跌幅按复权后的收盘价重算（除权除息日不再显示为下跌），成交量不变
+check("4. change columns are recomputed from adjusted closes",
+      qfq[4]["涨跌额"] == 0.0 and qfq[4]["涨跌幅"] == 0.0
+      and abs(qfq[5]["涨跌额"] - 0.2) < 1e-9 and qfq[5]["涨跌幅"] == 2.0
+      and hfq[3]["涨跌幅"] == round((24.0 - 22.0) / 22.0 * 100, 2)
+      and qfq[0]["涨跌额"] == raw[0]["涨跌额"]
+      and [r["成交量"] for r in qfq] == [r["成交量"] for r in raw])
+
+# Test 5: 不复权原样返回，且不修改输入
+none = adjust_rows(raw, factor_table, "none")
+check("5. none returns copies of the raw bars", none == raw and none[0] is not raw[0] and raw[0]["收盘"] == 10.0)
+
+# Test 6: 增量合并（同一日期以新数据为准，丢弃早于起始日期的K线）
+merged = merge_bars(raw[:4], [bar("2026-01-07", 11.0, 11.9, 12.1, 10.9), raw[4]], "2026-01-05")
+check("6. merge_bars replaces overlapping dates and trims the window",
+      [r["日期"] for r in merged] == ["2026-01-05", "2026-01-06", "2026-01-07", "2026-01-08"]
+      and merged[2]["收盘"] == 11.9)
+
+finish()
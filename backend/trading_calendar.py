@@ -0,0 +1,128 @@
+"""
+交易日历与缓存过期时间
+
+缓存不再按固定小时数过期，而是按数据真正可能发生变化的时间点：
+- 日线行情：有效至下一个交易日收盘后数据更新（周末、节假日、夜间都不会重复拉取）
+- 基本面：定期报告披露窗口内每个交易日收盘后过期，窗口外有效至下一个披露窗口开始
+交易日历由调用方提供（本地表 + 上游接口），未覆盖的日期按工作日估计
+"""
+import threading
+import time as time_module
+from bisect import bisect_left
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Callable, Iterable, List, Optional
+
+# 沪深交易所所在时区（无夏令时，使用固定偏移，不依赖系统时区数据库）
+MARKET_TZ = timezone(timedelta(hours=8), "Asia/Shanghai")
+# 收盘 15:00，日线数据一般在 15:30 前完成更新
+BAR_READY_TIME = time(15, 30)
+
+# 定期报告披露窗口（月, 日）闭区间：
+# 年报及一季报 1月1日-4月30日，半年报 7月1日-8月31日，三季报 10月1日-10月31日
+DISCLOSURE_WINDOWS = [((1, 1), (4, 30)), ((7, 1), (8, 31)), ((10, 1), (10, 31))]
+
+
+class TradingCalendar:
+    """
+    交易日历
+    load_dates() 返回交易日列表（date 或 YYYY-MM-DD 字符串），日历不覆盖今天时按 retry_seconds 间隔重新加载
+    """
+
+    def __init__(self, load_dates: Callable[[], Iterable], retry_seconds: float = 3600):
+        self.load_dates = load_dates
+        self.retry_seconds = retry_seconds
+        self._dates: List[date] = []
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _ensure_loaded(self, day: date):
+        if self._dates and self._dates[-1] >= day:
+            return
+        now = time_module.monotonic()
+        if self._loaded_at is not None and now - self._loaded_at < self.retry_seconds:
+            return
+        with self._lock:
+            if self._loaded_at is not None and now - self._loaded_at < self.retry_seconds:
+                return
+            self._loaded_at = now
+            try:
+                dates = sorted({d if isinstance(d, date) else date.fromisoformat(str(d)[:10]) for d in self.load_dates()})
+            except Exception as e:
+                print(f"加载交易日历失败，按工作日估计: {e}")
+                return
+            if dates:
+                self._dates = dates
+
+    def is_trading_day(self, day: date) -> bool:
+        self._ensure_loaded(day)
+        dates = self._dates
+        if dates and dates[0] <= day <= dates[-1]:
+            index = bisect_left(dates, day)
+            return dates[index] == day
+        # 日历未覆盖的日期按工作日估计
+        return day.weekday() < 5
+
+    def next_trading_day(self, day: date) -> date:
+        """day 之后（不含 day）的第一个交易日"""
+        candidate = day + timedelta(days=1)
+        # 最长假期不超过两周，设置上限防止日历数据异常时死循环
+        for _ in range(30):
+            if self.is_trading_day(candidate):
+                return candidate
+            candidate += timedelta(days=1)
+        return candidate
+
+    def bar_expiry(self, now: Optional[datetime] = None) -> datetime:
+        """日线行情的过期时间：下一次收盘后数据更新的时间点"""
+        now = (now or datetime.now(MARKET_TZ)).astimezone(MARKET_TZ)
+        today = now.date()
+        if self.is_trading_day(today) and now.time() < BAR_READY_TIME:
+            day = today
+        else:
+            day = self.next_trading_day(today)
+        return datetime.combine(day, BAR_READY_TIME, MARKET_TZ)
+
+    def fundamental_expiry(self, now: Optional[datetime] = None, max_stale: Optional[timedelta] = None) -> datetime:
+        """
+        基本面数据的过期时间
+        披露窗口内：新报告随时发布，与日线同步在每个交易日收盘后过期
+        窗口外：有效至下一个披露窗口开始；max_stale 限制最长有效期（估值指标随股价变化）
+        """
+        now = (now or datetime.now(MARKET_TZ)).astimezone(MARKET_TZ)
+        if in_disclosure_window(now.date()):
+            expiry = self.bar_expiry(now)
+        else:
+            expiry = datetime.combine(next_disclosure_start(now.date()), time(0), MARKET_TZ)
+        if max_stale is not None:
+            expiry = min(expiry, now + max_stale)
+        return expiry
+
+
+def in_disclosure_window(day: date) -> bool:
+    """是否处于定期报告披露窗口"""
+    return any((start <= (day.month, day.day) <= end) for start, end in DISCLOSURE_WINDOWS)
+
+
+def next_disclosure_start(day: date) -> date:
+    """day 之后最近一个披露窗口的开始日期"""
+    for year in (day.year, day.year + 1):
+        for (month, first_day), _ in DISCLOSURE_WINDOWS:
+            start = date(year, month, first_day)
+            if start > day:
+                return start
+    return date(day.year + 1, 1, 1)
+
+
+# 定期报告（报告期末 月, 日）及其披露截止日（月, 日, 是否次年）
+REPORT_DEADLINES = [((3, 31), (4, 30, False)), ((6, 30), (8, 31, False)), ((9, 30), (10, 31, False)), ((12, 31), (4, 30, True))]
+
+
+def latest_complete_report_period(day: date) -> date:
+    """披露截止日已过（全市场均已披露）的最近一个报告期末，全市场横向比较时各公司口径一致"""
+    latest = None
+    for year in (day.year - 2, day.year - 1, day.year):
+        for (month, month_day), (deadline_month, deadline_day, next_year) in REPORT_DEADLINES:
+            deadline = date(year + 1 if next_year else year, deadline_month, deadline_day)
+            if deadline < day:
+                latest = max(latest or date.min, date(year, month, month_day))
+    return latest
@@ -0,0 +1,106 @@
+"""
+自选股批量导入 / 导出
+
+导入：从 CSV 或 JSON 文本中解析股票代码，统一为 6 位代码并分出不合法、重复的条目；
+导出：把逐行产生的记录编码为 CSV / JSON 文本块，供流式响应逐块发送，不在内存中拼出整个文件
+"""
+import csv
+import io
+import json
+import re
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+
+IMPORT_FORMATS = ("csv", "json")
+# CSV 表头中识别为股票代码列的列名
+CODE_COLUMNS = ("stock_code", "code", "symbol", "代码", "股票代码", "证券代码")
+# 交易所前缀 / 后缀，如 sh600000、600000.SH、SZ000001
+EXCHANGE_AFFIX = re.compile(r'^(?:sh|sz|bj)\.?|\.(?:sh|sz|bj|ss)$', re.IGNORECASE)
+
+
+def normalize_code(raw: Any) -> str:
+    """
+    统一为 6 位代码：去掉空白和交易所前后缀，被表格软件去掉的前导 0 补回（如 1 -> 000001）
+    无法识别时原样返回（去掉空白），由调用方校验
+    """
+    code = EXCHANGE_AFFIX.sub('', str(raw).strip())
+    if code.isdigit() and len(code) < 6:
+        code = code.zfill(6)
+    return code
+
+
+def parse_codes(text: str, fmt: str) -> List[str]:
+    """
+    解析导入文本中的股票代码（保持原有顺序，未去重）
+    - csv：表头含 stock_code / code / 代码 等列时取该列，否则取第一列；空行跳过
+    - json：代码列表、对象列表（取 stock_code 或 code 字段）或 {"stock_codes": [...]}
+    """
+    if fmt not in IMPORT_FORMATS:
+        raise ValueError(f"导入格式只支持: {', '.join(IMPORT_FORMATS)}")
+    if fmt == "json":
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"JSON 解析失败: {e}")
+        if isinstance(data, dict):
+            data = data.get("stock_codes", data.get("stocks"))
+        if not isinstance(data, list):
+            raise ValueError("JSON 需要为代码列表或 {\"stock_codes\": [...]}")
+        codes = []
+        for item in data:
+            if isinstance(item, dict):
+                item = item.get("stock_code", item.get("code"))
+            if item is not None and str(item).strip():
+                codes.append(str(item).strip())
+        return codes
+
+    rows = [row for row in csv.reader(io.StringIO(text.lstrip('\ufeff'))) if row and any(cell.strip() for cell in row)]
+    if not rows:
+        return []
+    header = [cell.strip().lower() for cell in rows[0]]
+    column = next((header.index(name) for name in CODE_COLUMNS if name in header), None)
+    if column is None:
+        column = 0
+    else:
+        rows = rows[1:]
+    return [row[column].strip() for row in rows if len(row) > column and row[column].strip()]
+
+
+def split_codes(raw_codes: Iterable[str], check: Callable[[str], str]) -> Tuple[List[str], Dict[str, str], List[str]]:
+    """
+    规范化并校验代码，check(code) 不合法时抛出 ValueError
+    返回 (合法代码（去重，保持顺序）, 不合法条目 -> 原因, 重复的代码)
+    """
+    valid: Dict[str, None] = {}
+    invalid: Dict[str, str] = {}
+    duplicates: Dict[str, None] = {}
+    for raw in raw_codes:
+        code = normalize_code(raw)
+        if code in valid:
+            duplicates.setdefault(code)
+            continue
+        try:
+            valid.setdefault(check(code))
+        except ValueError as e:
+            invalid[str(raw)] = str(e)
+    return list(valid), invalid, list(duplicates)
+
+
+def csv_chunks(columns: List[str], rows: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    """逐行编码为 CSV，先输出表头（带 BOM，Excel 打开中文不乱码）"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield '\ufeff' + buffer.getvalue()
+    for row in rows:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(['' if row.get(column) is None else row.get(column) for column in columns])
+        yield buffer.getvalue()
+
+
+def json_chunks(rows: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    """逐条编码为 JSON 数组"""
+    yield '['
+    for index, row in enumerate(rows):
+        yield (',\n' if index else '\n') + json.dumps(row, ensure_ascii=False, default=str)
+    yield '\n]\n'